@@ -0,0 +1,134 @@
+from datetime import timedelta
+from django.db.models import Count
+from .models import DailyAbsence, LeaveRequest
+from .versions import APPROVED_LEAVES_VERSION, bump_versions
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def _days(start_date, end_date):
+    day = start_date
+    while day <= end_date:
+        yield day
+        day += timedelta(days=1)
+
+
+def record_absence(leave):
+    """
+    Write the DailyAbsence rows of an approved leave, replacing any it already had.
+
+    Call inside the transaction that approves the leave.
+    """
+    DailyAbsence.objects.filter(leave=leave).delete()
+    department = leave.user.department
+    DailyAbsence.objects.bulk_create([
+        DailyAbsence(date=day, user_id=leave.user_id, leave=leave, department=department)
+        for day in _days(leave.start_date, leave.end_date)
+    ])
+
+
+def record_absences(leaves):
+    """Write the DailyAbsence rows of many newly approved leaves (with ``user`` loaded) in one insert."""
+    DailyAbsence.objects.filter(leave__in=leaves).delete()
+    DailyAbsence.objects.bulk_create([
+        DailyAbsence(date=day, user_id=leave.user_id, leave=leave, department=leave.user.department)
+        for leave in leaves for day in _days(leave.start_date, leave.end_date)
+    ])
+
+
+def clear_absence(leave):
+    """Remove the DailyAbsence rows of a leave that is no longer approved."""
+    DailyAbsence.objects.filter(leave=leave).delete()
+
+
+def _absentee_rows(start_date, end_date):
+    return DailyAbsence.objects.filter(date__range=(start_date, end_date)) \
+        .order_by('date', 'user__username').values_list('date', 'user__username')
+
+
+def _by_day(rows):
+    calendar_map = {}
+    for day, username in rows:
+        calendar_map.setdefault(day, []).append(username)
+    return calendar_map
+
+
+def absentees(start_date, end_date):
+    """
+    Map each day in the range to the usernames absent on it.
+
+    Returns:
+        dict: date -> list of usernames, only for days with someone absent.
+    """
+    return _by_day(_absentee_rows(start_date, end_date))
+
+
+async def aabsentees(start_date, end_date):
+    """Async version of ``absentees``."""
+    return _by_day([row async for row in _absentee_rows(start_date, end_date)])
+
+
+def department_headcount(start_date, end_date):
+    """
+    Absent employees per department and day.
+
+    Returns:
+        QuerySet: Dicts with ``date``, ``department`` and ``absent``.
+    """
+    return DailyAbsence.objects.filter(date__range=(start_date, end_date)) \
+        .values('date', 'department').annotate(absent=Count('user', distinct=True)).order_by('date', 'department')
+
+
+def rebuild_daily_absence(fix=True, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Compare DailyAbsence with the approved leave requests and optionally repair it.
+
+    Approved leaves are walked in id order, ``chunk_size`` at a time; each
+    chunk's expected rows are compared with the stored rows of the same leaves.
+    Rows of leaves that are no longer approved are counted as extra.
+
+    Args:
+        fix (bool): Insert missing rows and delete extra ones; otherwise only count them.
+        chunk_size (int): Approved leaves compared per batch.
+
+    Returns:
+        tuple: ``(missing, extra)`` row counts found before any repair.
+    """
+    missing = extra = 0
+    orphans = DailyAbsence.objects.exclude(leave__status='Approved')
+    extra += orphans.count()
+    if fix and extra:
+        orphans.delete()
+
+    last_id = 0
+    while True:
+        leaves = list(
+            LeaveRequest.objects.filter(status='Approved', pk__gt=last_id).order_by('pk')
+            .values_list('pk', 'user_id', 'user__department', 'start_date', 'end_date')[:chunk_size]
+        )
+        if not leaves:
+            break
+        last_id = leaves[-1][0]
+        expected = {
+            (leave_id, day, user_id, department)
+            for leave_id, user_id, department, start_date, end_date in leaves
+            for day in _days(start_date, end_date)
+        }
+        stored = set(DailyAbsence.objects.filter(leave__in=[leave[0] for leave in leaves])
+                     .values_list('leave_id', 'date', 'user_id', 'department'))
+        absent, surplus = expected - stored, stored - expected
+        missing += len(absent)
+        extra += len(surplus)
+        if fix and surplus:
+            # Rewrite every row of a leave with a wrong row, e.g. after a department change.
+            stale = {leave_id for leave_id, *_ in surplus}
+            DailyAbsence.objects.filter(leave_id__in=stale).delete()
+            absent |= {row for row in expected if row[0] in stale}
+        if fix and absent:
+            DailyAbsence.objects.bulk_create([
+                DailyAbsence(leave_id=leave_id, date=day, user_id=user_id, department=department)
+                for leave_id, day, user_id, department in absent
+            ], batch_size=5000)
+    if fix and (missing or extra):
+        bump_versions([APPROVED_LEAVES_VERSION])
+    return missing, extra
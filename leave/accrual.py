@@ -0,0 +1,386 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import ExtractMonth, ExtractYear, Greatest, Least
+from django.utils import timezone
+from .ledger import ledger_total, record_changes
+from .models import AccrualRun, BalanceEntry, LeaveBalance, LeaveType, User
+from .versions import bump_user_versions
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def month_index(day):
+    """Months since year 0 for ``day``, so month differences are a subtraction."""
+    return day.year * 12 + day.month - 1
+
+
+def accrued_balance(balance, leave_type, last_accrued, today):
+    """
+    Apply a leave type's accrual rule to a materialized balance.
+
+    Monthly types gain ``accrual_amount`` for every first-of-month passed since
+    ``last_accrued``; yearly types are reset to ``annual_quota`` once a new year
+    has started. Nothing is lost if accrual is applied late, because the
+    credits owed are derived from the dates rather than from a run having happened.
+
+    Args:
+        balance (int): Balance materialized as of ``last_accrued``.
+        leave_type (LeaveType): Leave type holding the accrual rule.
+        last_accrued (date): Date through which ``balance`` is accrued.
+        today (date): Date to accrue up to.
+
+    Returns:
+        int | None: The accrued balance, or None if no accrual is due.
+    """
+    if leave_type.accrual_frequency == 'Monthly':
+        months = month_index(today) - month_index(last_accrued)
+        if months > 0:
+            return balance + months * leave_type.accrual_amount
+    elif leave_type.accrual_frequency == 'Yearly':
+        if today.year > last_accrued.year:
+            return leave_type.annual_quota
+    return None
+
+
+def accrue_balances(balances, today=None):
+    """
+    Bring LeaveBalance objects up to date in place, writing back only the ones that changed.
+
+    The write is a delta ``UPDATE`` guarded on ``last_accrued``, so two readers
+    accruing the same row at once cannot both apply the credit; the credit is
+    recorded as a 'Credit' ledger entry in the same transaction.
+
+    Args:
+        balances (Iterable[LeaveBalance]): Balances with ``leave_type`` loaded.
+        today (date, optional): Date to accrue up to. Defaults to today.
+
+    Returns:
+        list[LeaveBalance]: The same balances, accrued.
+    """
+    balances = list(balances)
+    if not getattr(settings, 'LEAVE_ACCRUAL_ON_READ', True):
+        return balances
+    if today is None:
+        today = date.today()
+
+    for balance in balances:
+        accrued = accrued_balance(balance.balance, balance.leave_type, balance.last_accrued, today)
+        if accrued is None:
+            continue
+        with transaction.atomic():
+            updated = LeaveBalance.objects.filter(pk=balance.pk, last_accrued=balance.last_accrued).update(
+                balance=F('balance') + (accrued - balance.balance), last_accrued=today
+            )
+            if updated:
+                BalanceEntry.objects.create(user_id=balance.user_id, leave_type_id=balance.leave_type_id,
+                                            kind='Credit', amount=accrued - balance.balance)
+                bump_user_versions([balance.user_id])
+        if updated:
+            balance.balance, balance.last_accrued = accrued, today
+        else:
+            balance.refresh_from_db(fields=['balance', 'last_accrued'])
+    return balances
+
+
+def get_balances(user, today=None):
+    """Return the user's accrued leave balances, read with a single query."""
+    return accrue_balances(LeaveBalance.objects.filter(user=user).select_related('leave_type'), today)
+
+
+async def aget_balances(user, today=None):
+    """Async version of ``get_balances``; the rare accrual write-back runs in a worker thread."""
+    balances = [balance async for balance in LeaveBalance.objects.filter(user=user).select_related('leave_type')]
+    return await sync_to_async(accrue_balances)(balances, today)
+
+
+def get_balance(user, leave_type, today=None):
+    """Return the user's accrued balance for one leave type, or None if there is none."""
+    balances = accrue_balances(
+        LeaveBalance.objects.filter(user=user, leave_type=leave_type).select_related('leave_type')[:1], today
+    )
+    return balances[0] if balances else None
+
+
+@dataclass
+class AccrualResult:
+    """
+    Outcome of one accrual run.
+
+    Attributes:
+        kind (str): Run kind ('Monthly', 'Yearly' or 'Rollover').
+        period (date): Period the run credits.
+        skipped (bool): True when the run had already completed for this period.
+        employees (int): Employees processed (or that would be, in a dry run).
+        created (int): LeaveBalance rows inserted (or missing, in a dry run).
+        updated (int): LeaveBalance rows credited (or to be credited, in a dry run).
+    """
+    kind: str
+    period: object
+    skipped: bool = False
+    employees: int = 0
+    created: int = 0
+    updated: int = 0
+
+
+def _run_in_chunks(run, chunk_size, process):
+    """
+    Call ``process(ids)`` for each chunk of employees after the run's checkpoint, one transaction per chunk.
+
+    Each chunk starts by locking the AccrualRun row and re-reading its
+    checkpoint, so two invocations of the same run take turns instead of
+    processing the same employees twice. ``process`` returns the number of
+    balances it changed; the checkpoint then advances past the chunk in the
+    same transaction, and the run is marked complete once no employee is left.
+
+    Returns:
+        tuple: ``(employees, updated)`` processed by this invocation.
+    """
+    employees = User.objects.filter(is_employee=True).order_by('pk').values_list('pk', flat=True)
+    processed = updated = 0
+    while True:
+        with transaction.atomic():
+            run = AccrualRun.objects.select_for_update().get(pk=run.pk)
+            if run.completed_at:
+                return processed, updated
+            ids = list(employees.filter(pk__gt=run.last_user_id)[:chunk_size])
+            if not ids:
+                run.completed_at = timezone.now()
+                run.save(update_fields=['completed_at'])
+                return processed, updated
+            changed = process(ids)
+            run.last_user_id = ids[-1]
+            run.rows_credited += changed
+            run.save(update_fields=['last_user_id', 'rows_credited'])
+        processed += len(ids)
+        updated += changed
+
+
+def _preview(kind, period, leave_types, due):
+    """Count what a run would do, without writing anything."""
+    result = AccrualResult(kind, period)
+    if AccrualRun.objects.filter(kind=kind, period=period, completed_at__isnull=False).exists():
+        result.skipped = True
+        return result
+    employees = User.objects.filter(is_employee=True)
+    result.employees = employees.count()
+    for leave_type in leave_types:
+        balances = LeaveBalance.objects.filter(leave_type=leave_type, user__in=employees)
+        missing = result.employees - balances.values('user').distinct().count()
+        result.created += missing
+        result.updated += missing + balances.filter(due).count()
+    return result
+
+
+def run_accrual(kind, period, leave_types, credit, due, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False):
+    """
+    Materialize accrual for every employee with set-based statements.
+
+    Employees are walked in id order, ``chunk_size`` at a time. For each chunk,
+    inside one transaction, missing LeaveBalance rows are bulk-inserted, each
+    leave type gets a single ``UPDATE`` over the rows that are due, and the
+    run's checkpoint is advanced. The due rows are locked and read before and
+    after the update, and the differences are bulk-inserted as 'Credit' ledger
+    entries.
+
+    Args:
+        kind (str): Run kind, used with ``period`` as the ledger key.
+        period (date): Period being credited.
+        leave_types (Iterable[LeaveType]): Leave types to credit.
+        credit (Callable[[LeaveType], dict]): Returns the ``update()`` kwargs for a leave type.
+        due (Q): Filter selecting the balances that still need crediting.
+        chunk_size (int): Employees per transaction.
+        dry_run (bool): Report counts only.
+
+    Returns:
+        AccrualResult: What was (or would be) done.
+    """
+    if dry_run:
+        return _preview(kind, period, list(leave_types), due)
+
+    result = AccrualResult(kind, period)
+    run, _ = AccrualRun.objects.get_or_create(kind=kind, period=period)
+    if run.completed_at:
+        result.skipped = True
+        return result
+
+    leave_types = list(leave_types)
+
+    def process(ids):
+        updated = 0
+        for leave_type in leave_types:
+            existing = set(
+                LeaveBalance.objects.filter(leave_type=leave_type, user_id__in=ids).values_list('user_id', flat=True)
+            )
+            # New rows start just before the period so the update below credits them too.
+            missing = [
+                LeaveBalance(user_id=user_id, leave_type=leave_type, last_accrued=period - timedelta(days=1))
+                for user_id in ids if user_id not in existing
+            ]
+            LeaveBalance.objects.bulk_create(missing)
+            result.created += len(missing)
+            before = {
+                pk: (user_id, leave_type.pk, balance)
+                for pk, user_id, balance in LeaveBalance.objects.select_for_update()
+                .filter(due, leave_type=leave_type, user_id__in=ids).values_list('pk', 'user_id', 'balance')
+            }
+            updated += LeaveBalance.objects.filter(pk__in=before).update(**credit(leave_type))
+            record_changes(before, dict(LeaveBalance.objects.filter(pk__in=before).values_list('pk', 'balance')),
+                           'Credit')
+        return updated
+
+    result.employees, result.updated = _run_in_chunks(run, chunk_size, process)
+    return result
+
+
+def credit_monthly(today, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False):
+    """Credit every monthly leave type for each first-of-month since the balance was last accrued."""
+    months_owed = Value(month_index(today)) - (ExtractYear('last_accrued') * 12 + ExtractMonth('last_accrued') - 1)
+    return run_accrual(
+        'Monthly', today.replace(day=1),
+        LeaveType.objects.filter(accrual_frequency='Monthly'),
+        lambda leave_type: {
+            'balance': F('balance') + months_owed * leave_type.accrual_amount,
+            'last_accrued': today,
+        },
+        Q(last_accrued__lt=today.replace(day=1)),
+        chunk_size=chunk_size, dry_run=dry_run,
+    )
+
+
+def credit_yearly(today, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False):
+    """Reset every yearly leave type to its annual quota once a new year has started."""
+    return run_accrual(
+        'Yearly', today.replace(month=1, day=1),
+        LeaveType.objects.filter(accrual_frequency='Yearly'),
+        lambda leave_type: {'balance': leave_type.annual_quota, 'last_accrued': today},
+        Q(last_accrued__lt=today.replace(month=1, day=1)),
+        chunk_size=chunk_size, dry_run=dry_run,
+    )
+
+
+def _owed_through(leave_type, day):
+    """
+    Expression for the accrual a LeaveBalance row is owed up to ``day``, as ``accrued_balance`` computes it.
+
+    Lazily accrued balances may not have been credited for the last months (or
+    the yearly reset) of the year being closed; the rollover counts and writes
+    those credits before deciding what carries forward.
+    """
+    if leave_type.accrual_frequency == 'Monthly':
+        months = Value(month_index(day)) - (ExtractYear('last_accrued') * 12 + ExtractMonth('last_accrued') - 1)
+        return Greatest(months, Value(0)) * leave_type.accrual_amount
+    return Case(When(last_accrued__lt=day.replace(month=1, day=1), then=Value(leave_type.annual_quota) - F('balance')),
+                default=Value(0))
+
+
+def _rollover_rule(leave_type, ledger, period):
+    """
+    Build the update and the due filter that roll one leave type into the next leave year.
+
+    The closing balance is ``ledger``, the balance's ledger total at the end of
+    the year, plus the accrual still owed up to ``period``. Days above the
+    carry-forward cap (all of them when carrying forward is not allowed)
+    lapse. Yearly types start the new year at ``annual_quota`` plus the days
+    carried; when their reset has not been applied yet it is applied here, so
+    postings made since the new year started are kept.
+
+    Returns:
+        tuple | None: ``(changes, due, closing)``, or None when nothing can lapse or be carried.
+    """
+    if not leave_type.carry_forward_allowed:
+        cap = 0
+    else:
+        cap = leave_type.max_carry_forward
+    owed = _owed_through(leave_type, period)
+    closing = ledger + owed
+    if leave_type.accrual_frequency != 'Yearly':
+        if cap is None:
+            return None
+        changes = {
+            'balance': F('balance') + owed - Greatest(closing - Value(cap), Value(0)),
+            'last_accrued': Case(When(last_accrued__lt=period.replace(day=1), then=Value(period)),
+                                 default=F('last_accrued')),
+        }
+        return changes, Q(closing__gt=cap), closing
+
+    new_year = period + timedelta(days=1)
+    carried = Greatest(closing if cap is None else Least(closing, Value(cap)), Value(0))
+    not_reset = Q(last_accrued__lt=new_year)
+    changes = {
+        'balance': Case(When(not_reset, then=Value(leave_type.annual_quota) + carried + F('balance') + owed - closing),
+                        default=F('balance') + carried),
+        'last_accrued': Case(When(not_reset, then=Value(new_year)), default=F('last_accrued')),
+    }
+    return changes, not_reset if cap == 0 else not_reset | Q(closing__gt=0), closing
+
+
+def year_end_rollover(year, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Carry each employee's unused leave into the next year and lapse the rest, with set-based statements.
+
+    Leave types with an accrual rule are rolled over; types without one have no
+    leave year and are left alone. Each balance's closing figure is its ledger
+    total at midnight on January 1, so credits, approvals and resets written
+    since then are not counted, plus the accrual it is still owed up to
+    December 31. Employees are walked in id order, ``chunk_size`` at a time:
+    inside one transaction per chunk, each leave type gets one locking read
+    and one ``UPDATE`` of the balances that change, the owed accrual and the
+    rest of each difference are bulk-inserted as 'Credit' and 'Rollover'
+    ledger entries, and the 'Rollover' AccrualRun checkpoint is advanced. A completed year is not
+    rolled over again, and an interrupted run resumes after the last
+    committed chunk.
+
+    Args:
+        year (int): Leave year being closed.
+        chunk_size (int): Employees per transaction.
+
+    Returns:
+        AccrualResult: ``updated`` counts the balances changed.
+
+    Raises:
+        ValueError: The year has not ended yet.
+    """
+    new_year = date(year + 1, 1, 1)
+    if date.today() < new_year:
+        raise ValueError(f'The {year} leave year has not ended yet')
+
+    period = date(year, 12, 31)
+    result = AccrualResult('Rollover', period)
+    run, _ = AccrualRun.objects.get_or_create(kind='Rollover', period=period)
+    if run.completed_at:
+        result.skipped = True
+        return result
+
+    ledger = ledger_total(before=timezone.make_aware(datetime(year + 1, 1, 1)))
+    rules = [
+        (leave_type, rule) for leave_type in LeaveType.objects.exclude(accrual_frequency='None').order_by('pk')
+        if (rule := _rollover_rule(leave_type, ledger, period)) is not None
+    ]
+
+    def process(ids):
+        updated = 0
+        for leave_type, (changes, due, closing) in rules:
+            rows = LeaveBalance.objects.select_for_update() \
+                .filter(leave_type=leave_type, user_id__in=ids).annotate(closing=closing).filter(due) \
+                .values_list('pk', 'user_id', 'balance', 'last_accrued')
+            before, accrued = {}, {}
+            for pk, user_id, balance, last_accrued in rows:
+                before[pk] = (user_id, leave_type.pk, balance)
+                owed = accrued_balance(balance, leave_type, last_accrued, period)
+                accrued[pk] = balance if owed is None else owed
+            if not before:
+                continue
+            LeaveBalance.objects.filter(pk__in=before).update(**changes)
+            after = dict(LeaveBalance.objects.filter(pk__in=before).values_list('pk', 'balance'))
+            updated += sum(1 for pk, (_, _, balance) in before.items() if after[pk] != balance)
+            record_changes(before, accrued, 'Credit')
+            record_changes({pk: (user_id, leave_type_id, accrued[pk])
+                            for pk, (user_id, leave_type_id, _) in before.items()}, after, 'Rollover')
+        return updated
+
+    result.employees, result.updated = _run_in_chunks(run, chunk_size, process)
+    return result
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, LeaveType, LeaveBalance, LeaveRequest, Holiday, Delegation
+from .models import (User, LeaveType, LeaveBalance, LeaveRequest, Holiday, Delegation, AccrualRun, BalanceEntry,
+                     CapacityRule)
 
 class CustomUserAdmin(UserAdmin):
     """
@@ -13,6 +14,7 @@ class CustomUserAdmin(UserAdmin):
         (None, {'fields': ('username', 'email', 'password')}),
         ('Permissions', {'fields': ('is_employee', 'is_manager', 'is_staff', 'is_superuser', 'groups', 'user_permissions')}),
         ('Personal info', {'fields': ('first_name', 'last_name', 'department')}),
+        ('Notifications', {'fields': ('notification_frequency',)}),
     )
     add_fieldsets = (
         (None, {
@@ -25,12 +27,13 @@ class CustomUserAdmin(UserAdmin):
 
 @admin.register(LeaveType)
 class LeaveTypeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'annual_quota', 'carry_forward_allowed')
+    list_display = ('name', 'annual_quota', 'carry_forward_allowed', 'max_carry_forward', 'accrual_frequency',
+                    'accrual_amount')
     search_fields = ('name',)
 
 @admin.register(LeaveBalance)
 class LeaveBalanceAdmin(admin.ModelAdmin):
-    list_display = ('user', 'leave_type', 'balance')
+    list_display = ('user', 'leave_type', 'balance', 'last_accrued')
     search_fields = ('user__username', 'leave_type__name')
 
 @admin.register(LeaveRequest)
@@ -49,5 +52,31 @@ class DelegationAdmin(admin.ModelAdmin):
     list_display = ('manager', 'delegate', 'start_date', 'end_date')
     search_fields = ('manager__username', 'delegate__username')
 
+@admin.register(CapacityRule)
+class CapacityRuleAdmin(admin.ModelAdmin):
+    list_display = ('department', 'max_absent', 'blocking')
+    search_fields = ('department',)
+
+@admin.register(AccrualRun)
+class AccrualRunAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'period', 'rows_credited', 'started_at', 'completed_at')
+    list_filter = ('kind',)
+
+@admin.register(BalanceEntry)
+class BalanceEntryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'leave_type', 'kind', 'amount', 'leave', 'created_at')
+    list_filter = ('kind', 'leave_type')
+    search_fields = ('user__username',)
+
+    # Entries are written together with the LeaveBalance they move; balances are corrected by editing LeaveBalance.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 # Register User with custom admin
 admin.site.register(User, CustomUserAdmin)
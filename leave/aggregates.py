@@ -0,0 +1,120 @@
+from collections import defaultdict
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from .models import LeaveAggregate, LeaveRequest
+from .versions import APPROVED_LEAVES_VERSION, bump_versions
+from .workcalendar import get_working_day_calendar
+
+
+def _adjust(department, leave_type_id, year, month, leaves, working_days):
+    """Add to one aggregate row, creating it if it does not exist yet."""
+    key = {'department': department or '', 'leave_type_id': leave_type_id, 'year': year, 'month': month}
+    changes = {'leaves': F('leaves') + leaves, 'working_days': F('working_days') + working_days}
+    if LeaveAggregate.objects.filter(**key).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            LeaveAggregate.objects.create(leaves=leaves, working_days=working_days, **key)
+    except IntegrityError:
+        # Another transaction created the row first.
+        LeaveAggregate.objects.filter(**key).update(**changes)
+
+
+def add_to_aggregates(leave, working_days, sign=1):
+    """
+    Count an approved leave in (``sign=1``) or out of (``sign=-1``) the aggregates.
+
+    Call inside the transaction that changes the leave's status.
+
+    Args:
+        leave (LeaveRequest): The leave; its user's current department is used.
+        working_days (int): Working days charged for the leave.
+        sign (int): 1 when the leave becomes approved, -1 when it stops being approved.
+    """
+    _adjust(leave.user.department, leave.leave_type_id, leave.start_date.year, leave.start_date.month,
+            sign, sign * working_days)
+
+
+def add_leaves_to_aggregates(leaves, sign=1):
+    """
+    Count many leaves in or out of the aggregates, with one write per aggregate row touched.
+
+    Args:
+        leaves (Iterable[tuple]): ``(leave, working_days)`` pairs; ``leave.user`` must be loaded.
+        sign (int): 1 when the leaves become approved, -1 when they stop being approved.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for leave, working_days in leaves:
+        key = (leave.user.department, leave.leave_type_id, leave.start_date.year, leave.start_date.month)
+        totals[key][0] += sign
+        totals[key][1] += sign * working_days
+    for (department, leave_type_id, year, month), (count, working_days) in totals.items():
+        _adjust(department, leave_type_id, year, month, count, working_days)
+
+
+def move_user_aggregates(user, old_department):
+    """Move the user's approved leaves from ``old_department`` to their current department."""
+    totals = _expected(LeaveRequest.objects.filter(user=user, status='Approved'), department='')
+    for (_, leave_type_id, year, month), (leaves, working_days) in totals.items():
+        _adjust(old_department, leave_type_id, year, month, -leaves, -working_days)
+        _adjust(user.department, leave_type_id, year, month, leaves, working_days)
+
+
+def _expected(leaves, department=None):
+    """Aggregate totals for ``leaves``, keyed like LeaveAggregate rows."""
+    calendar = get_working_day_calendar()
+    totals = defaultdict(lambda: [0, 0])
+    rows = leaves.values_list('user__department', 'leave_type_id', 'start_date', 'end_date')
+    for user_department, leave_type_id, start_date, end_date in rows.iterator(chunk_size=2000):
+        key = (department if department is not None else user_department or '',
+               leave_type_id, start_date.year, start_date.month)
+        totals[key][0] += 1
+        totals[key][1] += calendar.count_working_days(start_date, end_date)
+    return {key: tuple(value) for key, value in totals.items()}
+
+
+def rebuild_leave_aggregates(fix=True):
+    """
+    Recompute the aggregates from the approved leave requests and compare them with the table.
+
+    Approved leaves are streamed once and summed in memory per (department,
+    leave type, month), so memory depends on the number of rows in the summary
+    table rather than the number of leaves.
+
+    Args:
+        fix (bool): Replace the table contents with the recomputed totals; otherwise only compare.
+
+    Returns:
+        int: Number of aggregate rows that were missing, wrong or extra.
+    """
+    expected = _expected(LeaveRequest.objects.filter(status='Approved'))
+    stored = {
+        (department, leave_type_id, year, month): (leaves, working_days)
+        for department, leave_type_id, year, month, leaves, working_days in LeaveAggregate.objects.exclude(
+            leaves=0, working_days=0,
+        ).values_list('department', 'leave_type_id', 'year', 'month', 'leaves', 'working_days')
+    }
+    drift = sum(1 for key in expected.keys() | stored.keys() if expected.get(key) != stored.get(key))
+    if fix and drift:
+        with transaction.atomic():
+            LeaveAggregate.objects.all().delete()
+            LeaveAggregate.objects.bulk_create([
+                LeaveAggregate(department=department, leave_type_id=leave_type_id, year=year, month=month,
+                               leaves=leaves, working_days=working_days)
+                for (department, leave_type_id, year, month), (leaves, working_days) in expected.items()
+            ], batch_size=5000)
+            bump_versions([APPROVED_LEAVES_VERSION])
+    return drift
+
+
+def department_totals():
+    """
+    Approved leave totals per department and leave type, read from LeaveAggregate.
+
+    Returns:
+        QuerySet: Dicts with ``department``, ``leave_type__name``, ``total`` and ``working_days``.
+    """
+    return LeaveAggregate.objects.values('department', 'leave_type__name') \
+        .annotate(total=Sum('leaves'), working_days=Sum('working_days')) \
+        .filter(total__gt=0) \
+        .order_by('department', 'leave_type__name')
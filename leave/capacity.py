@@ -0,0 +1,142 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import CapacityRule, DailyAbsence, DepartmentOccupancy, Holiday, LeaveRequest
+from .workcalendar import WEEKEND_DAYS, get_working_day_calendar
+
+
+def _count_days(deltas, ranges, change):
+    """Add ``change`` to ``deltas[(department, day)]`` for every day of each ``(department, start, end)`` range."""
+    for department, start, end in ranges:
+        for offset in range((end - start).days + 1):
+            deltas[(department or '', start + timedelta(days=offset))] += change
+    return deltas
+
+
+def _apply(deltas):
+    """
+    Add each ``{(department, day): change}`` to the occupancy counters.
+
+    Missing days are inserted first with one ``INSERT ... ON CONFLICT DO
+    NOTHING``; then every department and change gets one ``UPDATE ... SET
+    absent = absent + change`` over its days. Nothing reads the counts, so
+    concurrent approvals in the same department cannot overwrite each other.
+    """
+    DepartmentOccupancy.objects.bulk_create([
+        DepartmentOccupancy(department=department, date=day)
+        for (department, day), change in deltas.items() if change > 0
+    ], ignore_conflicts=True)
+    days = defaultdict(list)
+    for (department, day), change in deltas.items():
+        if change:
+            days[(department, change)].append(day)
+    for (department, change), dates in days.items():
+        DepartmentOccupancy.objects.filter(department=department, date__in=dates).update(absent=F('absent') + change)
+
+
+def add_to_occupancy(leave, sign=1):
+    """
+    Count an approved leave in (``sign=1``) or out of (``sign=-1``) its department's daily occupancy.
+
+    Call inside the transaction that changes the leave's status.
+
+    Args:
+        leave (LeaveRequest): The leave; its user's current department is used.
+        sign (int): 1 when the leave becomes approved, -1 when it stops being approved.
+    """
+    add_leaves_to_occupancy([leave], sign)
+
+
+def add_leaves_to_occupancy(leaves, sign=1):
+    """
+    Count many leaves (with ``user`` loaded) in or out of the occupancy.
+
+    Costs one insert and one update per department and per-day count, however many leaves there are.
+    """
+    ranges = [(leave.user.department, leave.start_date, leave.end_date) for leave in leaves]
+    _apply(_count_days(defaultdict(int), ranges, sign))
+
+
+def move_user_occupancy(user, old_department):
+    """Move the days of the user's approved leaves from ``old_department`` to their current department."""
+    ranges = list(LeaveRequest.objects.filter(user=user, status='Approved').values_list('start_date', 'end_date'))
+    deltas = _count_days(defaultdict(int), [(old_department, start, end) for start, end in ranges], -1)
+    _apply(_count_days(deltas, [(user.department, start, end) for start, end in ranges], 1))
+
+
+def _at_capacity(occupancy):
+    """Narrow occupancy rows to working days on which the department's CapacityRule is already reached."""
+    rules = CapacityRule.objects.filter(department=OuterRef('department'))
+    # Django numbers weekdays from Sunday (1) to Saturday (7).
+    weekend = [(day + 1) % 7 + 1 for day in WEEKEND_DAYS]
+    return occupancy.annotate(
+        max_absent=Subquery(rules.values('max_absent')),
+        blocking=Subquery(rules.values('blocking')),
+    ).filter(absent__gte=F('max_absent')).exclude(date__week_day__in=weekend)
+
+
+def over_capacity(department, start_date, end_date):
+    """
+    Find the working days on which another absence would exceed the department's capacity, with one range query.
+
+    Args:
+        department (str): Department of the employee applying.
+        start_date (date): First day of the leave.
+        end_date (date): Last day of the leave.
+
+    Returns:
+        list[tuple]: ``(date, absent, max_absent, blocking)`` per full working day, in date order.
+    """
+    rows = _at_capacity(DepartmentOccupancy.objects.filter(department=department or '',
+                                                           date__range=(start_date, end_date)))
+    holidays = {day for day, _ in get_working_day_calendar().holidays(start_date, end_date)}
+    return [
+        row for row in rows.order_by('date').values_list('date', 'absent', 'max_absent', 'blocking')
+        if row[0] not in holidays
+    ]
+
+
+def days_over_capacity():
+    """
+    Expression counting the working days of a LeaveRequest on which its employee's department is at capacity.
+
+    Used to annotate the approval queue, so the indicator costs no extra query.
+    """
+    full_days = _at_capacity(DepartmentOccupancy.objects.filter(
+        department=OuterRef('user__department'), date__gte=OuterRef('start_date'), date__lte=OuterRef('end_date'),
+    )).exclude(date__in=Holiday.objects.values('date')).order_by().values('department') \
+        .annotate(days=Count('pk')).values('days')
+    return Coalesce(Subquery(full_days, output_field=IntegerField()), Value(0))
+
+
+def rebuild_department_occupancy(fix=True):
+    """
+    Recount the occupancy from DailyAbsence and compare it with the table.
+
+    Args:
+        fix (bool): Replace the table contents with the recounted rows; otherwise only compare.
+
+    Returns:
+        int: Number of occupancy rows that were missing, wrong or extra.
+    """
+    expected = {}
+    counts = DailyAbsence.objects.values_list('department', 'date').annotate(absent=Count('pk')).order_by()
+    for department, day, absent in counts.iterator(chunk_size=2000):
+        key = (department or '', day)
+        expected[key] = expected.get(key, 0) + absent
+    stored = {
+        (department, day): absent
+        for department, day, absent in DepartmentOccupancy.objects.exclude(absent=0)
+        .values_list('department', 'date', 'absent').iterator(chunk_size=2000)
+    }
+    drift = sum(1 for key in expected.keys() | stored.keys() if expected.get(key) != stored.get(key))
+    if fix and drift:
+        with transaction.atomic():
+            DepartmentOccupancy.objects.all().delete()
+            DepartmentOccupancy.objects.bulk_create([
+                DepartmentOccupancy(department=department, date=day, absent=absent)
+                for (department, day), absent in expected.items()
+            ], batch_size=5000)
+    return drift
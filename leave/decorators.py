@@ -1,18 +1,69 @@
+import hashlib
+from datetime import date, datetime
 from django.shortcuts import redirect
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from functools import wraps
+from inspect import iscoroutinefunction
+from .versions import get_versions, stamp_time
+
+
+def _role_required(view_func, has_role):
+    # Async views get an async wrapper, so they stay async under ASGI. The
+    # resolved user is stored on the request, so templates rendered later do
+    # not resolve it again.
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            request.user = user = await request.auser()
+            if user.is_authenticated and has_role(user):
+                return await view_func(request, *args, **kwargs)
+            return redirect('login')
+        return async_wrapper
 
-def employee_required(view_func):
     @wraps(view_func)
     def wrapper(request, *args, **kwargs):
-        if request.user.is_authenticated and request.user.is_employee:
+        if request.user.is_authenticated and has_role(request.user):
             return view_func(request, *args, **kwargs)
         return redirect('login')
     return wrapper
 
+def employee_required(view_func):
+    return _role_required(view_func, lambda user: user.is_employee)
+
 def manager_required(view_func):
-    @wraps(view_func)
-    def wrapper(request, *args, **kwargs):
-        if request.user.is_authenticated and request.user.is_manager:
-            return view_func(request, *args, **kwargs)
-        return redirect('login')
-    return wrapper
+    return _role_required(view_func, lambda user: user.is_manager)
+
+
+def versioned(*keys):
+    """
+    Answer conditional GETs for a page that only changes with the date and the given version stamps.
+
+    The ETag is a hash of today's date and the stamps; Last-Modified is the
+    newest stamp, or midnight if that is later. A client holding the current
+    page gets a 304 before the view runs, so none of its queries are issued.
+    Responses are private and revalidated on every visit.
+
+    Args:
+        *keys (str): Version keys the page depends on (see ``leave.versions``).
+    """
+    def stamps(request):
+        # Read once per request; the ETag and Last-Modified functions both need them.
+        if not hasattr(request, '_page_versions'):
+            request._page_versions = (date.today(), get_versions(*keys))
+        return request._page_versions
+
+    def etag(request, *args, **kwargs):
+        today, versions = stamps(request)
+        return hashlib.md5(':'.join([today.isoformat(), *versions]).encode(), usedforsecurity=False).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        today, versions = stamps(request)
+        midnight = timezone.make_aware(datetime.combine(today, datetime.min.time()))
+        return max([midnight, *(stamp_time(version) for version in versions)])
+
+    def decorator(view_func):
+        view_func = condition(etag_func=etag, last_modified_func=last_modified)(view_func)
+        return cache_control(private=True, no_cache=True)(view_func)
+    return decorator
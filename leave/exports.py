@@ -0,0 +1,169 @@
+import hashlib
+from datetime import timedelta
+from io import BytesIO
+from pathlib import Path
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from fpdf import FPDF
+from .accrual import get_balances
+from .models import ExportJob, LeaveRequest
+
+
+def export_root():
+    """Directory holding generated export artifacts."""
+    return Path(getattr(settings, 'LEAVE_EXPORT_ROOT', Path(settings.BASE_DIR) / 'exports'))
+
+
+def history_version(user):
+    """
+    Version stamp of everything that appears in the user's leave history PDF.
+
+    It is a digest of the user's LeaveRequest and (accrued) LeaveBalance rows,
+    so any change to either yields a new stamp and a new artifact. It is read
+    from the database rather than the cache, so every process agrees on it and
+    identical histories keep their artifact across restarts.
+    """
+    digest = hashlib.sha256()
+    leaves = LeaveRequest.objects.filter(user=user).order_by('pk').values_list(
+        'pk', 'leave_type_id', 'start_date', 'end_date', 'status', 'approver_id', 'reason', 'comments'
+    )
+    for row in leaves.iterator(chunk_size=500):
+        digest.update(repr(row).encode())
+    digest.update(b'|')
+    for balance in sorted(get_balances(user), key=lambda balance: balance.pk):
+        digest.update(repr((balance.pk, balance.leave_type_id, balance.balance)).encode())
+    return digest.hexdigest()
+
+
+def artifact_path(user, version):
+    return export_root() / f'leave_history_{user.pk}_{version}.pdf'
+
+
+def render_leave_history_pdf(user):
+    """Render the user's leave history and balances as PDF bytes."""
+    leaves = LeaveRequest.objects.filter(user=user).select_related('leave_type', 'approver').order_by('-start_date')
+    balances = get_balances(user)
+
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', 16)
+    pdf.cell(0, 10, f"{user.username} - Leave History", ln=True, align="C")
+    pdf.ln(10)
+
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(0, 10, "Leave Balances:", ln=True)
+    pdf.set_font("Arial", '', 12)
+    for bal in balances:
+        pdf.cell(0, 8, f"{bal.leave_type.name}: {bal.balance} days", ln=True)
+    pdf.ln(5)
+
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(0, 10, "Leave History:", ln=True)
+    pdf.set_font("Arial", '', 12)
+    for leave in leaves.iterator(chunk_size=500):
+        approver_name = leave.approver.username if leave.approver else '-'
+        pdf.cell(0, 8, f"{leave.start_date} to {leave.end_date} | {leave.leave_type.name} | {leave.status} | Approver: {approver_name}", ln=True)
+        pdf.multi_cell(0, 8, f"Reason: {leave.reason}")
+        pdf.ln(2)
+
+    buffer = BytesIO()
+    pdf.output(buffer)
+    return buffer.getvalue()
+
+
+def request_history_export(user):
+    """
+    Return an export job for the user's current leave history, queueing one if needed.
+
+    If an artifact for the current version is already on disk, a finished
+    job pointing at it is returned without rendering anything.
+
+    Returns:
+        ExportJob: A job in 'Done' state when cached, otherwise 'Queued' or 'Running'.
+    """
+    version = history_version(user)
+    job = ExportJob.objects.filter(user=user, version=version).exclude(status='Failed').order_by('-pk').first()
+    if job and (job.status != 'Done' or Path(job.file_path).exists()):
+        return job
+
+    path = artifact_path(user, version)
+    if path.exists():
+        return ExportJob.objects.create(user=user, version=version, status='Done', file_path=str(path),
+                                        finished_at=timezone.now())
+    return ExportJob.objects.create(user=user, version=version)
+
+
+def run_export_job(job):
+    """
+    Render one claimed job's artifact and mark the job done or failed.
+
+    The file is written under a temporary name and renamed into place, and the
+    user's artifacts for older versions are removed.
+    """
+    path = artifact_path(job.user, job.version)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix('.tmp')
+        temporary.write_bytes(render_leave_history_pdf(job.user))
+        temporary.replace(path)
+        for stale in path.parent.glob(f'leave_history_{job.user_id}_*.pdf'):
+            if stale != path:
+                stale.unlink(missing_ok=True)
+    except Exception as exc:
+        job.status, job.error = 'Failed', repr(exc)
+    else:
+        job.status, job.file_path = 'Done', str(path)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'file_path', 'error', 'finished_at'])
+    return job
+
+
+def requeue_stale_exports():
+    """
+    Queue again the jobs left 'Running' by a worker that died before finishing them.
+
+    Returns:
+        int: Number of jobs queued again.
+    """
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'LEAVE_EXPORT_CLAIM_TIMEOUT', 600))
+    return ExportJob.objects.filter(status='Running').filter(
+        Q(started_at__lt=cutoff) | Q(started_at__isnull=True)
+    ).update(status='Queued', started_at=None)
+
+
+def purge_finished_exports():
+    """
+    Delete finished jobs older than ``LEAVE_EXPORT_RETENTION_DAYS``.
+
+    Artifacts stay on disk until a newer version of the same history replaces
+    them, and a request for a cached artifact creates a new 'Done' job.
+
+    Returns:
+        int: Number of jobs deleted.
+    """
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'LEAVE_EXPORT_RETENTION_DAYS', 7))
+    deleted, _ = ExportJob.objects.filter(status__in=['Done', 'Failed'], finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def run_pending_exports(limit=None):
+    """
+    Claim and run queued export jobs, oldest first.
+
+    A job is claimed with a conditional ``UPDATE`` from 'Queued' to 'Running',
+    so several workers can drain the queue without rendering a job twice.
+    Jobs whose claim timed out are queued again first.
+
+    Returns:
+        int: Number of jobs processed.
+    """
+    requeue_stale_exports()
+    processed = 0
+    queued = ExportJob.objects.filter(status='Queued').order_by('created_at', 'pk').values_list('pk', flat=True)
+    for pk in list(queued[:limit] if limit else queued):
+        if not ExportJob.objects.filter(pk=pk, status='Queued').update(status='Running', started_at=timezone.now()):
+            continue
+        run_export_job(ExportJob.objects.select_related('user').get(pk=pk))
+        processed += 1
+    return processed
@@ -1,5 +1,5 @@
 from django import forms
-from .models import LeaveRequest
+from .models import LeaveRequest, User
 
 class LeaveRequestForm(forms.ModelForm):
     """
@@ -25,3 +25,41 @@ class LeaveRequestForm(forms.ModelForm):
             'reason': forms.Textarea(attrs={'rows':3,'class':'form-control'}),
             'leave_type': forms.Select(attrs={'class':'form-select'})
         }
+
+
+class ReportFilterForm(forms.Form):
+    """
+    Filters for the report exports.
+
+    Fields:
+        - start_date: Only leaves ending on or after this date.
+        - end_date: Only leaves starting on or before this date.
+        - department: Only leaves of employees in this department.
+        - format: 'csv' (default) or 'xlsx'.
+    """
+    start_date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    end_date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    department = forms.CharField(required=False, max_length=100, widget=forms.TextInput(attrs={'class': 'form-control'}))
+    format = forms.ChoiceField(required=False, choices=(('csv', 'CSV'), ('xlsx', 'Excel')))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date, end_date = cleaned_data.get('start_date'), cleaned_data.get('end_date')
+        if start_date and end_date and start_date > end_date:
+            raise forms.ValidationError('Start date must be on or before end date.')
+        return cleaned_data
+
+
+class NotificationPreferenceForm(forms.ModelForm):
+    """
+    Form for users to choose between immediate notification emails and a digest.
+
+    Fields:
+        - notification_frequency: Immediate, hourly digest or daily digest.
+    """
+    class Meta:
+        model = User
+        fields = ['notification_frequency']
+        widgets = {
+            'notification_frequency': forms.Select(attrs={'class': 'form-select form-select-sm'}),
+        }
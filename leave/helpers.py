@@ -1,15 +1,150 @@
+import threading
+from bisect import bisect_right
 from datetime import date, timedelta
-from django.db.models import Sum
-from .models import Holiday, User, Delegation
+from django.db.models import BooleanField, Case, Q, Value, When
+from .models import User, Delegation, LeaveRequest
+from .versions import DELEGATIONS_VERSION, get_versions
+from .workcalendar import get_working_day_calendar
 
 def get_working_days(start_date, end_date):
     """
     Calculate working days between start_date and end_date, excluding holidays and Sundays.
     """
-    all_days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
-    holidays = set(h.date for h in Holiday.objects.filter(date__range=[start_date, end_date]))
-    working_days = [day for day in all_days if day not in holidays and day.weekday() != 6]  # 6 = Sunday
-    return working_days
+    return get_working_day_calendar().working_days(start_date, end_date)
+
+def count_working_days(start_date, end_date):
+    """
+    Count working days between start_date and end_date without building the list of dates.
+    """
+    return get_working_day_calendar().count_working_days(start_date, end_date)
+
+
+class DelegationIndex:
+    """
+    In-process interval index answering "who approves for each manager on date D".
+
+    For every manager the delegations are flattened into sorted, non-overlapping
+    segments ``(start, end, delegate)`` so a lookup is a bisect per manager and
+    never touches the database. Where delegations overlap, the one with the
+    lowest id wins, matching the ``.first()`` lookup this index replaces.
+
+    Attributes:
+        managers (dict): Manager id -> User for every user with ``is_manager``.
+        segments (dict): Manager id -> sorted list of (start, end, delegate) tuples.
+    """
+
+    def __init__(self, managers, delegations):
+        self.managers = {manager.pk: manager for manager in managers}
+        by_manager = {}
+        for delegation in delegations:
+            if delegation.manager_id in self.managers:
+                by_manager.setdefault(delegation.manager_id, []).append(delegation)
+
+        self.segments = {}
+        self._starts = {}
+        for manager_id, items in by_manager.items():
+            segments = self._flatten(items)
+            self.segments[manager_id] = segments
+            self._starts[manager_id] = [segment[0] for segment in segments]
+
+    @staticmethod
+    def _flatten(delegations):
+        """Split possibly overlapping delegations into disjoint, merged segments."""
+        bounds = sorted({d.start_date for d in delegations} | {d.end_date + timedelta(days=1) for d in delegations})
+        segments = []
+        for lower, upper in zip(bounds, bounds[1:]):
+            covering = [d for d in delegations if d.start_date <= lower and d.end_date >= lower]
+            if not covering:
+                continue
+            winner = min(covering, key=lambda d: d.pk)
+            end = upper - timedelta(days=1)
+            if segments and segments[-1][2] == winner.delegate and segments[-1][1] + timedelta(days=1) == lower:
+                segments[-1] = (segments[-1][0], end, winner.delegate)
+            else:
+                segments.append((lower, end, winner.delegate))
+        return segments
+
+    def approver_for(self, manager_id, target_date):
+        """Return the effective approver standing in for ``manager_id`` on ``target_date``."""
+        starts = self._starts.get(manager_id)
+        if starts:
+            pos = bisect_right(starts, target_date) - 1
+            if pos >= 0:
+                start, end, delegate = self.segments[manager_id][pos]
+                if end >= target_date:
+                    return delegate
+        return self.managers[manager_id]
+
+    def approvers_on(self, target_date):
+        """Return the distinct effective approvers across all managers on ``target_date``."""
+        return list({self.approver_for(manager_id, target_date) for manager_id in self.managers})
+
+    def approval_windows(self, user):
+        """
+        Describe the dates on which ``user`` is an effective approver.
+
+        Returns:
+            tuple: ``(is_manager, delegated_away, received)`` where ``delegated_away``
+            lists the (start, end) windows the user's own authority is held by
+            someone else, and ``received`` lists the windows in which the user
+            stands in for another manager.
+        """
+        is_manager = user.pk in self.managers
+        delegated_away = [
+            (start, end) for start, end, delegate in self.segments.get(user.pk, []) if delegate.pk != user.pk
+        ]
+        received = [
+            (start, end)
+            for segments in self.segments.values()
+            for start, end, delegate in segments
+            if delegate.pk == user.pk
+        ]
+        return is_manager, delegated_away, received
+
+
+_delegation_index = None
+_delegation_stamp = None
+_delegation_generation = 0
+_delegation_lock = threading.Lock()
+
+
+def get_delegation_index():
+    """
+    Return the cached DelegationIndex, building it with one bulk load when cold.
+
+    A cold build costs two queries, however many managers and delegations
+    there are: the managers, then the delegations with their delegates. They
+    stay separate because managers without a delegation would otherwise need
+    an outer join from User that returns no Delegation instances. A warm
+    lookup costs none. The index is also rebuilt when the shared Delegation
+    version stamp moved, i.e. after a change made by another worker process.
+    """
+    global _delegation_index, _delegation_stamp
+    stamp, = get_versions(DELEGATIONS_VERSION)
+    index = _delegation_index
+    if index is not None and _delegation_stamp == stamp:
+        return index
+
+    generation = _delegation_generation
+    managers = list(User.objects.filter(is_manager=True))
+    delegations = list(
+        Delegation.objects.filter(manager__is_manager=True).select_related('delegate').order_by('start_date', 'id')
+    )
+    index = DelegationIndex(managers, delegations)
+    with _delegation_lock:
+        # Only publish if nothing was invalidated while we were reading.
+        if generation == _delegation_generation:
+            _delegation_index, _delegation_stamp = index, stamp
+    return index
+
+
+def invalidate_delegation_index():
+    """Drop the cached DelegationIndex so the next lookup rebuilds it."""
+    global _delegation_index, _delegation_generation
+    with _delegation_lock:
+        _delegation_generation += 1
+        _delegation_index = None
+
 
 def get_active_managers(target_date=None):
     """
@@ -24,20 +159,60 @@ def get_active_managers(target_date=None):
     """
     if target_date is None:
         target_date = date.today()
-    
-    active_managers = []
-    all_managers = User.objects.filter(is_manager=True)
-    
-    for manager in all_managers:
-        delegation = Delegation.objects.filter(
-            manager=manager,
-            start_date__lte=target_date,
-            end_date__gte=target_date
-        ).first()
-        
-        if delegation:
-            active_managers.append(delegation.delegate)
-        else:
-            active_managers.append(manager)
-    
-    return list(set(active_managers)) 
+
+    return get_delegation_index().approvers_on(target_date)
+
+
+def approval_condition(user):
+    """
+    Return the filter selecting leaves whose start date ``user`` may approve.
+
+    The delegation windows from the cached DelegationIndex are turned into
+    ``start_date`` range filters, so no further query is needed.
+
+    Args:
+        user (User): The manager or delegate.
+
+    Returns:
+        Q | None: The condition, or None when the user may approve every leave.
+    """
+    is_manager, delegated_away, received = get_delegation_index().approval_windows(user)
+    if not is_manager and not received:
+        return Q(pk__in=[])
+    if is_manager and not delegated_away:
+        return None
+    condition = Q(pk__in=[])
+    if is_manager:
+        own = ~Q(start_date__range=delegated_away[0])
+        for window in delegated_away[1:]:
+            own &= ~Q(start_date__range=window)
+        condition |= own
+    for window in received:
+        condition |= Q(start_date__range=window)
+    return condition
+
+
+def reviewable_by(user):
+    """Boolean expression telling, per LeaveRequest row, whether ``user`` may approve it."""
+    condition = approval_condition(user)
+    if condition is None:
+        return Value(True)
+    return Case(When(condition, then=Value(True)), default=Value(False), output_field=BooleanField())
+
+
+def get_approval_queue(user):
+    """
+    Return the pending leaves ``user`` may approve, as a single queryset.
+
+    The whole queue is resolved by the database with ``approval_condition``
+    instead of checking every pending leave against every manager.
+
+    Args:
+        user (User): The manager or delegate looking at the queue.
+
+    Returns:
+        QuerySet[LeaveRequest]: Pending leaves ordered by start date.
+    """
+    pending = LeaveRequest.objects.filter(status='Pending').order_by('start_date', 'id')
+    condition = approval_condition(user)
+    return pending if condition is None else pending.filter(condition)
@@ -0,0 +1,137 @@
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import BalanceEntry, LeaveBalance
+from .versions import bump_user_versions
+
+
+def post_entry(user_id, leave_type_id, amount, kind, leave=None):
+    """
+    Append a ledger entry and apply it to the LeaveBalance snapshot.
+
+    The entry is a single ``INSERT`` and the snapshot a single
+    ``UPDATE ... SET balance = balance + amount``, in one transaction. Neither
+    reads the balance first, so concurrent postings to the same balance cannot
+    overwrite each other.
+
+    Args:
+        user_id (int): Owner of the balance.
+        leave_type_id (int): Leave type of the balance.
+        amount (int): Days to add; negative to deduct.
+        kind (str): BalanceEntry kind.
+        leave (LeaveRequest): Leave request the entry belongs to (optional).
+
+    Raises:
+        LeaveBalance.DoesNotExist: The user has no balance for the leave type.
+    """
+    with transaction.atomic():
+        updated = LeaveBalance.objects.filter(user_id=user_id, leave_type_id=leave_type_id) \
+            .update(balance=F('balance') + amount)
+        if not updated:
+            raise LeaveBalance.DoesNotExist(f'No leave balance for user {user_id} and leave type {leave_type_id}')
+        BalanceEntry.objects.create(user_id=user_id, leave_type_id=leave_type_id, kind=kind,
+                                    amount=amount, leave=leave)
+        bump_user_versions([user_id])
+
+
+def debit_leave(leave, working_days):
+    """Deduct an approved leave's working days from the employee's balance."""
+    post_entry(leave.user_id, leave.leave_type_id, -working_days, 'Debit', leave)
+
+
+def reverse_leave(leave, working_days):
+    """Give back the working days of a leave that is no longer approved."""
+    post_entry(leave.user_id, leave.leave_type_id, working_days, 'Reversal', leave)
+
+
+def post_entries(entries):
+    """
+    Append many ledger entries and apply them to their snapshots.
+
+    The entries go in with one bulk ``INSERT``; each affected balance then
+    gets one ``UPDATE ... SET balance = balance + total``. Call inside a
+    transaction, after making sure every balance exists.
+
+    Args:
+        entries (list[BalanceEntry]): Unsaved entries.
+    """
+    totals = {}
+    for entry in entries:
+        key = (entry.user_id, entry.leave_type_id)
+        totals[key] = totals.get(key, 0) + entry.amount
+    BalanceEntry.objects.bulk_create(entries)
+    for (user_id, leave_type_id), amount in totals.items():
+        LeaveBalance.objects.filter(user_id=user_id, leave_type_id=leave_type_id).update(balance=F('balance') + amount)
+    bump_user_versions(user_id for user_id, _ in totals)
+
+
+def record_changes(before, after, kind):
+    """
+    Bulk-insert one entry per balance whose value changed between two reads.
+
+    Used by set-based writers that update many snapshots with one statement;
+    the caller must hold the rows (``select_for_update``) between the reads.
+
+    Args:
+        before (dict): ``{balance_pk: (user_id, leave_type_id, balance)}`` read before the update.
+        after (dict): ``{balance_pk: balance}`` read after it.
+        kind (str): BalanceEntry kind.
+    """
+    entries = BalanceEntry.objects.bulk_create([
+        BalanceEntry(user_id=user_id, leave_type_id=leave_type_id, kind=kind, amount=after[pk] - balance)
+        for pk, (user_id, leave_type_id, balance) in before.items()
+        if pk in after and after[pk] != balance
+    ])
+    bump_user_versions(entry.user_id for entry in entries)
+
+
+def open_balances(balances):
+    """Bulk-insert new LeaveBalance rows together with their 'Opening' entries."""
+    with transaction.atomic():
+        LeaveBalance.objects.bulk_create(balances)
+        BalanceEntry.objects.bulk_create([
+            BalanceEntry(user_id=balance.user_id, leave_type_id=balance.leave_type_id, kind='Opening',
+                         amount=balance.balance)
+            for balance in balances if balance.balance
+        ])
+        bump_user_versions(balance.user_id for balance in balances)
+
+
+def ledger_total(before=None):
+    """
+    Expression summing a LeaveBalance row's ledger entries, for annotations and updates.
+
+    Args:
+        before (datetime): Only count entries written before this moment (optional).
+    """
+    entries = BalanceEntry.objects.filter(user=OuterRef('user'), leave_type=OuterRef('leave_type'))
+    if before is not None:
+        entries = entries.filter(created_at__lt=before)
+    entries = entries.order_by().values('user', 'leave_type').annotate(total=Sum('amount')).values('total')
+    return Coalesce(Subquery(entries, output_field=IntegerField()), Value(0))
+
+
+def ledger_totals():
+    """LeaveBalance rows annotated with ``ledger``, the sum of their ledger entries."""
+    return LeaveBalance.objects.annotate(ledger=ledger_total())
+
+
+def reconcile_balances(fix=False):
+    """
+    Compare every LeaveBalance snapshot with the sum of its ledger entries.
+
+    Args:
+        fix (bool): Append an 'Adjustment' entry for each difference, so the
+            ledger accounts for the snapshot again.
+
+    Returns:
+        list[tuple]: ``(balance_pk, snapshot, ledger)`` for every balance that differs.
+    """
+    drift = list(ledger_totals().exclude(balance=F('ledger')).order_by('pk')
+                 .values_list('pk', 'user_id', 'leave_type_id', 'balance', 'ledger'))
+    if fix and drift:
+        BalanceEntry.objects.bulk_create([
+            BalanceEntry(user_id=user_id, leave_type_id=leave_type_id, kind='Adjustment', amount=balance - ledger)
+            for _, user_id, leave_type_id, balance, ledger in drift
+        ])
+    return [(pk, balance, ledger) for pk, _, _, balance, ledger in drift]
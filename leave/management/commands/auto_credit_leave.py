@@ -1,28 +1,36 @@
 from django.core.management.base import BaseCommand
-from leave.models import User, LeaveType, LeaveBalance
+from leave.accrual import DEFAULT_CHUNK_SIZE, credit_monthly, credit_yearly
 from datetime import date
 
 class Command(BaseCommand):
-    help = 'Auto-credit leave balances monthly/yearly'
+    help = (
+        'Auto-credit leave balances monthly/yearly. Optional when balances are accrued '
+        'on read (LEAVE_ACCRUAL_ON_READ); running it just materializes the same credits.'
+    )
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Employees processed per transaction.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be credited without writing anything.')
+
+    def handle(self, *args, **options):
         today = date.today()
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
 
         # Monthly leave credit
-        monthly_leave_types = LeaveType.objects.filter(name__in=['Casual', 'Earned'])  
-        for leave_type in monthly_leave_types:
-            for user in User.objects.filter(is_employee=True):
-                balance_obj, created = LeaveBalance.objects.get_or_create(user=user, leave_type=leave_type)
-                balance_obj.balance += 1  
-                balance_obj.save()
-                self.stdout.write(f'Credited 1 {leave_type.name} leave to {user.username}')
+        self._report(credit_monthly(today, chunk_size=chunk_size, dry_run=dry_run), dry_run)
+
+        # Yearly leave credit: once per year, on the first run after Jan 1
+        self._report(credit_yearly(today, chunk_size=chunk_size, dry_run=dry_run), dry_run)
 
-        # Yearly leave credit
-        if today.month == 1 and today.day == 1:  # every Jan 1
-            yearly_leave_types = LeaveType.objects.filter(name__in=['Sick'])
-            for leave_type in yearly_leave_types:
-                for user in User.objects.filter(is_employee=True):
-                    balance_obj, created = LeaveBalance.objects.get_or_create(user=user, leave_type=leave_type)
-                    balance_obj.balance = leave_type.annual_quota  # reset/add yearly
-                    balance_obj.save()
-                    self.stdout.write(f'Credited yearly {leave_type.name} leave to {user.username}')
+    def _report(self, result, dry_run):
+        if result.skipped:
+            self.stdout.write(f'{result.kind} credit for {result.period} already applied; nothing to do')
+            return
+        prefix = '[dry run] would credit' if dry_run else 'Credited'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} {result.kind.lower()} leave for {result.period}: {result.employees} employees, '
+            f'{result.created} new balances, {result.updated} balances updated'
+        ))
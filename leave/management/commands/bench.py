@@ -0,0 +1,229 @@
+import json
+import time
+import tracemalloc
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from leave import urls as leave_urls
+from leave.exports import request_history_export, run_export_job
+from leave.helpers import get_approval_queue
+from leave.models import LeaveRequest, LeaveBalance, User
+from leave.perfstats import percentile
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every route in leave/urls.py with the test client against a seeded dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=1000,
+                            help='Employees to seed if no benchmark dataset exists yet.')
+        parser.add_argument('--managers', type=int, default=None, help='Managers to seed (see seed_db).')
+        parser.add_argument('--years', type=int, default=2, help='Years of history to seed (see seed_db).')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the dataset (see seed_db).')
+        parser.add_argument('--prefix', default='bench', help='Username prefix of the benchmark dataset.')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per route.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--baseline', help='Compare against a JSON file from an earlier --output run.')
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help='Allowed p95 slowdown in percent before a route is flagged.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if not User.objects.filter(username__startswith=f'{prefix}_emp').exists():
+            self.stdout.write(f"Seeding {options['employees']} employees with prefix '{prefix}'...")
+            call_command('seed_db', employees=options['employees'], managers=options['managers'],
+                         years=options['years'], seed=options['seed'], prefix=prefix, stdout=self.stdout)
+
+        employee = self._employee(prefix)
+        manager = User.objects.filter(username__startswith=f'{prefix}_mgr', is_manager=True).order_by('pk').first()
+        if employee is None or manager is None:
+            raise CommandError(f"No '{prefix}_' employee with leave history or manager found.")
+
+        results = {
+            'meta': {
+                'employees': User.objects.filter(is_employee=True).count(),
+                'leave_requests': LeaveRequest.objects.count(),
+                'iterations': options['iterations'],
+                'employee': employee.username,
+                'manager': manager.username,
+            },
+            'routes': {},
+        }
+        with override_settings(ALLOWED_HOSTS=['testserver'],
+                               EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            for name, scenario in self._scenarios(employee, manager).items():
+                results['routes'][name] = self._measure(scenario, options['iterations'])
+                self._print_row(name, results['routes'][name])
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2, default=str)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)
+            regressions = self._compare(baseline['routes'], results['routes'], options['threshold'])
+            if regressions:
+                raise CommandError(f'{len(regressions)} route(s) regressed: {", ".join(regressions)}')
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline.'))
+
+    def _employee(self, prefix):
+        """The generated employee with the most leave requests, so history pages are not trivially small."""
+        candidates = User.objects.filter(username__startswith=f'{prefix}_emp', is_employee=True).order_by('pk')[:50]
+        return max(candidates, key=lambda user: LeaveRequest.objects.filter(user=user).count(), default=None)
+
+    def _scenarios(self, employee, manager):
+        """
+        Build one request scenario per route in leave/urls.py.
+
+        Each scenario is ``(user, method, path, data)``. Writes run inside a
+        transaction that is rolled back, so the dataset is identical for every
+        iteration and every run.
+        """
+        today = date.today()
+        pending = LeaveRequest.objects.filter(user=employee, status='Pending', start_date__gt=today).first()
+        queued = get_approval_queue(manager).first()
+        queued_ids = list(get_approval_queue(manager).values_list('pk', flat=True)[:25])
+        balance = LeaveBalance.objects.filter(user=employee).select_related('leave_type').first()
+        export = self._export_job(employee)
+        apply_start = today + timedelta(days=400 + (7 - (today + timedelta(days=400)).weekday()))  # a Monday
+        known = {
+            None: (None, 'GET', '/', None),
+            'login': (None, 'GET', reverse('login'), None),
+            'logout': (employee, 'GET', reverse('logout'), None),
+            'dashboard': (employee, 'GET', reverse('dashboard'), None),
+            'apply_leave': (employee, 'GET', reverse('apply_leave'), None),
+            'leave_history': (employee, 'GET', reverse('leave_history'), None),
+            'upcoming_holidays': (employee, 'GET', reverse('upcoming_holidays'), None),
+            'download_leave_history_pdf': (employee, 'GET', reverse('download_leave_history_pdf'), None),
+            'manager_dashboard': (manager, 'GET', reverse('manager_dashboard'), None),
+            'reports': (manager, 'GET', reverse('reports'), None),
+        }
+        with_targets = {
+            'cancel_leave': pending and (employee, 'POST', reverse('cancel_leave', args=[pending.pk]),
+                                         {'cancel_reason': 'Benchmark'}),
+            'approve_leave': queued and (manager, 'POST', reverse('approve_leave', args=[queued.pk]),
+                                         {'comments': 'Benchmark'}),
+            'reject_leave': queued and (manager, 'POST', reverse('reject_leave', args=[queued.pk]),
+                                        {'comments': 'Benchmark'}),
+            'bulk_review': queued_ids and (manager, 'POST', reverse('bulk_review'),
+                                           {'leave_ids': queued_ids, 'action': 'approve', 'comments': 'Benchmark'}),
+            'export_status': (employee, 'GET', reverse('export_status', args=[export.pk]), None),
+            'export_download': (employee, 'GET', reverse('export_download', args=[export.pk]), None),
+        }
+
+        scenarios = {}
+        for pattern in leave_urls.urlpatterns:
+            if not isinstance(pattern, URLPattern):
+                continue
+            name = pattern.name
+            if name in with_targets:
+                if with_targets[name]:
+                    scenarios[name] = with_targets[name]
+                else:
+                    self.stdout.write(self.style.WARNING(f'Skipping {name}: no suitable leave request in the dataset'))
+            elif name in known:
+                scenarios[name or 'root'] = known[name]
+            elif not pattern.pattern.converters:
+                scenarios[name] = (manager, 'GET', reverse(name), None)
+            else:
+                self.stdout.write(self.style.WARNING(f'Skipping {name}: no benchmark scenario for its URL arguments'))
+        if balance:
+            scenarios['apply_leave [POST]'] = (employee, 'POST', reverse('apply_leave'), {
+                'leave_type': balance.leave_type_id, 'start_date': apply_start,
+                'end_date': apply_start + timedelta(days=1), 'reason': 'Benchmark',
+            })
+        return scenarios
+
+    def _export_job(self, employee):
+        """The employee's finished leave history export, rendered here if the dataset has none yet."""
+        job = request_history_export(employee)
+        if job.status != 'Done':
+            job.status, job.started_at = 'Running', timezone.now()
+            job.save(update_fields=['status', 'started_at'])
+            run_export_job(job)
+        return job
+
+    def _request(self, client, method, path, data):
+        with transaction.atomic():
+            response = client.post(path, data) if method == 'POST' else client.get(path)
+            if hasattr(response, 'streaming_content'):
+                for _ in response.streaming_content:
+                    pass
+            transaction.set_rollback(True)
+        return response
+
+    def _login(self, client, user):
+        """Log the client in unless it still holds a session (logout clears it)."""
+        cookie = client.cookies.get(settings.SESSION_COOKIE_NAME)
+        if user is not None and not (cookie and cookie.value):
+            client.force_login(user)
+
+    def _measure(self, scenario, iterations):
+        """Time a scenario, then repeat it once under tracemalloc for peak memory."""
+        user, method, path, data = scenario
+        client = Client(raise_request_exception=False)
+        latencies, queries, statuses = [], [], set()
+
+        for iteration in range(iterations + 1):
+            self._login(client, user)
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = self._request(client, method, path, data)
+                elapsed = (time.perf_counter() - start) * 1000
+            if iteration == 0:
+                continue  # warm-up: fills the in-process caches
+            latencies.append(elapsed)
+            queries.append(len(captured))
+            statuses.add(response.status_code)
+
+        self._login(client, user)
+        tracemalloc.start()
+        try:
+            self._request(client, method, path, data)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'method': method,
+            'path': path,
+            'status': sorted(statuses),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'mean_ms': sum(latencies) / len(latencies),
+            'queries': max(queries),
+            'peak_kb': peak / 1024,
+        }
+
+    def _print_row(self, name, row):
+        self.stdout.write(
+            f"{name:<32} {row['method']:<5} {'/'.join(map(str, row['status'])):<8} "
+            f"p50 {row['p50_ms']:8.1f} ms  p95 {row['p95_ms']:8.1f} ms  p99 {row['p99_ms']:8.1f} ms  "
+            f"{row['queries']:5d} queries  {row['peak_kb']:9.0f} KiB peak"
+        )
+
+    def _compare(self, baseline, current, threshold):
+        """Print and return the routes slower (p95) or chattier (queries) than the baseline."""
+        regressions = []
+        for name, row in current.items():
+            before = baseline.get(name)
+            if not before:
+                continue
+            slower = row['p95_ms'] > before['p95_ms'] * (1 + threshold / 100)
+            chattier = row['queries'] > before['queries']
+            if slower or chattier:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f"REGRESSION {name}: p95 {before['p95_ms']:.1f} -> {row['p95_ms']:.1f} ms, "
+                    f"queries {before['queries']} -> {row['queries']}"
+                ))
+        return regressions
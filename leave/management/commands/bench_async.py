@@ -0,0 +1,138 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import include, path
+from leave import views
+from leave.models import LeaveRequest, User
+from leave.perfstats import percentile
+
+# Both versions of each page side by side, next to the regular routes the templates link to.
+PAGES = {
+    'leave_history': ('/sync/leave-history/', '/async/leave-history/'),
+    'reports': ('/sync/reports/', '/async/reports/'),
+}
+urlpatterns = [
+    path('sync/leave-history/', views.leave_history_view),
+    path('async/leave-history/', views.leave_history_async_view),
+    path('sync/reports/', views.reports_view),
+    path('async/reports/', views.reports_async_view),
+    path('', include(settings.ROOT_URLCONF)),
+]
+
+
+def _split(total, workers):
+    """Spread ``total`` requests over ``workers`` as evenly as possible."""
+    return [total // workers + (1 if i < total % workers else 0) for i in range(workers)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare sync and async throughput of the leave history and reports pages at high concurrency. '
+        'Sync views are driven through the WSGI handler from a thread pool, async views through the ASGI '
+        'handler from one event loop, both in this process against a seeded dataset.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=1000,
+                            help='Employees to seed if no benchmark dataset exists yet.')
+        parser.add_argument('--prefix', default='bench', help='Username prefix of the benchmark dataset.')
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight at once.')
+        parser.add_argument('--requests', type=int, default=500, help='Timed requests per page and mode.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if not User.objects.filter(username__startswith=f'{prefix}_emp').exists():
+            self.stdout.write(f"Seeding {options['employees']} employees with prefix '{prefix}'...")
+            call_command('seed_db', employees=options['employees'], prefix=prefix, stdout=self.stdout)
+
+        employee = User.objects.filter(username__startswith=f'{prefix}_emp', is_employee=True) \
+            .filter(pk__in=LeaveRequest.objects.values('user')).order_by('pk').first()
+        manager = User.objects.filter(username__startswith=f'{prefix}_mgr', is_manager=True).order_by('pk').first()
+        if employee is None or manager is None:
+            raise CommandError(f"No '{prefix}_' employee with leave history or manager found.")
+
+        concurrency, total = max(1, options['concurrency']), max(1, options['requests'])
+        results = {'meta': {'concurrency': concurrency, 'requests': total}, 'pages': {}}
+        with override_settings(ALLOWED_HOSTS=['testserver'], ROOT_URLCONF=__name__):
+            for page, user in (('leave_history', employee), ('reports', manager)):
+                sync_path, async_path = PAGES[page]
+                # Every client shares one session, so no worker writes to the database to log in.
+                login = Client()
+                login.force_login(user)
+                session = login.cookies[settings.SESSION_COOKIE_NAME].value
+                # One untimed request per mode fills the in-process caches.
+                self._run_sync(sync_path, session, 1, 1)
+                asyncio.run(self._run_async(async_path, session, 1, 1))
+                rows = {
+                    'sync': self._run_sync(sync_path, session, concurrency, total),
+                    'async': asyncio.run(self._run_async(async_path, session, concurrency, total)),
+                }
+                results['pages'][page] = rows
+                for mode, row in rows.items():
+                    self.stdout.write(
+                        f"{page:<14} {mode:<6} {row['requests_per_second']:8.1f} req/s  "
+                        f"p50 {row['p50_ms']:8.1f} ms  p95 {row['p95_ms']:8.1f} ms"
+                    )
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def _summary(self, latencies, elapsed):
+        return {
+            'requests_per_second': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+        }
+
+    def _run_sync(self, url, session, concurrency, total):
+        def worker(count):
+            client = Client()
+            client.cookies[settings.SESSION_COOKIE_NAME] = session
+            latencies = []
+            try:
+                for _ in range(count):
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    if response.status_code != 200:
+                        raise CommandError(f'{url} returned {response.status_code}')
+            finally:
+                connections.close_all()
+            return latencies
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = [ms for batch in pool.map(worker, _split(total, concurrency)) for ms in batch]
+        return self._summary(latencies, time.perf_counter() - start)
+
+    async def _run_async(self, url, session, concurrency, total):
+        client = AsyncClient()
+        client.cookies[settings.SESSION_COOKIE_NAME] = session
+
+        async def worker(count):
+            latencies = []
+            for _ in range(count):
+                start = time.perf_counter()
+                response = await client.get(url)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(f'{url} returned {response.status_code}')
+            return latencies
+
+        try:
+            start = time.perf_counter()
+            batches = await asyncio.gather(*(worker(count) for count in _split(total, concurrency)))
+            elapsed = time.perf_counter() - start
+        finally:
+            await sync_to_async(connections.close_all)()
+        return self._summary([ms for batch in batches for ms in batch], elapsed)
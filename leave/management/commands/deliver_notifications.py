@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from leave.notifications import DEFAULT_BATCH_SIZE, deliver_notifications
+
+class Command(BaseCommand):
+    help = 'Send queued email notifications from the outbox in batches over one connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit.')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to wait when nothing is due.')
+        parser.add_argument('--batch', type=int, default=DEFAULT_BATCH_SIZE, help='Notifications sent per batch.')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            sent, failed = deliver_notifications(batch_size=options['batch'])
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} notification(s), {failed} failed and will be retried')
+            if options['once'] and sent + failed < options['batch']:
+                return
+            if not sent + failed:
+                time.sleep(options['interval'])
@@ -0,0 +1,38 @@
+import json
+import shutil
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from leave.perfstats import DEFAULT_MAX_AGE, load_snapshots, perf_stats, summarize
+
+class Command(BaseCommand):
+    help = 'Show p50/p95/p99 latency, query counts and duplicated SQL per view from the perf stats aggregate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the summary as JSON.')
+        parser.add_argument('--reset', action='store_true', help='Delete the stored snapshots after printing.')
+
+    def handle(self, *args, **options):
+        directory = getattr(settings, 'LEAVE_PERF_STATS_DIR', None)
+        max_age = getattr(settings, 'LEAVE_PERF_STATS_MAX_AGE', DEFAULT_MAX_AGE)
+        snapshots = load_snapshots(directory, max_age) if directory else []
+        snapshots.append(perf_stats.snapshot())
+        summary = summarize(snapshots)
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+        elif not summary:
+            self.stdout.write('No requests recorded. Is LEAVE_PERF_STATS enabled?')
+        else:
+            self.stdout.write(f"{'view':<50} {'reqs':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'sql ms':>8}")
+            for view, row in summary.items():
+                self.stdout.write(
+                    f"{view:<50} {row['requests']:>6} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+                    f"{row['p99_ms']:>9.1f} {row['avg_queries']:>8.1f} {row['avg_sql_ms']:>8.1f}"
+                )
+                for sql, times in row['duplicates'].items():
+                    self.stdout.write(f"    {times}x duplicated: {sql[:120]}")
+
+        if options['reset']:
+            perf_stats.reset()
+            if directory:
+                shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from leave.absence import DEFAULT_CHUNK_SIZE, rebuild_daily_absence
+
+
+class Command(BaseCommand):
+    help = 'Backfill the DailyAbsence table from approved leave requests, or verify that it matches them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only compare; exit with an error if any row is missing or extra.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Approved leaves compared per batch.')
+
+    def handle(self, *args, **options):
+        verify = options['verify']
+        missing, extra = rebuild_daily_absence(fix=not verify, chunk_size=options['chunk_size'])
+        if verify:
+            if missing or extra:
+                raise CommandError(f'DailyAbsence is out of date: {missing} missing and {extra} extra rows')
+            self.stdout.write(self.style.SUCCESS('DailyAbsence matches the approved leave requests'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'DailyAbsence rebuilt: {missing} missing and {extra} extra rows fixed'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from leave.capacity import rebuild_department_occupancy
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the DepartmentOccupancy counters from the DailyAbsence table, or verify them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only compare; exit with an error if any counter differs.')
+
+    def handle(self, *args, **options):
+        verify = options['verify']
+        drift = rebuild_department_occupancy(fix=not verify)
+        if verify:
+            if drift:
+                raise CommandError(f'DepartmentOccupancy is out of date: {drift} rows differ')
+            self.stdout.write(self.style.SUCCESS('DepartmentOccupancy matches the DailyAbsence table'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'DepartmentOccupancy rebuilt: {drift} rows corrected'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from leave.aggregates import rebuild_leave_aggregates
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the LeaveAggregate summary table from approved leave requests, or verify it. '
+        'Working days are recounted with the current holiday calendar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only compare; exit with an error if any aggregate row differs.')
+
+    def handle(self, *args, **options):
+        verify = options['verify']
+        drift = rebuild_leave_aggregates(fix=not verify)
+        if verify:
+            if drift:
+                raise CommandError(f'LeaveAggregate is out of date: {drift} rows differ')
+            self.stdout.write(self.style.SUCCESS('LeaveAggregate matches the approved leave requests'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'LeaveAggregate rebuilt: {drift} rows corrected'))
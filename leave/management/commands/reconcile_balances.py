@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from leave.ledger import reconcile_balances
+
+
+class Command(BaseCommand):
+    help = 'Verify every LeaveBalance snapshot against the sum of its BalanceEntry ledger rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help="Append an 'Adjustment' entry for each difference instead of failing.")
+
+    def handle(self, *args, **options):
+        fix = options['fix']
+        drift = reconcile_balances(fix=fix)
+        for pk, balance, ledger in drift[:20]:
+            self.stdout.write(f'LeaveBalance {pk}: snapshot {balance}, ledger {ledger}')
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Every leave balance matches its ledger'))
+        elif fix:
+            self.stdout.write(self.style.SUCCESS(f'{len(drift)} balances reconciled with adjustment entries'))
+        else:
+            raise CommandError(f'{len(drift)} leave balances differ from their ledger')
@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from leave.exports import purge_finished_exports, run_pending_exports
+
+class Command(BaseCommand):
+    help = 'Render queued leave history PDF exports off the request path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit.')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--batch', type=int, default=20, help='Jobs claimed per pass.')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            purge_finished_exports()
+            processed = run_pending_exports(limit=options['batch'])
+            if processed:
+                self.stdout.write(f'Rendered {processed} export(s)')
+            if options['once'] and processed < options['batch']:
+                return
+            if not processed:
+                time.sleep(options['interval'])
@@ -1,12 +1,57 @@
-from django.core.management.base import BaseCommand
+import csv
+import random
+from datetime import date, timedelta
+from io import StringIO
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model
-from leave.models import User, LeaveType, LeaveBalance, Holiday, LeaveRequest, Delegation
-from datetime import date
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from leave.absence import rebuild_daily_absence
+from leave.aggregates import rebuild_leave_aggregates
+from leave.capacity import rebuild_department_occupancy
+from leave.ledger import open_balances, post_entries
+from leave.models import User, LeaveType, LeaveBalance, Holiday, LeaveRequest, Delegation, BalanceEntry
+from leave.versions import HOLIDAYS_VERSION, bump_versions
+from leave.workcalendar import get_working_day_calendar, invalidate_working_day_calendar
+
+DEPARTMENTS = ['IT', 'HR', 'Finance', 'Sales', 'Marketing', 'Operations', 'Support', 'Legal', 'Admin', 'Research']
+
+# (month, day, name) of holidays generated for every seeded year.
+HOLIDAYS = [
+    (1, 1, 'New Year'), (1, 26, 'Republic Day'), (3, 14, 'Holi'), (4, 18, 'Good Friday'),
+    (5, 1, 'Labour Day'), (8, 15, 'Independence Day'), (10, 2, 'Gandhi Jayanti'),
+    (10, 20, 'Diwali'), (11, 5, 'Guru Nanak Jayanti'), (12, 25, 'Christmas'),
+]
+
+# Status mix for leaves that have already started, and for upcoming ones.
+PAST_STATUSES = (['Approved'] * 75) + (['Rejected'] * 12) + (['Cancelled'] * 10) + (['Pending'] * 3)
+FUTURE_STATUSES = (['Pending'] * 55) + (['Approved'] * 35) + (['Cancelled'] * 10)
+
+REASONS = ['Vacation', 'Family function', 'Medical appointment', 'Personal work', 'Travel', 'Fever', 'Wedding']
 
 class Command(BaseCommand):
-    help = 'Populate sample test data for leave management'
+    help = 'Populate sample test data for leave management, or a production-sized dataset with --employees'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=0,
+                            help='Scale mode: number of employees to generate (e.g. 50000).')
+        parser.add_argument('--managers', type=int, default=None,
+                            help='Scale mode: number of managers (default: one per 100 employees).')
+        parser.add_argument('--years', type=int, default=3,
+                            help='Scale mode: years of leave history to generate.')
+        parser.add_argument('--departments', type=int, default=len(DEPARTMENTS),
+                            help='Scale mode: number of departments.')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Scale mode: random seed, so repeated runs generate the same data.')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Scale mode: employees generated and inserted per transaction.')
+        parser.add_argument('--prefix', default='scale',
+                            help='Scale mode: username prefix for generated users.')
 
     def handle(self, *args, **options):
+        if options['employees']:
+            return self.generate_scale_data(**options)
+
         User = get_user_model()
 
         # Create Leave Types
@@ -56,4 +101,181 @@ class Command(BaseCommand):
         )
         self.stdout.write(self.style.SUCCESS('Delegation created: vijay to ajay'))
 
-        self.stdout.write(self.style.SUCCESS('All sample data added!'))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS('All sample data added!'))
+
+    # Scale mode
+
+    def generate_scale_data(self, employees, managers, years, departments, seed, chunk_size, prefix, **options):
+        """
+        Generate a production-sized dataset with bulk inserts.
+
+        Employees are produced chunk by chunk: each chunk's users, balances and
+        leave requests are inserted in one transaction before the next chunk is
+        generated, so memory stays bounded by ``chunk_size``. Leave requests are
+        loaded with ``COPY`` on PostgreSQL and ``bulk_create`` elsewhere; the
+        approved ones are then debited from the balances like an approval would,
+        from opening balances of one annual quota per seeded year.
+        """
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f'Users with prefix "{prefix}_" already exist; use another --prefix.')
+
+        rng = random.Random(seed)
+        managers = managers if managers is not None else max(1, employees // 100)
+        today = date.today()
+        first_day = date(today.year - years + 1, 1, 1)
+        last_day = today + timedelta(days=90)
+        department_names = [
+            DEPARTMENTS[i] if i < len(DEPARTMENTS) else f'Department {i + 1:03d}' for i in range(departments)
+        ]
+        password = make_password('password')
+
+        leave_types = self._scale_leave_types()
+        holidays = self._scale_holidays(first_day.year, last_day.year)
+        self.stdout.write(self.style.SUCCESS(f'{len(leave_types)} leave types and {holidays} holidays ready'))
+
+        manager_users = []
+        for start in range(0, managers, chunk_size):
+            batch = [
+                User(username=f'{prefix}_mgr{i:05d}', email=f'{prefix}_mgr{i:05d}@example.com', password=password,
+                     is_manager=True, department=department_names[i % len(department_names)])
+                for i in range(start, min(start + chunk_size, managers))
+            ]
+            manager_users.extend(User.objects.bulk_create(batch))
+        manager_ids = [manager.pk for manager in manager_users]
+        delegations = self._scale_delegations(rng, manager_ids, first_day, last_day)
+        self.stdout.write(self.style.SUCCESS(f'{managers} managers and {delegations} delegations created'))
+
+        total_leaves = 0
+        for start in range(0, employees, chunk_size):
+            with transaction.atomic():
+                batch = User.objects.bulk_create([
+                    User(username=f'{prefix}_emp{i:06d}', email=f'{prefix}_emp{i:06d}@example.com', password=password,
+                         is_employee=True, department=department_names[rng.randrange(len(department_names))])
+                    for i in range(start, min(start + chunk_size, employees))
+                ])
+                # Open with every seeded year's quota, so the debits of the whole history fit.
+                open_balances([
+                    LeaveBalance(user=user, leave_type=leave_type, balance=leave_type.annual_quota * years)
+                    for user in batch for leave_type in leave_types
+                ])
+                total_leaves += self._insert_leave_requests(
+                    self._scale_leave_requests(rng, batch, leave_types, years, manager_ids, first_day, last_day, today)
+                )
+                self._debit_approved_leaves(batch)
+            self.stdout.write(f'{min(start + chunk_size, employees)}/{employees} employees, {total_leaves} leave requests')
+
+        missing, _ = rebuild_daily_absence(chunk_size=chunk_size)
+        aggregates = rebuild_leave_aggregates()
+        occupancy = rebuild_department_occupancy()
+        self.stdout.write(f'{missing} daily absence rows, {aggregates} leave aggregate rows and '
+                          f'{occupancy} department occupancy rows written')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Scale data generated: {employees} employees, {managers} managers, {total_leaves} leave requests '
+            f'(login with any generated username, password "password")'
+        ))
+
+    def _scale_leave_types(self):
+        leave_types = [
+            LeaveType.objects.get_or_create(name='Annual Leave', defaults={'annual_quota': 12, 'carry_forward_allowed': True})[0],
+            LeaveType.objects.get_or_create(name='Sick Leave', defaults={'annual_quota': 10, 'carry_forward_allowed': False})[0],
+            LeaveType.objects.get_or_create(name='Casual', defaults={'annual_quota': 12, 'accrual_frequency': 'Monthly'})[0],
+        ]
+        return leave_types
+
+    def _scale_holidays(self, first_year, last_year):
+        holidays = [
+            Holiday(date=date(year, month, day), name=name)
+            for year in range(first_year, last_year + 1) for month, day, name in HOLIDAYS
+        ]
+        Holiday.objects.bulk_create(holidays, ignore_conflicts=True)
+        # bulk_create sends no signals, so drop the cached calendar here.
+        invalidate_working_day_calendar()
+        bump_versions([HOLIDAYS_VERSION])
+        return len(holidays)
+
+    def _scale_delegations(self, rng, manager_ids, first_day, last_day):
+        """Give each manager two short delegations to a colleague per year."""
+        if len(manager_ids) < 2:
+            return 0
+        delegations = []
+        span = (last_day - first_day).days
+        for manager_id in manager_ids:
+            for _ in range(max(1, span // 180)):
+                delegate_id = manager_id
+                while delegate_id == manager_id:
+                    delegate_id = rng.choice(manager_ids)
+                start = first_day + timedelta(days=rng.randrange(span))
+                delegations.append(Delegation(manager_id=manager_id, delegate_id=delegate_id,
+                                              start_date=start, end_date=start + timedelta(days=rng.randint(2, 14))))
+        Delegation.objects.bulk_create(delegations, batch_size=5000)
+        return len(delegations)
+
+    def _scale_leave_requests(self, rng, employees, leave_types, years, manager_ids, first_day, last_day, today):
+        """
+        Yield non-overlapping leave request rows for each employee, roughly one a month, never spanning a Sunday.
+
+        A leave that would take the employee's opening balance below zero is
+        rejected rather than approved, as a manager would.
+        """
+        calendar = get_working_day_calendar()
+        for employee in employees:
+            remaining = {leave_type.pk: leave_type.annual_quota * years for leave_type in leave_types}
+            current = first_day + timedelta(days=rng.randrange(30))
+            while current <= last_day:
+                if current.weekday() == 6:
+                    current += timedelta(days=1)
+                # Stop before the next Sunday, since leave cannot be applied on one.
+                length = min(rng.choice((0, 0, 0, 1, 1, 2, 4)), 5 - current.weekday())
+                end = current + timedelta(days=length)
+                status = rng.choice(PAST_STATUSES if current <= today else FUTURE_STATUSES)
+                approver_id = rng.choice(manager_ids) if status in ('Approved', 'Rejected') else None
+                leave_type_id = rng.choice(leave_types).pk
+                if status == 'Approved':
+                    days = calendar.count_working_days(current, end)
+                    if days > remaining[leave_type_id]:
+                        status = 'Rejected'
+                    else:
+                        remaining[leave_type_id] -= days
+                yield (employee.pk, leave_type_id, current, end, rng.choice(REASONS), status, approver_id)
+                current = end + timedelta(days=rng.randint(10, 50))
+
+    def _debit_approved_leaves(self, employees):
+        """Post a 'Debit' ledger entry for every approved leave of the given employees."""
+        calendar = get_working_day_calendar()
+        rows = LeaveRequest.objects.filter(user__in=employees, status='Approved') \
+            .values_list('pk', 'user_id', 'leave_type_id', 'start_date', 'end_date')
+        post_entries([
+            BalanceEntry(user_id=user_id, leave_type_id=leave_type_id, kind='Debit', leave_id=pk,
+                         amount=-calendar.count_working_days(start, end))
+            for pk, user_id, leave_type_id, start, end in rows
+        ])
+
+    def _insert_leave_requests(self, rows):
+        """Insert leave request tuples, using COPY on PostgreSQL; returns the number of rows."""
+        columns = ('user_id', 'leave_type_id', 'start_date', 'end_date', 'reason', 'status', 'approver_id')
+        if connection.vendor == 'postgresql':
+            buffer = StringIO()
+            writer = csv.writer(buffer)
+            count = 0
+            for row in rows:
+                writer.writerow(['' if value is None else value for value in row])
+                count += 1
+            buffer.seek(0)
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {LeaveRequest._meta.db_table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                    buffer,
+                )
+            return count
+
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(LeaveRequest(**dict(zip(columns, row))))
+            if len(batch) >= 5000:
+                LeaveRequest.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        LeaveRequest.objects.bulk_create(batch)
+        return count + len(batch)
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from leave.notifications import DEFAULT_DIGEST_BATCH_SIZE, build_digests
+
+class Command(BaseCommand):
+    help = 'Fold held notifications into hourly/daily digest emails for the deliver_notifications worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Queue the digests that are due and exit.')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between passes.')
+        parser.add_argument('--batch', type=int, default=DEFAULT_DIGEST_BATCH_SIZE, help='Recipients per batch.')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            queued = build_digests(batch_size=options['batch'])
+            if queued:
+                self.stdout.write(f'Queued {queued} digest(s)')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from leave.accrual import DEFAULT_CHUNK_SIZE, year_end_rollover
+
+
+class Command(BaseCommand):
+    help = (
+        'Close a leave year: carry unused leave forward up to each leave type\'s cap and lapse the rest. '
+        'Runs once per year; an interrupted run resumes where it stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, default=date.today().year - 1,
+                            help='Leave year to close. Defaults to last year.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Employees processed per transaction.')
+
+    def handle(self, *args, **options):
+        try:
+            result = year_end_rollover(options['year'], chunk_size=options['chunk_size'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if result.skipped:
+            self.stdout.write(f"Rollover of {options['year']} already applied; nothing to do")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled over {options['year']}: {result.employees} employees, {result.updated} balances changed"
+        ))
@@ -0,0 +1,126 @@
+import time
+from collections import Counter
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from .perfstats import perf_stats
+
+# QueryRecorder of the request being handled. Context variables follow the
+# request into the sync_to_async threads where async views run their queries.
+_current_recorder = ContextVar('leave_perf_stats_recorder', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    """Execute wrapper on every connection, counting into the current request's recorder, if any."""
+    recorder = _current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def _instrument(connection, **kwargs):
+    """Install ``_record_query`` on a connection, once."""
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _instrument_connections(**kwargs):
+    """Install ``_record_query`` on this thread's connections."""
+    for connection in connections.all():
+        _instrument(connection)
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper counting queries, SQL time and repeated statements.
+
+    Statements are grouped by their parameterized SQL, so the same query run
+    with different parameters in a loop shows up as one duplicated signature.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def duplicated(self):
+        """Return ``{sql: times}`` for every statement executed more than once."""
+        return {sql: times for sql, times in self.statements.items() if times > 1}
+
+
+class PerfStatsMiddleware:
+    """
+    Opt-in per-request latency and SQL instrumentation.
+
+    Enabled with ``LEAVE_PERF_STATS``; otherwise Django drops it at startup and
+    it costs nothing. For each request it records the resolved view, wall time,
+    query count, SQL time and duplicated statements, reports them in a
+    ``Server-Timing`` header and adds them to the rolling ``perf_stats`` aggregate
+    read by ``manage.py perfstats``. It runs natively under both WSGI and ASGI;
+    queries are attributed to the request through a context variable, so those
+    an async view runs in worker threads are counted too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'LEAVE_PERF_STATS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # request_started runs in the thread that will run the request's queries, under ASGI
+        # too; connections opened in any other thread are instrumented as they connect.
+        request_started.connect(_instrument_connections, dispatch_uid='leave_perf_stats')
+        connection_created.connect(_instrument, dispatch_uid='leave_perf_stats')
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        _instrument_connections()
+        recorder = QueryRecorder()
+        token = _current_recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_recorder.reset(token)
+        return self._report(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        token = _current_recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_recorder.reset(token)
+        return self._report(request, response, recorder, start)
+
+    def _report(self, request, response, recorder, start):
+        wall_ms = (time.perf_counter() - start) * 1000
+        sql_ms = recorder.duration * 1000
+        duplicated = recorder.duplicated()
+
+        match = request.resolver_match
+        view = match._func_path if match else 'unresolved'
+        response['Server-Timing'] = ', '.join([
+            f'total;dur={wall_ms:.1f};desc="{view}"',
+            f'db;dur={sql_ms:.1f};desc="{recorder.count} queries"',
+            f'dup;desc="{sum(duplicated.values())} duplicated queries"',
+        ])
+        perf_stats.record(view, wall_ms, recorder.count, sql_ms, duplicated)
+        return response
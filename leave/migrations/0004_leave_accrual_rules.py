@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:49
+
+import datetime
+from django.db import migrations, models
+
+
+def set_accrual_rules(apps, schema_editor):
+    # Carry over the rules auto_credit_leave used to hard-code by name.
+    LeaveType = apps.get_model('leave', 'LeaveType')
+    LeaveType.objects.filter(name__in=['Casual', 'Earned']).update(accrual_frequency='Monthly')
+    LeaveType.objects.filter(name__in=['Sick']).update(accrual_frequency='Yearly')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0003_accrualrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leavebalance',
+            name='last_accrued',
+            field=models.DateField(default=datetime.date.today),
+        ),
+        migrations.AddField(
+            model_name='leavetype',
+            name='accrual_amount',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='leavetype',
+            name='accrual_frequency',
+            field=models.CharField(choices=[('None', 'None'), ('Monthly', 'Monthly'), ('Yearly', 'Yearly')], default='None', max_length=20),
+        ),
+        migrations.RunPython(set_accrual_rules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:50
+
+from django.db import migrations, models
+
+
+def remove_duplicate_balances(apps, schema_editor):
+    # Keep the lowest-id row per (user, leave_type): it is the one `.first()` returned.
+    LeaveBalance = apps.get_model('leave', 'LeaveBalance')
+    keep = set()
+    duplicates = []
+    for pk, user_id, leave_type_id in LeaveBalance.objects.order_by('pk').values_list('pk', 'user_id', 'leave_type_id'):
+        if (user_id, leave_type_id) in keep:
+            duplicates.append(pk)
+        else:
+            keep.add((user_id, leave_type_id))
+    LeaveBalance.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0004_leave_accrual_rules'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='delegation',
+            index=models.Index(fields=['manager', 'start_date', 'end_date'], name='delegation_manager_range_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['user', 'status', 'start_date', 'end_date'], name='leave_req_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['status', 'start_date'], name='leave_req_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(condition=models.Q(('status', 'Pending')), fields=['start_date', 'id'], name='leave_req_pending_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_balances, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='leavebalance',
+            constraint=models.UniqueConstraint(fields=('user', 'leave_type'), name='unique_leave_balance'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0006_exportjob'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='leaverequest',
+            name='leave_req_status_start_idx',
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['user', 'start_date', 'id'], name='leave_req_user_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['status', 'start_date', 'id'], name='leave_req_status_start_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:01
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_daily_absence(apps, schema_editor):
+    # Same rows as leave.absence.rebuild_daily_absence, written with the historical models.
+    LeaveRequest = apps.get_model('leave', 'LeaveRequest')
+    DailyAbsence = apps.get_model('leave', 'DailyAbsence')
+    batch = []
+    leaves = LeaveRequest.objects.filter(status='Approved').order_by('pk') \
+        .values_list('pk', 'user_id', 'user__department', 'start_date', 'end_date')
+    for leave_id, user_id, department, start_date, end_date in leaves.iterator(chunk_size=2000):
+        for offset in range((end_date - start_date).days + 1):
+            batch.append(DailyAbsence(leave_id=leave_id, user_id=user_id, department=department,
+                                      date=start_date + timedelta(days=offset)))
+        if len(batch) >= 5000:
+            DailyAbsence.objects.bulk_create(batch)
+            batch = []
+    DailyAbsence.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0007_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAbsence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('department', models.CharField(blank=True, max_length=100, null=True)),
+                ('leave', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='absence_days', to='leave.leaverequest')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'department'], name='absence_date_dept_idx')],
+                'constraints': [models.UniqueConstraint(fields=('leave', 'date'), name='unique_absence_day')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_absence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:04
+
+from collections import defaultdict
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_leave_aggregates(apps, schema_editor):
+    # Same totals as leave.aggregates.rebuild_leave_aggregates, computed with the
+    # historical models: working days skip Sundays and holidays.
+    Holiday = apps.get_model('leave', 'Holiday')
+    LeaveRequest = apps.get_model('leave', 'LeaveRequest')
+    LeaveAggregate = apps.get_model('leave', 'LeaveAggregate')
+    holidays = set(Holiday.objects.values_list('date', flat=True))
+    totals = defaultdict(lambda: [0, 0])
+    leaves = LeaveRequest.objects.filter(status='Approved') \
+        .values_list('user__department', 'leave_type_id', 'start_date', 'end_date')
+    for department, leave_type_id, start_date, end_date in leaves.iterator(chunk_size=2000):
+        days = (start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1))
+        key = (department or '', leave_type_id, start_date.year, start_date.month)
+        totals[key][0] += 1
+        totals[key][1] += sum(1 for day in days if day.weekday() != 6 and day not in holidays)
+    LeaveAggregate.objects.bulk_create([
+        LeaveAggregate(department=department, leave_type_id=leave_type_id, year=year, month=month,
+                       leaves=leaves, working_days=working_days)
+        for (department, leave_type_id, year, month), (leaves, working_days) in totals.items()
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0008_dailyabsence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaveAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('department', models.CharField(blank=True, default='', max_length=100)),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('leaves', models.IntegerField(default=0)),
+                ('working_days', models.IntegerField(default=0)),
+                ('leave_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='leave.leavetype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('department', 'leave_type', 'year', 'month'), name='unique_leave_aggregate')],
+            },
+        ),
+        migrations.RunPython(backfill_leave_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0010_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DigestWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_notification_id', models.BigIntegerField(default=0)),
+                ('last_sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='leave',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='leave.leaverequest'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='notification_frequency',
+            field=models.CharField(choices=[('Immediate', 'Immediate'), ('Hourly', 'Hourly digest'), ('Daily', 'Daily digest')], default='Immediate', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Sent', 'Sent'), ('Failed', 'Failed'), ('Digest', 'Held for digest'), ('Digested', 'Sent in a digest')], default='Pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('status', 'Digest')), fields=['recipient', 'id'], name='notification_digest_idx'),
+        ),
+        migrations.AddField(
+            model_name='digestwatermark',
+            name='recipient',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='digest_watermark', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    # Every existing balance starts the ledger with one 'Opening' entry.
+    LeaveBalance = apps.get_model('leave', 'LeaveBalance')
+    BalanceEntry = apps.get_model('leave', 'BalanceEntry')
+    batch = []
+    balances = LeaveBalance.objects.exclude(balance=0).order_by('pk').values_list('user_id', 'leave_type_id', 'balance')
+    for user_id, leave_type_id, balance in balances.iterator(chunk_size=2000):
+        batch.append(BalanceEntry(user_id=user_id, leave_type_id=leave_type_id, kind='Opening', amount=balance))
+        if len(batch) >= 5000:
+            BalanceEntry.objects.bulk_create(batch)
+            batch = []
+    BalanceEntry.objects.bulk_create(batch)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0011_notification_digests'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('Opening', 'Opening'), ('Credit', 'Credit'), ('Debit', 'Debit'), ('Reversal', 'Reversal'), ('Adjustment', 'Adjustment')], max_length=10)),
+                ('amount', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('leave', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='leave.leaverequest')),
+                ('leave_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='leave.leavetype')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'leave_type'], name='balance_entry_user_type_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
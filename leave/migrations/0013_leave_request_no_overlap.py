@@ -0,0 +1,63 @@
+from django.db import migrations
+
+# Kept in sync with LeaveRequest.ACTIVE_STATUSES and leave.services.OVERLAP_CONSTRAINT.
+CONSTRAINT = 'leave_request_no_overlap'
+ACTIVE = "('Pending', 'Approved')"
+
+POSTGRESQL_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS btree_gist',
+    f"""
+    ALTER TABLE leave_leaverequest ADD CONSTRAINT {CONSTRAINT}
+    EXCLUDE USING gist (user_id WITH =, daterange(start_date, end_date, '[]') WITH &&)
+    WHERE (status IN {ACTIVE})
+    """,
+]
+POSTGRESQL_BACKWARD = [f'ALTER TABLE leave_leaverequest DROP CONSTRAINT IF EXISTS {CONSTRAINT}']
+
+# SQLite has no exclusion constraints; triggers abort the statement instead,
+# which the driver reports as an IntegrityError carrying the constraint name.
+SQLITE_CONFLICT = f"""
+    SELECT RAISE(ABORT, '{CONSTRAINT}') WHERE EXISTS (
+        SELECT 1 FROM leave_leaverequest AS other
+        WHERE other.user_id = NEW.user_id AND other.status IN {ACTIVE}
+          AND other.start_date <= NEW.end_date AND other.end_date >= NEW.start_date
+          AND other.id IS NOT NEW.id
+    );
+"""
+SQLITE_FORWARD = [
+    f"""
+    CREATE TRIGGER {CONSTRAINT}_insert BEFORE INSERT ON leave_leaverequest
+    WHEN NEW.status IN {ACTIVE}
+    BEGIN {SQLITE_CONFLICT} END
+    """,
+    f"""
+    CREATE TRIGGER {CONSTRAINT}_update BEFORE UPDATE OF user_id, start_date, end_date, status ON leave_leaverequest
+    WHEN NEW.status IN {ACTIVE}
+    BEGIN {SQLITE_CONFLICT} END
+    """,
+]
+SQLITE_BACKWARD = [f'DROP TRIGGER IF EXISTS {CONSTRAINT}_insert', f'DROP TRIGGER IF EXISTS {CONSTRAINT}_update']
+
+
+def _run(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def add_overlap_constraint(apps, schema_editor):
+    _run(schema_editor, {'postgresql': POSTGRESQL_FORWARD, 'sqlite': SQLITE_FORWARD})
+
+
+def drop_overlap_constraint(apps, schema_editor):
+    _run(schema_editor, {'postgresql': POSTGRESQL_BACKWARD, 'sqlite': SQLITE_BACKWARD})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0012_balanceentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_overlap_constraint, drop_overlap_constraint),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:28
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_department_occupancy(apps, schema_editor):
+    # Same counts as leave.capacity.rebuild_department_occupancy: DailyAbsence
+    # rows per department and day.
+    DailyAbsence = apps.get_model('leave', 'DailyAbsence')
+    DepartmentOccupancy = apps.get_model('leave', 'DepartmentOccupancy')
+    counts = DailyAbsence.objects.values('department', 'date').annotate(absent=Count('id')).order_by()
+    totals = {}
+    for row in counts.iterator(chunk_size=2000):
+        key = (row['department'] or '', row['date'])
+        totals[key] = totals.get(key, 0) + row['absent']
+    DepartmentOccupancy.objects.bulk_create([
+        DepartmentOccupancy(department=department, date=day, absent=absent)
+        for (department, day), absent in totals.items()
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0013_leave_request_no_overlap'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CapacityRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('department', models.CharField(max_length=100, unique=True)),
+                ('max_absent', models.PositiveIntegerField()),
+                ('blocking', models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DepartmentOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('department', models.CharField(blank=True, default='', max_length=100)),
+                ('date', models.DateField()),
+                ('absent', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('department', 'date'), name='unique_department_occupancy')],
+            },
+        ),
+        migrations.RunPython(backfill_department_occupancy, migrations.RunPython.noop),
+    ]
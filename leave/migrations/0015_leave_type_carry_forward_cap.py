@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0014_department_occupancy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leavetype',
+            name='max_carry_forward',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='accrualrun',
+            name='kind',
+            field=models.CharField(choices=[('Monthly', 'Monthly'), ('Yearly', 'Yearly'), ('Rollover', 'Rollover')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='balanceentry',
+            name='kind',
+            field=models.CharField(choices=[('Opening', 'Opening'), ('Credit', 'Credit'), ('Debit', 'Debit'), ('Reversal', 'Reversal'), ('Adjustment', 'Adjustment'), ('Rollover', 'Rollover')], max_length=10),
+        ),
+    ]
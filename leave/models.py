@@ -1,5 +1,7 @@
+from datetime import date
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 class User(AbstractUser):
     """
@@ -9,10 +11,18 @@ class User(AbstractUser):
         is_employee (bool): Flag to indicate if the user is an employee.
         is_manager (bool): Flag to indicate if the user is a manager.
         department (str): Optional department name for the user.
+        notification_frequency (str): Send notification emails one by one ('Immediate') or as an hourly or daily digest.
     """
+    FREQUENCY_CHOICES = (
+        ('Immediate', 'Immediate'),
+        ('Hourly', 'Hourly digest'),
+        ('Daily', 'Daily digest'),
+    )
+
     is_employee = models.BooleanField(default=False)
     is_manager = models.BooleanField(default=False)
     department = models.CharField(max_length=100, blank=True, null=True)
+    notification_frequency = models.CharField(max_length=20, choices=FREQUENCY_CHOICES, default='Immediate')
 
 
 
@@ -23,11 +33,26 @@ class LeaveType(models.Model):
     Attributes:
         name (str): Name of the leave type.
         annual_quota (int): Number of leave days allocated per year (default 12).
-        carry_forward_allowed (bool): Whether unused leaves can be carried forward.
+        carry_forward_allowed (bool): Whether unused leaves are carried into the next leave year
+            by the ``year_end_rollover`` command; otherwise they lapse.
+        max_carry_forward (int): Most days carried forward per employee; the rest lapse (optional,
+            no limit when empty).
+        accrual_frequency (str): How balances grow: 'None', 'Monthly' (add accrual_amount
+            on the first of every month) or 'Yearly' (reset to annual_quota every January 1).
+        accrual_amount (int): Days credited per month for monthly accrual (default 1).
     """
+    ACCRUAL_CHOICES = (
+        ('None', 'None'),
+        ('Monthly', 'Monthly'),
+        ('Yearly', 'Yearly'),
+    )
+
     name = models.CharField(max_length=50)
     annual_quota = models.IntegerField(default=12)
     carry_forward_allowed = models.BooleanField(default=False)
+    max_carry_forward = models.PositiveIntegerField(null=True, blank=True)
+    accrual_frequency = models.CharField(max_length=20, choices=ACCRUAL_CHOICES, default='None')
+    accrual_amount = models.IntegerField(default=1)
 
     def __str__(self):
         return self.name
@@ -40,16 +65,66 @@ class LeaveBalance(models.Model):
     Attributes:
         user (User): Reference to the user.
         leave_type (LeaveType): Type of leave.
-        balance (int): Number of remaining leave days (default 0).
+        balance (int): Number of remaining leave days (default 0), materialized up to last_accrued.
+        last_accrued (DateField): Date through which the leave type's accrual rule has been applied.
     """
     user = models.ForeignKey('User', on_delete=models.CASCADE)
     leave_type = models.ForeignKey('LeaveType', on_delete=models.CASCADE)
     balance = models.IntegerField(default=0)
+    last_accrued = models.DateField(default=date.today)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'leave_type'], name='unique_leave_balance'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.leave_type.name}: {self.balance}"
 
 
+class BalanceEntry(models.Model):
+    """
+    Model representing one movement of a leave balance, in an append-only ledger.
+
+    Entries are only ever inserted. The sum of a user's entries for a leave
+    type equals their LeaveBalance, which the ``reconcile_balances`` command
+    verifies.
+
+    Attributes:
+        user (User): Owner of the balance.
+        leave_type (LeaveType): Type of leave.
+        kind (str): 'Opening', 'Credit' (accrual), 'Debit' (approval), 'Reversal' (cancellation or
+            rejection of an approved leave), 'Adjustment' (manual edit) or 'Rollover' (year-end
+            carry-forward and lapse).
+        amount (int): Days added to the balance; negative for debits.
+        leave (LeaveRequest): Leave request the entry belongs to, for debits and reversals (optional).
+        created_at (DateTimeField): When the entry was written.
+    """
+    KIND_CHOICES = (
+        ('Opening', 'Opening'),
+        ('Credit', 'Credit'),
+        ('Debit', 'Debit'),
+        ('Reversal', 'Reversal'),
+        ('Adjustment', 'Adjustment'),
+        ('Rollover', 'Rollover'),
+    )
+
+    user = models.ForeignKey('User', on_delete=models.CASCADE)
+    leave_type = models.ForeignKey('LeaveType', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    amount = models.IntegerField()
+    leave = models.ForeignKey('LeaveRequest', on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'leave_type'], name='balance_entry_user_type_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.leave_type.name}: {self.kind} {self.amount:+d}"
+
+
 class Holiday(models.Model):
     """
     Model representing a holiday.
@@ -86,6 +161,8 @@ class LeaveRequest(models.Model):
         ('Rejected', 'Rejected'),
         ('Cancelled', 'Cancelled')
     )
+    # Statuses that hold the dates; an employee's active leaves may not overlap (enforced by the database).
+    ACTIVE_STATUSES = ('Pending', 'Approved')
 
     user = models.ForeignKey('User', on_delete=models.CASCADE)
     leave_type = models.ForeignKey('LeaveType', on_delete=models.CASCADE)
@@ -96,6 +173,18 @@ class LeaveRequest(models.Model):
     approver = models.ForeignKey('User', related_name='approver', on_delete=models.SET_NULL, null=True, blank=True)
     comments = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Overlap checks when an employee applies for leave.
+            models.Index(fields=['user', 'status', 'start_date', 'end_date'], name='leave_req_user_status_idx'),
+            # Keyset pages of an employee's leave history.
+            models.Index(fields=['user', 'start_date', 'id'], name='leave_req_user_start_idx'),
+            # Approved-leave reports, calendars and their keyset pages.
+            models.Index(fields=['status', 'start_date', 'id'], name='leave_req_status_start_idx'),
+            # Manager approval queue; pending requests are a small slice of the table.
+            models.Index(fields=['start_date', 'id'], condition=models.Q(status='Pending'), name='leave_req_pending_idx'),
+        ]
+
     @property
     def total_days(self):
         """Calculate total number of leave days including start and end date."""
@@ -120,5 +209,271 @@ class Delegation(models.Model):
     start_date = models.DateField()
     end_date = models.DateField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['manager', 'start_date', 'end_date'], name='delegation_manager_range_idx'),
+        ]
+
     def __str__(self):
         return f"{self.manager.username} → {self.delegate.username} ({self.start_date} to {self.end_date})"
+
+
+class AccrualRun(models.Model):
+    """
+    Ledger entry recording one run of the leave accrual engine.
+
+    A run is keyed by its kind and period (the first day of the month for
+    monthly credits, January 1 for yearly ones, December 31 of the closed
+    year for year-end rollovers), so repeating a completed run
+    is a no-op. ``last_user_id`` is advanced in the same transaction as each
+    chunk of balance updates, letting an interrupted run resume where it
+    stopped without crediting anyone twice.
+
+    Attributes:
+        kind (str): 'Monthly', 'Yearly' or 'Rollover'.
+        period (DateField): Period the run credits.
+        last_user_id (int): Highest employee id already processed.
+        rows_credited (int): Number of LeaveBalance rows updated so far.
+        started_at (DateTimeField): When the run was first started.
+        completed_at (DateTimeField): When the run finished (optional).
+    """
+    KIND_CHOICES = (
+        ('Monthly', 'Monthly'),
+        ('Yearly', 'Yearly'),
+        ('Rollover', 'Rollover'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    period = models.DateField()
+    last_user_id = models.BigIntegerField(default=0)
+    rows_credited = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'period'], name='unique_accrual_run_period'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} accrual for {self.period}"
+
+
+class ExportJob(models.Model):
+    """
+    Model representing a background export of an employee's leave history to PDF.
+
+    Attributes:
+        STATUS_CHOICES (tuple): Possible statuses for an export job.
+        user (User): Employee whose history is exported.
+        version (str): Version stamp of the user's LeaveRequest and LeaveBalance rows at request time.
+        status (str): Current status of the job (default 'Queued').
+        file_path (str): Path of the generated artifact once the job is done.
+        error (TextField): Failure details, if the job failed (optional).
+        created_at (DateTimeField): When the job was requested.
+        started_at (DateTimeField): When a worker claimed the job (optional).
+        finished_at (DateTimeField): When the job finished (optional).
+    """
+    STATUS_CHOICES = (
+        ('Queued', 'Queued'),
+        ('Running', 'Running'),
+        ('Done', 'Done'),
+        ('Failed', 'Failed'),
+    )
+
+    user = models.ForeignKey('User', on_delete=models.CASCADE)
+    version = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Queued')
+    file_path = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='export_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} export ({self.status})"
+
+
+class DailyAbsence(models.Model):
+    """
+    Model holding one row per calendar day of each approved leave.
+
+    Maintained by the leave approval and cancellation services and rebuilt by
+    the ``rebuild_daily_absence`` command; it turns "who is out on these days"
+    into a range scan instead of expanding every leave in Python.
+
+    Attributes:
+        date (DateField): Day the employee is absent.
+        user (User): Absent employee.
+        leave (LeaveRequest): Approved leave covering the day.
+        department (str): The employee's department, copied for per-department headcounts (optional).
+    """
+    date = models.DateField()
+    user = models.ForeignKey('User', on_delete=models.CASCADE)
+    leave = models.ForeignKey('LeaveRequest', on_delete=models.CASCADE, related_name='absence_days')
+    department = models.CharField(max_length=100, blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['leave', 'date'], name='unique_absence_day'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'department'], name='absence_date_dept_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} absent on {self.date}"
+
+
+class LeaveAggregate(models.Model):
+    """
+    Model holding approved leave totals per department, leave type and month.
+
+    A leave counts towards the month it starts in. Rows are adjusted by the
+    leave approval, rejection and cancellation services and can be rebuilt
+    with the ``rebuild_leave_aggregates`` command.
+
+    Attributes:
+        department (str): Department of the employees ('' for none).
+        leave_type (LeaveType): Type of the leaves.
+        year (int): Year the leaves start in.
+        month (int): Month the leaves start in.
+        leaves (int): Number of approved leaves.
+        working_days (int): Working days charged for those leaves.
+    """
+    department = models.CharField(max_length=100, blank=True, default='')
+    leave_type = models.ForeignKey('LeaveType', on_delete=models.CASCADE)
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    leaves = models.IntegerField(default=0)
+    working_days = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['department', 'leave_type', 'year', 'month'], name='unique_leave_aggregate'),
+        ]
+
+    def __str__(self):
+        return f"{self.department or '-'} {self.leave_type.name} {self.year}-{self.month:02d}: {self.leaves}"
+
+
+class DepartmentOccupancy(models.Model):
+    """
+    Model holding how many employees of a department are on approved leave on each day.
+
+    Rows are adjusted by the leave approval, rejection and cancellation
+    services and can be rebuilt from DailyAbsence with the
+    ``rebuild_department_occupancy`` command. Checking a leave against the
+    department's CapacityRule is then a range scan over its days.
+
+    Attributes:
+        department (str): Department of the employees ('' for none).
+        date (DateField): Calendar day.
+        absent (int): Employees of the department on approved leave that day.
+    """
+    department = models.CharField(max_length=100, blank=True, default='')
+    date = models.DateField()
+    absent = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['department', 'date'], name='unique_department_occupancy'),
+        ]
+
+    def __str__(self):
+        return f"{self.department or '-'} {self.date}: {self.absent} absent"
+
+
+class CapacityRule(models.Model):
+    """
+    Model limiting how many employees of a department may be on leave on the same working day.
+
+    Attributes:
+        department (str): Department the rule applies to.
+        max_absent (int): Most employees that may be on approved leave on one working day.
+        blocking (bool): Refuse applications that would exceed the limit; otherwise only warn
+            the employee. Managers see the days over the limit in the approval queue either way.
+    """
+    department = models.CharField(max_length=100, unique=True)
+    max_absent = models.PositiveIntegerField()
+    blocking = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"{self.department}: at most {self.max_absent} absent"
+
+
+class Notification(models.Model):
+    """
+    Model representing an email in the notification outbox.
+
+    Rows are written in the same transaction as the change they announce and
+    sent later by the ``deliver_notifications`` command.
+
+    Attributes:
+        STATUS_CHOICES (tuple): Possible delivery statuses.
+        recipient (User): User the email is for (optional).
+        leave (LeaveRequest): Leave request the email is about (optional).
+        email (str): Address the email is sent to.
+        subject (str): Email subject.
+        body (TextField): Plain-text email body.
+        dedup_key (str): Identifies the event and recipient; a second notification with the same key is dropped.
+        status (str): Delivery status (default 'Pending'); 'Digest' rows wait for the recipient's digest.
+        attempts (int): Delivery attempts made so far.
+        next_attempt_at (DateTimeField): Earliest time of the next delivery attempt.
+        claim (UUIDField): Token of the worker currently sending the row (optional).
+        last_error (TextField): Error of the last failed attempt (optional).
+        created_at (DateTimeField): When the notification was queued.
+        sent_at (DateTimeField): When it was sent (optional).
+    """
+    STATUS_CHOICES = (
+        ('Pending', 'Pending'),
+        ('Sent', 'Sent'),
+        ('Failed', 'Failed'),
+        ('Digest', 'Held for digest'),
+        ('Digested', 'Sent in a digest'),
+    )
+
+    recipient = models.ForeignKey('User', on_delete=models.SET_NULL, null=True, blank=True)
+    leave = models.ForeignKey('LeaveRequest', on_delete=models.SET_NULL, null=True, blank=True)
+    email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    dedup_key = models.CharField(max_length=200, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim = models.UUIDField(null=True, blank=True)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at', 'id'], condition=models.Q(status='Pending'), name='notification_due_idx'),
+            models.Index(fields=['recipient', 'id'], condition=models.Q(status='Digest'), name='notification_digest_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.email} ({self.status})"
+
+
+class DigestWatermark(models.Model):
+    """
+    Model recording how far a recipient's notification digests have got.
+
+    Attributes:
+        recipient (User): User receiving the digests.
+        last_notification_id (int): Highest Notification id included in a digest so far.
+        last_sent_at (DateTimeField): When the last digest was queued (optional).
+    """
+    recipient = models.OneToOneField('User', on_delete=models.CASCADE, related_name='digest_watermark')
+    last_notification_id = models.BigIntegerField(default=0)
+    last_sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.recipient.username} digest up to #{self.last_notification_id}"
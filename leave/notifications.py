@@ -0,0 +1,284 @@
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Exists, F, Min, OuterRef, Q
+from django.utils import timezone
+from .models import DigestWatermark, Notification, User
+
+DEFAULT_BATCH_SIZE = 100
+MAX_ATTEMPTS = 6
+# First retry after a minute, doubling up to a few hours.
+RETRY_BASE = timedelta(minutes=1)
+RETRY_MAX = timedelta(hours=4)
+# A claimed row that is neither sent nor failed after this long is picked up again.
+CLAIM_TIMEOUT = timedelta(minutes=10)
+DIGEST_PERIODS = {'Hourly': timedelta(hours=1), 'Daily': timedelta(days=1)}
+DEFAULT_DIGEST_BATCH_SIZE = 200
+
+
+def _outbox_rows(recipients, subject, body, event, leave=None):
+    return [
+        Notification(recipient=user, leave=leave, email=user.email, subject=subject, body=body,
+                     dedup_key=f'{event}:{user.pk}',
+                     status='Pending' if user.notification_frequency == 'Immediate' else 'Digest')
+        for user in {user.pk: user for user in recipients if user.email}.values()
+    ]
+
+
+def queue_notifications(recipients, subject, body, event, leave=None):
+    """
+    Add one outbox row per recipient; call inside the transaction making the change.
+
+    Recipients without an email address are skipped. Rows whose ``event`` was
+    already queued for the same recipient are dropped, so retrying a request
+    does not send the same email twice. Recipients who chose an hourly or daily
+    digest get a 'Digest' row, which ``build_digests`` later folds into one email.
+
+    Args:
+        recipients (Iterable[User]): Users to notify.
+        subject (str): Email subject.
+        body (str): Plain-text email body.
+        event (str): Identifies what happened, e.g. ``leave-42-approved``.
+        leave (LeaveRequest): Leave request the email is about, listed in digests (optional).
+    """
+    Notification.objects.bulk_create(_outbox_rows(recipients, subject, body, event, leave), ignore_conflicts=True)
+
+
+def notify_leave_submitted(leave, managers, working_days):
+    queue_notifications(
+        managers, f"New Leave Request from {leave.user.username}",
+        f"{leave.user.username} applied for {leave.leave_type.name} from {leave.start_date} to {leave.end_date} "
+        f"({working_days} working days).",
+        f'leave-{leave.pk}-submitted', leave,
+    )
+
+
+def notify_leave_cancelled(leave, managers, reason):
+    queue_notifications(
+        managers, f"Leave Cancelled by {leave.user.username}",
+        f"{leave.user.username} cancelled their {leave.leave_type.name} leave from {leave.start_date} to "
+        f"{leave.end_date}.\nReason: {reason}",
+        f'leave-{leave.pk}-cancelled', leave,
+    )
+
+
+def _approved_email(leave, working_days):
+    return (
+        "Your Leave Request Approved",
+        f"Your leave from {leave.start_date} to {leave.end_date} ({working_days} working days) has been approved "
+        f"by {leave.approver.username}.\nComments: {leave.comments}",
+        f'leave-{leave.pk}-approved',
+    )
+
+
+def _rejected_email(leave):
+    return (
+        "Your Leave Request Rejected",
+        f"Your leave from {leave.start_date} to {leave.end_date} has been rejected by {leave.approver.username}."
+        f"\nReason: {leave.comments}",
+        f'leave-{leave.pk}-rejected',
+    )
+
+
+def notify_leave_approved(leave, working_days):
+    queue_notifications([leave.user], *_approved_email(leave, working_days), leave)
+
+
+def notify_leave_rejected(leave):
+    queue_notifications([leave.user], *_rejected_email(leave), leave)
+
+
+def notify_leaves_reviewed(leaves, approved):
+    """
+    Queue the approval or rejection emails of many leaves with one insert.
+
+    Args:
+        leaves (Iterable[tuple]): ``(leave, working_days)`` pairs; ``leave.user`` and ``leave.approver`` set.
+        approved (bool): True for approval emails, False for rejection emails.
+    """
+    rows = []
+    for leave, working_days in leaves:
+        email = _approved_email(leave, working_days) if approved else _rejected_email(leave)
+        rows += _outbox_rows([leave.user], *email, leave)
+    Notification.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt after ``attempts`` failed ones."""
+    return min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+
+
+def claim_batch(limit, now=None):
+    """
+    Claim up to ``limit`` due notifications for this worker.
+
+    The claim is one conditional ``UPDATE`` that stamps a fresh token on rows
+    still pending and due, so concurrent workers never get the same row.
+
+    Returns:
+        list[Notification]: The claimed rows, oldest first.
+    """
+    now = now or timezone.now()
+    due = Notification.objects.filter(status='Pending', next_attempt_at__lte=now) \
+        .order_by('next_attempt_at', 'id').values_list('pk', flat=True)[:limit]
+    token = uuid.uuid4()
+    Notification.objects.filter(pk__in=list(due), status='Pending', next_attempt_at__lte=now) \
+        .update(claim=token, next_attempt_at=now + CLAIM_TIMEOUT)
+    return list(Notification.objects.filter(claim=token).order_by('id'))
+
+
+def _failed(notification, error, now):
+    notification.attempts += 1
+    notification.last_error = error
+    if notification.attempts >= MAX_ATTEMPTS:
+        notification.status = 'Failed'
+    else:
+        notification.next_attempt_at = now + retry_delay(notification.attempts)
+
+
+def deliver_notifications(batch_size=DEFAULT_BATCH_SIZE, connection=None, now=None):
+    """
+    Send one batch of due notifications over a single email connection.
+
+    Each message goes through ``send_messages`` on the same open connection, so
+    one SMTP session serves the whole batch while failures are still recorded
+    per message. Failed messages are retried with exponential backoff until
+    ``MAX_ATTEMPTS`` is reached.
+
+    Args:
+        batch_size (int): Maximum notifications sent.
+        connection: Email backend instance to use; defaults to ``get_connection()``.
+        now (datetime): Current time, for tests.
+
+    Returns:
+        tuple: ``(sent, failed)`` counts for the batch.
+    """
+    now = now or timezone.now()
+    batch = claim_batch(batch_size, now)
+    if not batch:
+        return 0, 0
+
+    connection = connection or get_connection()
+    sent = failed = 0
+    try:
+        connection.open()
+    except Exception as exc:
+        for notification in batch:
+            _failed(notification, f'Could not connect: {exc!r}', now)
+        failed = len(batch)
+    else:
+        try:
+            for notification in batch:
+                message = EmailMessage(notification.subject, notification.body, settings.DEFAULT_FROM_EMAIL,
+                                       [notification.email], connection=connection)
+                try:
+                    delivered = connection.send_messages([message])
+                except Exception as exc:
+                    delivered, error = 0, repr(exc)
+                else:
+                    error = 'Backend accepted no message'
+                if delivered:
+                    notification.status, notification.sent_at = 'Sent', timezone.now()
+                    sent += 1
+                else:
+                    _failed(notification, error, now)
+                    failed += 1
+        finally:
+            connection.close()
+
+    for notification in batch:
+        notification.claim = None
+    Notification.objects.bulk_update(
+        batch, ['status', 'attempts', 'next_attempt_at', 'claim', 'last_error', 'sent_at'],
+    )
+    return sent, failed
+
+
+def _digest_due(recipient, now):
+    """A digest is due once its period has passed since the last digest, or since the oldest held item."""
+    period = DIGEST_PERIODS.get(recipient.notification_frequency)
+    since = recipient.last_digest_at or recipient.oldest_held
+    return period is None or now - since >= period
+
+
+def _digest_body(items):
+    lines = [f"You have {len(items)} leave notification(s):", ""]
+    for item in items:
+        if item.leave_id:
+            leave = item.leave
+            lines.append(f"- {item.subject}: {leave.user.username}, {leave.leave_type.name}, "
+                         f"{leave.start_date} to {leave.end_date} ({leave.status})")
+        else:
+            lines.append(f"- {item.subject}")
+    return "\n".join(lines)
+
+
+def build_digests(batch_size=DEFAULT_DIGEST_BATCH_SIZE, now=None):
+    """
+    Fold held notifications into one digest email per recipient whose digest is due.
+
+    Recipients are walked in id order, ``batch_size`` at a time. For each batch
+    one query finds the recipients with held rows (with their watermark) and one
+    query loads all their held rows with the leave details; the digests, the
+    status change and the watermarks are then written in one transaction. Only
+    the rows included in a digest leave the 'Digest' status, and a digest's
+    dedup key is its recipient and last row, so a rerun cannot send it twice.
+    The watermark only records the highest row digested: ids are assigned at
+    insert but committed out of order, so a row below it may still be held.
+    Recipients who switched back to immediate delivery get their held rows at once.
+
+    Returns:
+        int: Digest emails queued.
+    """
+    now = now or timezone.now()
+    held = Notification.objects.filter(recipient=OuterRef('pk'), status='Digest')
+    queued, after = 0, 0
+    while True:
+        recipients = list(
+            User.objects.filter(Exists(held), pk__gt=after).annotate(
+                oldest_held=Min('notification__created_at', filter=Q(notification__status='Digest')),
+                watermark_id=F('digest_watermark__id'),
+                watermark=F('digest_watermark__last_notification_id'),
+                last_digest_at=F('digest_watermark__last_sent_at'),
+            ).order_by('pk')[:batch_size]
+        )
+        if not recipients:
+            return queued
+        after = recipients[-1].pk
+        due = {recipient.pk: recipient for recipient in recipients if _digest_due(recipient, now)}
+        if due:
+            queued += _queue_digests(due, now)
+        if len(recipients) < batch_size:
+            return queued
+
+
+def _queue_digests(recipients, now):
+    items = {}
+    rows = Notification.objects.filter(status='Digest', recipient_id__in=recipients) \
+        .select_related('leave__user', 'leave__leave_type').order_by('recipient_id', 'id')
+    for item in rows:
+        items.setdefault(item.recipient_id, []).append(item)
+
+    digests, watermarks, new_watermarks = [], [], []
+    for recipient_id, held in items.items():
+        recipient = recipients[recipient_id]
+        last_id = held[-1].pk
+        if recipient.email:
+            digests.append(Notification(
+                recipient=recipient, email=recipient.email,
+                subject=f"Leave digest: {len(held)} update(s)", body=_digest_body(held),
+                dedup_key=f'digest:{recipient_id}:{last_id}',
+            ))
+        watermark = DigestWatermark(pk=recipient.watermark_id, recipient_id=recipient_id,
+                                    last_notification_id=max(last_id, recipient.watermark or 0), last_sent_at=now)
+        (watermarks if recipient.watermark_id else new_watermarks).append(watermark)
+
+    with transaction.atomic():
+        Notification.objects.bulk_create(digests, ignore_conflicts=True)
+        Notification.objects.filter(pk__in=[item.pk for held in items.values() for item in held], status='Digest') \
+            .update(status='Digested')
+        DigestWatermark.objects.bulk_update(watermarks, ['last_notification_id', 'last_sent_at'])
+        DigestWatermark.objects.bulk_create(new_watermarks)
+    return len(digests)
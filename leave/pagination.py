@@ -0,0 +1,120 @@
+from datetime import date
+from django.db.models import Q
+
+
+def encode_cursor(leave):
+    """Cursor string for a row's position in ``(start_date, id)`` order."""
+    return f'{leave.start_date.isoformat()}_{leave.pk}'
+
+
+def decode_cursor(value):
+    """Parse a cursor from ``encode_cursor``; None when missing or malformed."""
+    try:
+        day, pk = (value or '').split('_')
+        return date.fromisoformat(day), int(pk)
+    except ValueError:
+        return None
+
+
+class KeysetPage:
+    """
+    One page of rows from ``keyset_page``.
+
+    Mirrors the parts of Django's ``Page`` the templates use, but links to the
+    neighbouring pages with cursors instead of page numbers.
+
+    Attributes:
+        object_list (list): Rows on this page, in display order.
+        next_cursor (str | None): Pass as ``?after=`` for the next page.
+        previous_cursor (str | None): Pass as ``?before=`` for the previous page.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def _beyond(cursor, ascending):
+    """Rows strictly after ``cursor`` in ``(start_date, id)`` order, or before it when not ``ascending``."""
+    day, pk = cursor
+    if ascending:
+        return Q(start_date__gte=day) & (Q(start_date__gt=day) | Q(id__gt=pk))
+    return Q(start_date__lte=day) & (Q(start_date__lt=day) | Q(id__lt=pk))
+
+
+def _page_query(queryset, params, per_page, descending):
+    """The single query behind a keyset page, plus the cursors it was built from."""
+    forward = ('-start_date', '-id') if descending else ('start_date', 'id')
+    backward = tuple(field.lstrip('-') for field in forward) if descending else ('-start_date', '-id')
+
+    before = decode_cursor(params.get('before'))
+    if before:
+        return queryset.filter(_beyond(before, ascending=descending)).order_by(*backward)[:per_page + 1], before, None
+    after = decode_cursor(params.get('after'))
+    if after:
+        queryset = queryset.filter(_beyond(after, ascending=not descending))
+    return queryset.order_by(*forward)[:per_page + 1], None, after
+
+
+def _page(rows, per_page, before, after):
+    if before:
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(rows[-1]) if rows else None,
+            previous_cursor=encode_cursor(rows[0]) if has_previous else None,
+        )
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1]) if has_next else None,
+        previous_cursor=encode_cursor(rows[0]) if after and rows else None,
+    )
+
+
+def keyset_page(queryset, params, per_page, descending=False):
+    """
+    Return one page of ``queryset`` using keyset (seek) pagination on ``(start_date, id)``.
+
+    Instead of an OFFSET, each page filters on the last row of the page before
+    it, so a page costs one indexed range scan however deep it is, and no
+    COUNT query is needed.
+
+    Args:
+        queryset (QuerySet): LeaveRequest rows to paginate; its ordering is replaced.
+        params (QueryDict): Request parameters; ``after`` or ``before`` hold a cursor.
+        per_page (int): Rows per page.
+        descending (bool): Show the latest leave first.
+
+    Returns:
+        KeysetPage: The requested page, or the first page when no valid cursor is given.
+    """
+    query, before, after = _page_query(queryset, params, per_page, descending)
+    return _page(list(query), per_page, before, after)
+
+
+async def akeyset_page(queryset, params, per_page, descending=False):
+    """Async version of ``keyset_page``, for async views."""
+    query, before, after = _page_query(queryset, params, per_page, descending)
+    return _page([row async for row in query], per_page, before, after)
@@ -0,0 +1,169 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+from django.conf import settings
+
+DEFAULT_WINDOW = 1000
+DEFAULT_FLUSH_EVERY = 100
+DEFAULT_MAX_AGE = 24 * 3600
+TOP_DUPLICATES = 5
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values``; None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+class PerfStats:
+    """
+    Rolling, in-memory per-view aggregate of request timings.
+
+    Each view keeps the last ``window`` samples of (wall ms, query count, SQL ms)
+    plus a count of duplicated SQL statements seen in those same requests. Snapshots
+    are written to ``LEAVE_PERF_STATS_DIR`` every ``flush_every`` requests so
+    the ``perfstats`` command can merge the figures of every worker process.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, flush_every=DEFAULT_FLUSH_EVERY, directory=None):
+        self.window = window
+        self.flush_every = flush_every
+        self.directory = Path(directory) if directory else None
+        self.samples = {}
+        self.duplicates = {}
+        self._duplicated = {}
+        self._recorded = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            window=getattr(settings, 'LEAVE_PERF_STATS_WINDOW', DEFAULT_WINDOW),
+            flush_every=getattr(settings, 'LEAVE_PERF_STATS_FLUSH_EVERY', DEFAULT_FLUSH_EVERY),
+            directory=getattr(settings, 'LEAVE_PERF_STATS_DIR', None),
+        )
+
+    def record(self, view, wall_ms, queries, sql_ms, duplicated=()):
+        """Add one request's figures to the aggregate for ``view``."""
+        with self._lock:
+            samples = self.samples.get(view)
+            if samples is None:
+                samples = self.samples[view] = deque(maxlen=self.window)
+                self.duplicates[view] = Counter()
+                self._duplicated[view] = deque(maxlen=self.window)
+            counter, recent = self.duplicates[view], self._duplicated[view]
+            if len(recent) == recent.maxlen:
+                # The oldest request leaves the window; so do its duplicates.
+                evicted = recent[0]
+                counter.subtract(evicted)
+                for sql in evicted:
+                    if counter[sql] <= 0:
+                        del counter[sql]
+            samples.append((wall_ms, queries, sql_ms))
+            recent.append(tuple(duplicated))
+            counter.update(duplicated)
+            self._recorded += 1
+            flush = self.directory is not None and self._recorded % self.flush_every == 0
+        if flush:
+            self.flush()
+
+    def snapshot(self):
+        """Return a JSON-serializable copy of the aggregate."""
+        with self._lock:
+            return {
+                view: {
+                    'samples': list(samples),
+                    'duplicates': dict(self.duplicates[view].most_common(TOP_DUPLICATES)),
+                }
+                for view, samples in self.samples.items()
+            }
+
+    def flush(self):
+        """Write this process's snapshot to ``<directory>/<pid>.json``."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        target = self.directory / f'{os.getpid()}.json'
+        temporary = target.with_suffix('.tmp')
+        temporary.write_text(json.dumps(self.snapshot()))
+        temporary.replace(target)
+
+    def flush_pending(self):
+        """Write the snapshot if requests were recorded since the last one; runs at process exit."""
+        with self._lock:
+            pending = self.directory is not None and self._recorded % self.flush_every != 0
+        if pending:
+            self.flush()
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+            self.duplicates.clear()
+            self._duplicated.clear()
+            self._recorded = 0
+
+
+def summarize(snapshots):
+    """
+    Merge snapshots and compute latency percentiles per view.
+
+    Args:
+        snapshots (Iterable[dict]): Results of ``PerfStats.snapshot()``.
+
+    Returns:
+        dict: View -> requests, p50/p95/p99 wall ms, average queries and SQL ms, top duplicates.
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for view, data in snapshot.items():
+            entry = merged.setdefault(view, {'samples': [], 'duplicates': Counter()})
+            entry['samples'].extend(data['samples'])
+            entry['duplicates'].update(data['duplicates'])
+
+    summary = {}
+    for view, entry in sorted(merged.items()):
+        samples = entry['samples']
+        wall = [sample[0] for sample in samples]
+        summary[view] = {
+            'requests': len(samples),
+            'p50_ms': percentile(wall, 50),
+            'p95_ms': percentile(wall, 95),
+            'p99_ms': percentile(wall, 99),
+            'avg_queries': sum(sample[1] for sample in samples) / len(samples),
+            'avg_sql_ms': sum(sample[2] for sample in samples) / len(samples),
+            'duplicates': dict(entry['duplicates'].most_common(TOP_DUPLICATES)),
+        }
+    return summary
+
+
+def load_snapshots(directory, max_age=DEFAULT_MAX_AGE):
+    """
+    Read the worker snapshots written under ``directory``.
+
+    Snapshots not written for ``max_age`` seconds belong to workers that have
+    exited (or are idle), so they are deleted instead of being merged forever.
+    """
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    cutoff = time.time() - max_age
+    snapshots = []
+    for path in sorted(directory.glob('*.json')):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                continue
+            snapshots.append(json.loads(path.read_text()))
+        except FileNotFoundError:
+            continue
+    return snapshots
+
+
+perf_stats = PerfStats.from_settings()
+# The last partial window would otherwise be lost when a worker shuts down.
+atexit.register(perf_stats.flush_pending)
@@ -0,0 +1,75 @@
+from django.db.models import Count
+from .models import LeaveRequest
+
+# Rows fetched per round trip while streaming an export; on PostgreSQL this is
+# the server-side cursor's fetch size.
+EXPORT_CHUNK_SIZE = 2000
+
+APPROVED_LEAVE_HEADER = ['Employee', 'Department', 'Leave Type', 'Start Date', 'End Date', 'Reason', 'Comments', 'Approved By']
+DEPARTMENT_SUMMARY_HEADER = ['Department', 'Leave Type', 'Total Leaves']
+
+
+def approved_leaves(start_date=None, end_date=None, department=None):
+    """
+    Approved leave requests, optionally limited to a date range and department.
+
+    A leave matches the range when any of its days fall inside it.
+
+    Returns:
+        QuerySet: Approved LeaveRequest objects with user, leave type and approver joined, oldest first.
+    """
+    leaves = LeaveRequest.objects.filter(status='Approved')
+    if start_date:
+        leaves = leaves.filter(end_date__gte=start_date)
+    if end_date:
+        leaves = leaves.filter(start_date__lte=end_date)
+    if department:
+        leaves = leaves.filter(user__department=department)
+    return leaves.select_related('user', 'leave_type', 'approver').only(
+        'start_date', 'end_date', 'reason', 'comments',
+        'user__username', 'user__department', 'leave_type__name', 'approver__username',
+    ).order_by('start_date', 'id')
+
+
+def department_summary(start_date=None, end_date=None, department=None):
+    """
+    Approved leave counts per department and leave type, with the same filters as ``approved_leaves``.
+
+    Returns:
+        QuerySet: Dicts with ``user__department``, ``leave_type__name`` and ``total``.
+    """
+    return approved_leaves(start_date, end_date, department).order_by() \
+        .values('user__department', 'leave_type__name') \
+        .annotate(total=Count('id')) \
+        .order_by('user__department', 'leave_type__name')
+
+
+def approved_leave_row(leave):
+    """Export row for one leave from ``approved_leaves``."""
+    return [
+        leave.user.username,
+        leave.user.department or '',
+        leave.leave_type.name,
+        leave.start_date.isoformat(),
+        leave.end_date.isoformat(),
+        leave.reason,
+        leave.comments or '',
+        leave.approver.username if leave.approver else '',
+    ]
+
+
+def department_summary_row(row):
+    """Export row for one department and leave type from ``department_summary``."""
+    return [row['user__department'] or '', row['leave_type__name'], row['total']]
+
+
+def export_rows(queryset, to_row):
+    """Yield ``to_row(item)`` for every item of ``queryset``, reading it in chunks."""
+    for item in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield to_row(item)
+
+
+async def aexport_rows(queryset, to_row):
+    """Async version of ``export_rows``."""
+    async for item in queryset.aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield to_row(item)
@@ -0,0 +1,379 @@
+from dataclasses import dataclass, field
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Subquery
+from .absence import clear_absence, record_absence, record_absences
+from .accrual import accrue_balances
+from .aggregates import add_leaves_to_aggregates, add_to_aggregates
+from .capacity import add_leaves_to_occupancy, add_to_occupancy, over_capacity
+from .helpers import get_active_managers, reviewable_by
+from .ledger import debit_leave, post_entries, reverse_leave
+from .models import BalanceEntry, LeaveBalance, LeaveRequest, User
+from .notifications import (notify_leave_approved, notify_leave_cancelled, notify_leave_rejected,
+                            notify_leave_submitted, notify_leaves_reviewed)
+from .versions import APPROVED_LEAVES_VERSION, bump_user_versions, bump_versions
+from .workcalendar import get_working_day_calendar
+
+# Created by migration 0013: an exclusion constraint on PostgreSQL, triggers on SQLite.
+OVERLAP_CONSTRAINT = 'leave_request_no_overlap'
+
+
+@dataclass
+class LeaveApplication:
+    """
+    Result of validating a leave application.
+
+    Attributes:
+        working_days (int): Working days the leave would consume.
+        balance (LeaveBalance | None): The employee's accrued balance for the leave type.
+        errors (list[str]): Every reason the application cannot be accepted.
+        warnings (list[str]): Notes that do not block the application.
+    """
+    working_days: int = 0
+    balance: object = None
+    errors: list = field(default_factory=list)
+    warnings: list = field(default_factory=list)
+
+    @property
+    def is_valid(self):
+        return not self.errors
+
+
+def validate_leave_application(user, leave_type, start_date, end_date):
+    """
+    Run the leave application checks and collect all failures at once.
+
+    The balance comes back from one query; Sundays and holidays come from the
+    working-day calendar, which costs at most one more query when the year is
+    not compiled yet. Employees with a department are checked against its
+    CapacityRule with one range query over the DepartmentOccupancy counters;
+    a blocking rule makes a full day an error, otherwise a warning. Overlaps with other leaves are not checked here: the
+    database rejects them when the request is inserted (see ``overlap_errors``).
+
+    Args:
+        user (User): Employee applying for leave.
+        leave_type (LeaveType): Requested leave type.
+        start_date (date): First day of the leave.
+        end_date (date): Last day of the leave.
+
+    Returns:
+        LeaveApplication: Working days, balance, errors and warnings.
+    """
+    application = LeaveApplication()
+    calendar = get_working_day_calendar()
+    application.working_days = calendar.count_working_days(start_date, end_date)
+
+    balances = LeaveBalance.objects.filter(user=OuterRef('pk'), leave_type=leave_type)
+    row = User.objects.filter(pk=user.pk).annotate(
+        balance_id=Subquery(balances.values('pk')[:1]),
+        balance_value=Subquery(balances.values('balance')[:1]),
+        balance_accrued=Subquery(balances.values('last_accrued')[:1]),
+    ).values('balance_id', 'balance_value', 'balance_accrued').get()
+
+    if row['balance_id'] is not None:
+        balance = LeaveBalance(
+            pk=row['balance_id'], user=user, leave_type=leave_type,
+            balance=row['balance_value'], last_accrued=row['balance_accrued'],
+        )
+        application.balance = accrue_balances([balance])[0]
+
+    sundays_in_period = calendar.weekend_days(start_date, end_date)
+    if sundays_in_period:
+        application.errors.append(f"Cannot apply leave on Sundays: {', '.join(str(s) for s in sundays_in_period)}.")
+
+    if application.balance is None or application.balance.balance < application.working_days:
+        application.errors.append(f'Insufficient leave balance (working days: {application.working_days}).')
+
+    holidays_in_period = len(calendar.holidays(start_date, end_date))
+    if holidays_in_period > 0:
+        application.warnings.append(f"Note: {holidays_in_period} holidays in your leave period (not counted as leave days).")
+
+    if user.department:
+        full_days = over_capacity(user.department, start_date, end_date)
+        if full_days:
+            _, _, max_absent, blocking = full_days[0]
+            message = (f"{user.department} already has the maximum of {max_absent} on leave on "
+                       f"{', '.join(str(row[0]) for row in full_days)}.")
+            (application.errors if blocking else application.warnings).append(message)
+
+    return application
+
+
+def overlap_errors(user, start_date, end_date):
+    """
+    Explain which of the user's active leaves overlap the period, with one query.
+
+    Only run once an application has already failed, so successful submissions
+    never pay for it.
+
+    Returns:
+        list[str]: One message per overlapping status (approved first).
+    """
+    statuses = set(
+        LeaveRequest.objects.filter(user=user, status__in=LeaveRequest.ACTIVE_STATUSES,
+                                    start_date__lte=end_date, end_date__gte=start_date)
+        .values_list('status', flat=True).distinct()
+    )
+    errors = []
+    if 'Approved' in statuses:
+        errors.append("You already have approved leave during this period.")
+    if 'Pending' in statuses:
+        errors.append("You have a pending leave during this period.")
+    return errors
+
+
+def submit_leave_application(form, user):
+    """
+    Validate and save a leave request from a bound, valid LeaveRequestForm.
+
+    Validation, the insert and the notifications to the managers who can
+    approve the leave run in one transaction. The insert is attempted once;
+    an overlap with another active leave is rejected by the database
+    constraint and reported like the other validation errors.
+
+    Args:
+        form (LeaveRequestForm): Valid form holding leave_type, start_date and end_date.
+        user (User): Employee applying for leave.
+
+    Returns:
+        tuple: ``(LeaveApplication, LeaveRequest | None)``; the request is None when validation failed.
+    """
+    data = form.cleaned_data
+    application = LeaveApplication()
+    try:
+        with transaction.atomic():
+            application = validate_leave_application(user, data['leave_type'], data['start_date'], data['end_date'])
+            if not application.is_valid:
+                application.errors += overlap_errors(user, data['start_date'], data['end_date'])
+                return application, None
+
+            leave = form.save(commit=False)
+            leave.user = user
+            leave.status = 'Pending'
+            leave.save()
+            notify_leave_submitted(leave, get_active_managers(leave.start_date), application.working_days)
+    except IntegrityError as exc:
+        if OVERLAP_CONSTRAINT not in str(exc):
+            raise
+        application.errors += overlap_errors(user, data['start_date'], data['end_date']) or [
+            "You already have leave during this period."
+        ]
+        return application, None
+    return application, leave
+
+
+@dataclass
+class ReviewResult:
+    """
+    Outcome of reviewing one leave, on its own or in a bulk approval or rejection.
+
+    Attributes:
+        leave_id (int): ID of the leave request.
+        ok (bool): True if the leave was approved or rejected.
+        error (str): Why it was not, when ``ok`` is False.
+        working_days (int): Working days deducted, for approvals.
+    """
+    leave_id: int
+    ok: bool = False
+    error: str = ''
+    working_days: int = 0
+
+
+def _accrue_balances_of(leaves):
+    """
+    Apply pending accrual to the balances the leaves post to, before posting.
+
+    A yearly reset applied lazily on a later read replaces the stored balance
+    with the quota, which would wipe out a posting made in the new year before
+    that read; accruing first makes the posting count against the new year.
+
+    Returns:
+        set: ``(user_id, leave_type_id)`` of every balance that exists.
+    """
+    balances = accrue_balances(LeaveBalance.objects.filter(
+        user__in={leave.user_id for leave in leaves}, leave_type__in={leave.leave_type_id for leave in leaves},
+    ).select_related('leave_type'))
+    return {(balance.user_id, balance.leave_type_id) for balance in balances}
+
+
+def approve_leave(leave, approver, comments=''):
+    """
+    Approve a leave request, deduct its working days from the employee's balance and notify the employee.
+
+    The status change, the 'Debit' ledger entry, the DailyAbsence rows and the
+    LeaveAggregate totals are written in one transaction. The status change is
+    a conditional ``UPDATE`` from 'Pending', so when two managers approve the
+    same request at once only the one that moved it debits the balance, and a
+    rejected or cancelled request is not approved again. Pending accrual is
+    applied to the balance before the debit is posted, and the approval is
+    rolled back when the employee has no balance for the leave type.
+
+    Args:
+        leave (LeaveRequest): Request to approve.
+        approver (User): Manager approving it.
+        comments (str): Manager comments.
+
+    Returns:
+        ReviewResult: ``working_days`` deducted, or the error when the request was not pending or has no balance.
+    """
+    result = ReviewResult(leave.pk)
+    total_days = get_working_day_calendar().count_working_days(leave.start_date, leave.end_date)
+    with transaction.atomic():
+        if not LeaveRequest.objects.filter(pk=leave.pk, status='Pending') \
+                .update(status='Approved', approver=approver, comments=comments):
+            status = LeaveRequest.objects.filter(pk=leave.pk).values_list('status', flat=True).first()
+            result.error = f'Leave request is already {status.lower()}.' if status else 'Leave request not found.'
+            return result
+        leave.status, leave.approver, leave.comments = 'Approved', approver, comments
+        if (leave.user_id, leave.leave_type_id) not in _accrue_balances_of([leave]):
+            result.error = f'{leave.user.username} has no {leave.leave_type.name} balance.'
+            transaction.set_rollback(True)
+            return result
+        bump_user_versions([leave.user_id])
+        bump_versions([APPROVED_LEAVES_VERSION])
+        debit_leave(leave, total_days)
+        record_absence(leave)
+        add_to_aggregates(leave, total_days)
+        add_to_occupancy(leave)
+        notify_leave_approved(leave, total_days)
+    result.ok, result.working_days = True, total_days
+    return result
+
+
+def _withdraw_approval(leave, **fields):
+    """
+    Move a leave out of 'Approved' with a conditional ``UPDATE`` and undo what approving it wrote.
+
+    Returns:
+        bool: True if the leave was approved and has been reversed.
+    """
+    if not LeaveRequest.objects.filter(pk=leave.pk, status='Approved').update(**fields):
+        return False
+    bump_versions([APPROVED_LEAVES_VERSION])
+    total_days = get_working_day_calendar().count_working_days(leave.start_date, leave.end_date)
+    _accrue_balances_of([leave])
+    reverse_leave(leave, total_days)
+    clear_absence(leave)
+    add_to_aggregates(leave, total_days, sign=-1)
+    add_to_occupancy(leave, sign=-1)
+    return True
+
+
+def reject_leave(leave, approver, comments=''):
+    """
+    Reject a leave request and notify the employee.
+
+    An already approved leave also has its working days given back with a
+    'Reversal' ledger entry, loses its DailyAbsence rows and is taken out of
+    the LeaveAggregate totals.
+
+    Args:
+        leave (LeaveRequest): Request to reject.
+        approver (User): Manager rejecting it.
+        comments (str): Reason given by the manager.
+    """
+    fields = {'status': 'Rejected', 'approver': approver, 'comments': comments}
+    with transaction.atomic():
+        if not _withdraw_approval(leave, **fields):
+            LeaveRequest.objects.filter(pk=leave.pk).update(**fields)
+        bump_user_versions([leave.user_id])
+        for name, value in fields.items():
+            setattr(leave, name, value)
+        notify_leave_rejected(leave)
+
+
+def cancel_leave(leave, reason=''):
+    """
+    Cancel a leave request on the employee's behalf.
+
+    An approved leave has its working days restored with a 'Reversal' ledger
+    entry, its DailyAbsence rows removed and its LeaveAggregate totals taken
+    back, in the same transaction as the status change and the notifications
+    to the currently active managers.
+
+    Args:
+        leave (LeaveRequest): Pending or approved request to cancel.
+        reason (str): Reason given by the employee.
+    """
+    fields = {'status': 'Cancelled', 'comments': f"Cancelled by employee. Reason: {reason}"}
+    with transaction.atomic():
+        if not _withdraw_approval(leave, **fields):
+            LeaveRequest.objects.filter(pk=leave.pk).update(**fields)
+        bump_user_versions([leave.user_id])
+        for name, value in fields.items():
+            setattr(leave, name, value)
+        notify_leave_cancelled(leave, get_active_managers(), reason)
+
+
+def review_leaves(leave_ids, reviewer, approve, comments=''):
+    """
+    Approve or reject many pending leave requests at once.
+
+    One locking query loads the leaves and, per leave, whether ``reviewer``
+    may approve it (the delegation windows come from the cached index). Working
+    days come from the compiled calendar, so the holidays are fetched at most
+    once. Approvals first apply pending accrual to the balances they debit.
+    The status changes, the ledger debits, the DailyAbsence rows, the
+    LeaveAggregate totals and the notification emails are then written with
+    one statement each (one balance update per employee and leave type), in a
+    single transaction. A leave that cannot be reviewed does not stop the others.
+
+    Args:
+        leave_ids (Iterable[int]): Leave requests to review.
+        reviewer (User): Manager or delegate reviewing them.
+        approve (bool): True to approve, False to reject.
+        comments (str): Comments stored on every reviewed leave.
+
+    Returns:
+        list[ReviewResult]: One result per distinct ID, in the order given.
+    """
+    results = {pk: ReviewResult(pk) for pk in leave_ids}
+    calendar = get_working_day_calendar()
+    with transaction.atomic():
+        leaves = {
+            leave.pk: leave for leave in LeaveRequest.objects.select_for_update(of=('self',))
+            .filter(pk__in=list(results)).select_related('user', 'leave_type')
+            .annotate(can_review=reviewable_by(reviewer))
+        }
+        accepted = []
+        for pk, result in results.items():
+            leave = leaves.get(pk)
+            if leave is None:
+                result.error = 'Leave request not found.'
+            elif leave.status != 'Pending':
+                result.error = f'Leave request is already {leave.status.lower()}.'
+            elif not leave.can_review:
+                result.error = 'You are not authorized to review this leave.'
+            else:
+                accepted.append((leave, calendar.count_working_days(leave.start_date, leave.end_date)))
+
+        if approve and accepted:
+            with_balance = _accrue_balances_of([leave for leave, _ in accepted])
+            for leave, _ in accepted:
+                if (leave.user_id, leave.leave_type_id) not in with_balance:
+                    results[leave.pk].error = f'{leave.user.username} has no {leave.leave_type.name} balance.'
+            accepted = [(leave, days) for leave, days in accepted if not results[leave.pk].error]
+        if not accepted:
+            return list(results.values())
+
+        status = 'Approved' if approve else 'Rejected'
+        LeaveRequest.objects.filter(pk__in=[leave.pk for leave, _ in accepted]) \
+            .update(status=status, approver=reviewer, comments=comments)
+        bump_user_versions(leave.user_id for leave, _ in accepted)
+        for leave, working_days in accepted:
+            leave.status, leave.approver, leave.comments = status, reviewer, comments
+            result = results[leave.pk]
+            result.ok = True
+            if approve:
+                result.working_days = working_days
+        if approve:
+            bump_versions([APPROVED_LEAVES_VERSION])
+            post_entries([
+                BalanceEntry(user_id=leave.user_id, leave_type_id=leave.leave_type_id, kind='Debit',
+                             amount=-working_days, leave=leave)
+                for leave, working_days in accepted
+            ])
+            record_absences([leave for leave, _ in accepted])
+            add_leaves_to_aggregates(accepted)
+            add_leaves_to_occupancy(leave for leave, _ in accepted)
+        notify_leaves_reviewed(accepted, approve)
+    return list(results.values())
@@ -0,0 +1,109 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from .aggregates import move_user_aggregates
+from .capacity import move_user_occupancy
+from .helpers import invalidate_delegation_index
+from .models import BalanceEntry, DailyAbsence, Delegation, Holiday, LeaveBalance, LeaveRequest, User
+from .versions import (APPROVED_LEAVES_VERSION, DELEGATIONS_VERSION, HOLIDAYS_VERSION, bump_user_versions,
+                       bump_versions)
+from .workcalendar import invalidate_working_day_calendar
+
+
+def _invalidate_delegations():
+    # Drop the index now and again once the write is visible to other
+    # connections, so an index rebuilt mid-transaction is not kept.
+    invalidate_delegation_index()
+    transaction.on_commit(invalidate_delegation_index)
+    bump_versions([DELEGATIONS_VERSION])
+
+
+@receiver([post_save, post_delete], sender=Delegation)
+def delegation_changed(sender, **kwargs):
+    """Invalidate the delegation index whenever a Delegation row changes."""
+    _invalidate_delegations()
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, update_fields=None, **kwargs):
+    """Invalidate the delegation index, and the reports showing user names and departments, when a user changes."""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    _invalidate_delegations()
+    bump_versions([APPROVED_LEAVES_VERSION])
+
+
+@receiver(pre_save, sender=User)
+def remember_department(sender, instance, update_fields=None, **kwargs):
+    """Note the stored department of an existing user before a save that may change it."""
+    if instance.pk is None or (update_fields is not None and 'department' not in update_fields):
+        return
+    instance._stored_department = User.objects.filter(pk=instance.pk).values_list('department', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_department_changed(sender, instance, created, **kwargs):
+    """Move the user's DailyAbsence rows, LeaveAggregate totals and DepartmentOccupancy counts to their new department."""
+    if created or not hasattr(instance, '_stored_department'):
+        return
+    old_department = instance.__dict__.pop('_stored_department')
+    if (old_department or '') == (instance.department or ''):
+        return
+    with transaction.atomic():
+        DailyAbsence.objects.filter(user=instance).update(department=instance.department)
+        move_user_aggregates(instance, old_department)
+        move_user_occupancy(instance, old_department)
+
+
+@receiver(pre_save, sender=LeaveBalance)
+def remember_balance(sender, instance, update_fields=None, **kwargs):
+    """Note the stored balance before a ``save()`` that may change it, e.g. an edit in the admin."""
+    if update_fields is not None and 'balance' not in update_fields:
+        return
+    stored = None
+    if instance.pk is not None:
+        stored = LeaveBalance.objects.filter(pk=instance.pk).values_list('balance', flat=True).first()
+    instance._stored_balance = stored or 0
+
+
+@receiver(post_save, sender=LeaveBalance)
+def balance_saved(sender, instance, created, **kwargs):
+    """Record a ``save()`` that changed a balance in the ledger, as 'Opening' or 'Adjustment'."""
+    if not hasattr(instance, '_stored_balance'):
+        return
+    amount = instance.balance - instance.__dict__.pop('_stored_balance')
+    if amount:
+        BalanceEntry.objects.create(user_id=instance.user_id, leave_type_id=instance.leave_type_id,
+                                    kind='Opening' if created else 'Adjustment', amount=amount)
+
+
+@receiver([post_save, post_delete], sender=LeaveBalance)
+@receiver([post_save, post_delete], sender=LeaveRequest)
+def user_leave_data_changed(sender, instance, **kwargs):
+    """
+    Bump the owner's version so their cached balance cards and history table are rendered again.
+
+    Set-based writes (``update()``, ``bulk_create()``) send no signals; the
+    services and the ledger bump the versions themselves.
+    """
+    bump_user_versions([instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=LeaveRequest)
+def leave_request_changed(sender, instance, created=None, **kwargs):
+    """
+    Bump the approved-leaves version when an approved leave is saved or deleted, or an existing leave is edited.
+
+    New pending requests, the bulk of the writes, leave it alone.
+    """
+    # ``created`` is False for an update and None for a delete.
+    if instance.status == 'Approved' or created is False:
+        bump_versions([APPROVED_LEAVES_VERSION])
+
+
+@receiver([post_save, post_delete], sender=Holiday)
+def holiday_changed(sender, **kwargs):
+    """Invalidate the compiled working-day calendar and the fragments showing working days when a Holiday row changes."""
+    invalidate_working_day_calendar()
+    transaction.on_commit(invalidate_working_day_calendar)
+    bump_versions([HOLIDAYS_VERSION])
@@ -0,0 +1,191 @@
+import csv
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+# Characters XML 1.0 cannot carry; spreadsheet apps reject files containing them.
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Leading characters that make spreadsheet apps treat a cell as a formula.
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _safe_cell(value):
+    """Quote text that a spreadsheet would run as a formula; other values pass through."""
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class _Echo:
+    """File-like object whose write() hands the written value straight back."""
+
+    def write(self, value):
+        return value
+
+
+class _Drain:
+    """Write-only, unseekable sink collecting bytes until they are drained."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_csv(header, rows):
+    """
+    Yield CSV lines for ``header`` followed by ``rows``, one line at a time.
+
+    Text starting like a formula is prefixed with ``'``, so a value typed by an
+    employee cannot run in the spreadsheet of the manager opening the file.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([_safe_cell(value) for value in row])
+
+
+async def astream_csv(header, rows):
+    """Async version of ``stream_csv``, reading ``rows`` from an async iterator."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    async for row in rows:
+        yield writer.writerow([_safe_cell(value) for value in row])
+
+
+def _column(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _xlsx_row(number, values):
+    # Inline strings are never evaluated as formulas, so text is written unchanged.
+    cells = []
+    for index, value in enumerate(values):
+        ref = f'{_column(index)}{number}'
+        if isinstance(value, bool) or value is None:
+            value = '' if value is None else str(value)
+        if isinstance(value, (int, float)):
+            cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+        else:
+            text = escape(_ILLEGAL_XML.sub('', str(value)))
+            cells.append(f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+class _XlsxStream:
+    """
+    Workbook with one sheet, written row by row into a zip stream.
+
+    ``add`` returns the compressed bytes gathered every ``rows_per_chunk``
+    rows and ``close`` the rest, so memory does not depend on the number of rows.
+    """
+
+    def __init__(self, sheet_name, header, rows_per_chunk):
+        self.sink = _Drain()
+        self.rows_per_chunk = rows_per_chunk
+        self.number = 1
+        self.workbook = zipfile.ZipFile(self.sink, 'w', compression=zipfile.ZIP_DEFLATED)
+        self.workbook.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        self.workbook.writestr('_rels/.rels', _ROOT_RELS)
+        self.workbook.writestr('xl/workbook.xml', _WORKBOOK.format(name=escape(sheet_name[:31])))
+        self.workbook.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        self.sheet = self.workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True)
+        self.sheet.write(
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        )
+        self.sheet.write(_xlsx_row(1, header).encode())
+
+    def add(self, row):
+        self.number += 1
+        self.sheet.write(_xlsx_row(self.number, row).encode())
+        if self.number % self.rows_per_chunk == 0:
+            return self.sink.drain()
+        return b''
+
+    def close(self):
+        self.sheet.write(b'</sheetData></worksheet>')
+        self.sheet.close()
+        self.workbook.close()
+        return self.sink.drain()
+
+
+def stream_xlsx(sheet_name, header, rows, rows_per_chunk=500):
+    """
+    Yield an .xlsx workbook with one sheet, built while ``rows`` are consumed.
+
+    The worksheet XML is written row by row into a zip stream and the
+    compressed bytes are handed out every ``rows_per_chunk`` rows, so memory
+    does not depend on the number of rows. Strings are stored inline, which
+    spreadsheets never evaluate as formulas; dates and other values are
+    written as text.
+    """
+    workbook = _XlsxStream(sheet_name, header, rows_per_chunk)
+    for row in rows:
+        data = workbook.add(row)
+        if data:
+            yield data
+    yield workbook.close()
+
+
+async def astream_xlsx(sheet_name, header, rows, rows_per_chunk=500):
+    """Async version of ``stream_xlsx``, reading ``rows`` from an async iterator."""
+    workbook = _XlsxStream(sheet_name, header, rows_per_chunk)
+    async for row in rows:
+        data = workbook.add(row)
+        if data:
+            yield data
+    yield workbook.close()
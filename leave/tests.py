@@ -1,10 +1,52 @@
-from django.test import TestCase
-from datetime import date, timedelta
-from leave.helpers import get_working_days
-from leave.models import Holiday, LeaveRequest, LeaveType, User
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from datetime import date, datetime, timedelta
+from django.urls import include, path, reverse
+from leave.helpers import (get_working_days, count_working_days, get_active_managers, get_approval_queue,
+                           get_delegation_index, invalidate_delegation_index)
+from leave.workcalendar import get_working_day_calendar, invalidate_working_day_calendar
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+import unittest
+import warnings
+import zipfile
+from unittest import mock
+from io import BytesIO, StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import RequestFactory, override_settings
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from leave.middleware import PerfStatsMiddleware
+from leave import views as leave_views
+from leave.accrual import credit_monthly, credit_yearly, get_balance, get_balances, year_end_rollover
+from leave.perfstats import PerfStats, load_snapshots, perf_stats, percentile, summarize
+from leave.pagination import keyset_page
+from leave.aggregates import department_totals
+from leave.exports import history_version, purge_finished_exports
+from leave.ledger import reconcile_balances
+from leave.services import approve_leave, cancel_leave, reject_leave, review_leaves
+from leave.versions import DELEGATIONS_VERSION, HOLIDAYS_VERSION, bump_versions
+from leave.notifications import MAX_ATTEMPTS, build_digests, deliver_notifications, queue_notifications
+from django.core.cache import cache
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.utils import timezone
+from leave.models import (Holiday, LeaveRequest, LeaveType, User, Delegation, LeaveBalance, AccrualRun, ExportJob,
+                          DailyAbsence, LeaveAggregate, Notification, DigestWatermark, BalanceEntry,
+                          CapacityRule, DepartmentOccupancy)
 
 class LeaveCalculationTests(TestCase):
 
+    def setUp(self):
+        invalidate_working_day_calendar()
+
     def test_get_working_days_no_holidays(self):
         start = date(2025, 10, 1)
         end = date(2025, 10, 3)
@@ -38,4 +80,1589 @@ class LeaveCalculationTests(TestCase):
             end_date=date(2025, 10, 3),
             reason='Test'
         )
-        self.assertEqual(req.total_days, 3)
\ No newline at end of file
+        self.assertEqual(req.total_days, 3)
+
+
+class DelegationIndexTests(TestCase):
+
+    def setUp(self):
+        invalidate_delegation_index()
+        self.boss = User.objects.create_user(username='boss', password='x', is_manager=True)
+        self.lead = User.objects.create_user(username='lead', password='x', is_manager=True)
+        self.deputy = User.objects.create_user(username='deputy', password='x', is_employee=True)
+        Delegation.objects.create(manager=self.boss, delegate=self.deputy,
+                                  start_date=date(2025, 10, 10), end_date=date(2025, 10, 20))
+
+    def test_delegate_replaces_manager_inside_window(self):
+        approvers = get_active_managers(date(2025, 10, 15))
+        self.assertCountEqual(approvers, [self.deputy, self.lead])
+
+    def test_manager_outside_window(self):
+        self.assertCountEqual(get_active_managers(date(2025, 10, 21)), [self.boss, self.lead])
+        self.assertCountEqual(get_active_managers(date(2025, 10, 9)), [self.boss, self.lead])
+
+    def test_overlapping_delegations_lowest_id_wins(self):
+        other = User.objects.create_user(username='other', password='x', is_employee=True)
+        Delegation.objects.create(manager=self.boss, delegate=other,
+                                  start_date=date(2025, 10, 15), end_date=date(2025, 10, 25))
+        self.assertIn(self.deputy, get_active_managers(date(2025, 10, 18)))
+        self.assertIn(other, get_active_managers(date(2025, 10, 22)))
+
+    def test_warm_lookups_cost_no_queries(self):
+        with self.assertNumQueries(2):
+            get_active_managers(date(2025, 10, 15))
+        with self.assertNumQueries(0):
+            get_active_managers(date(2025, 10, 15))
+            get_active_managers(date(2025, 11, 1))
+
+    def test_delegation_changes_invalidate_index(self):
+        get_active_managers(date(2025, 10, 15))
+        Delegation.objects.all().delete()
+        self.assertCountEqual(get_active_managers(date(2025, 10, 15)), [self.boss, self.lead])
+
+
+class ApprovalQueueTests(TestCase):
+
+    def setUp(self):
+        invalidate_delegation_index()
+        self.boss = User.objects.create_user(username='boss', password='x', is_manager=True)
+        self.lead = User.objects.create_user(username='lead', password='x', is_manager=True)
+        self.deputy = User.objects.create_user(username='deputy', password='x', is_employee=True)
+        self.employee = User.objects.create_user(username='emp', password='x', is_employee=True)
+        self.leave_type = LeaveType.objects.create(name='Annual')
+        Delegation.objects.create(manager=self.boss, delegate=self.deputy,
+                                  start_date=date(2025, 10, 10), end_date=date(2025, 10, 20))
+        self.inside = self._leave(date(2025, 10, 14))
+        self.outside = self._leave(date(2025, 11, 3))
+
+    def _leave(self, start, status='Pending'):
+        return LeaveRequest.objects.create(user=self.employee, leave_type=self.leave_type,
+                                           start_date=start, end_date=start, reason='r', status=status)
+
+    def test_queue_matches_active_managers(self):
+        self._leave(date(2025, 12, 1), status='Approved')
+        self.assertEqual(list(get_approval_queue(self.boss)), [self.outside])
+        self.assertEqual(list(get_approval_queue(self.deputy)), [self.inside])
+        self.assertEqual(list(get_approval_queue(self.lead)), [self.inside, self.outside])
+        for leave in LeaveRequest.objects.filter(status='Pending'):
+            for user in (self.boss, self.lead, self.deputy, self.employee):
+                self.assertEqual(leave in get_approval_queue(user),
+                                 user in get_active_managers(leave.start_date))
+
+    def test_dashboard_query_count_does_not_grow_with_backlog(self):
+        self.client.force_login(self.lead)
+        self.client.get(reverse('manager_dashboard'))
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('manager_dashboard'))
+        for offset in range(40):
+            self._leave(date(2025, 11, 4) + timedelta(days=offset))
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse('manager_dashboard'))
+        self.assertEqual(len(small), len(large))
+        self.assertTrue(response.context['page_obj'].has_next())
+
+
+class WorkingDayCalendarTests(TestCase):
+
+    def setUp(self):
+        invalidate_working_day_calendar()
+        Holiday.objects.create(date=date(2025, 12, 25), name='Christmas')
+        Holiday.objects.create(date=date(2026, 1, 1), name='New Year')
+
+    def test_count_matches_day_by_day_definition(self):
+        start = date(2025, 12, 1)
+        for length in (0, 1, 6, 7, 31, 45):
+            end = start + timedelta(days=length)
+            expected = [start + timedelta(days=i) for i in range(length + 1)
+                        if (start + timedelta(days=i)).weekday() != 6
+                        and start + timedelta(days=i) not in (date(2025, 12, 25), date(2026, 1, 1))]
+            self.assertEqual(get_working_days(start, end), expected)
+            self.assertEqual(count_working_days(start, end), len(expected))
+
+    def test_listing_sundays_and_holidays(self):
+        calendar = get_working_day_calendar()
+        self.assertEqual(calendar.weekend_days(date(2025, 12, 1), date(2025, 12, 14)),
+                         [date(2025, 12, 7), date(2025, 12, 14)])
+        self.assertEqual(calendar.holidays(date(2025, 12, 20), date(2026, 1, 5)),
+                         [(date(2025, 12, 25), 'Christmas'), (date(2026, 1, 1), 'New Year')])
+
+    def test_warm_calendar_needs_no_query_and_rebuilds_on_holiday_change(self):
+        with self.assertNumQueries(1):
+            count_working_days(date(2025, 12, 1), date(2026, 1, 31))
+        with self.assertNumQueries(0):
+            self.assertEqual(count_working_days(date(2025, 12, 22), date(2025, 12, 27)), 5)
+        Holiday.objects.create(date=date(2025, 12, 26), name='Boxing Day')
+        self.assertEqual(count_working_days(date(2025, 12, 22), date(2025, 12, 27)), 4)
+
+
+    def test_holiday_change_in_another_process_is_picked_up(self):
+        self.assertEqual(count_working_days(date(2025, 12, 22), date(2025, 12, 27)), 5)
+        # bulk_create sends no signal, like a write made by another worker process.
+        Holiday.objects.bulk_create([Holiday(date=date(2025, 12, 26), name='Boxing Day')])
+        self.assertEqual(count_working_days(date(2025, 12, 22), date(2025, 12, 27)), 5)
+        bump_versions([HOLIDAYS_VERSION])
+        self.assertEqual(count_working_days(date(2025, 12, 22), date(2025, 12, 27)), 4)
+
+
+class AccrualEngineTests(TestCase):
+
+    def setUp(self):
+        self.casual = LeaveType.objects.create(name='Casual', accrual_frequency='Monthly')
+        self.sick = LeaveType.objects.create(name='Sick', annual_quota=10, accrual_frequency='Yearly')
+        self.employees = [User.objects.create_user(username=f'e{i}', password='x', is_employee=True) for i in range(5)]
+        User.objects.create_user(username='m', password='x', is_manager=True)
+        LeaveBalance.objects.create(user=self.employees[0], leave_type=self.casual, balance=4,
+                                    last_accrued=date(2025, 9, 1))
+
+    def test_monthly_credit_creates_missing_rows_and_increments(self):
+        result = credit_monthly(date(2025, 10, 1), chunk_size=2)
+        self.assertEqual((result.employees, result.created, result.updated), (5, 4, 5))
+        balances = dict(LeaveBalance.objects.filter(leave_type=self.casual).values_list('user__username', 'balance'))
+        self.assertEqual(balances, {'e0': 5, 'e1': 1, 'e2': 1, 'e3': 1, 'e4': 1})
+
+    def test_rerun_in_same_period_is_a_noop(self):
+        credit_monthly(date(2025, 10, 1))
+        with self.assertNumQueries(1):
+            self.assertTrue(credit_monthly(date(2025, 10, 1)).skipped)
+        self.assertEqual(LeaveBalance.objects.get(user=self.employees[0], leave_type=self.casual).balance, 5)
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        AccrualRun.objects.create(kind='Monthly', period=date(2025, 10, 1), last_user_id=self.employees[2].pk)
+        result = credit_monthly(date(2025, 10, 15))
+        self.assertEqual(result.employees, 2)
+        self.assertEqual(LeaveBalance.objects.get(user=self.employees[0], leave_type=self.casual).balance, 4)
+
+    def test_yearly_reset_sets_quota(self):
+        LeaveBalance.objects.create(user=self.employees[1], leave_type=self.sick, balance=3,
+                                    last_accrued=date(2025, 6, 1))
+        credit_yearly(date(2026, 1, 1))
+        self.assertEqual(set(LeaveBalance.objects.filter(leave_type=self.sick).values_list('balance', flat=True)), {10})
+
+    def test_dry_run_writes_nothing(self):
+        out = StringIO()
+        call_command('auto_credit_leave', '--dry-run', stdout=out)
+        self.assertIn('5 employees, 4 new balances, 5 balances updated', out.getvalue())
+        self.assertEqual(LeaveBalance.objects.count(), 1)
+        self.assertFalse(AccrualRun.objects.exists())
+
+
+class YearEndRolloverTests(TestCase):
+
+    def setUp(self):
+        self.casual = LeaveType.objects.create(name='Casual', accrual_frequency='Monthly',
+                                               carry_forward_allowed=True, max_carry_forward=5)
+        self.comp = LeaveType.objects.create(name='Comp', accrual_frequency='Monthly')
+        self.sick = LeaveType.objects.create(name='Sick', annual_quota=10, accrual_frequency='Yearly',
+                                             carry_forward_allowed=True, max_carry_forward=2)
+        self.special = LeaveType.objects.create(name='Special', carry_forward_allowed=False)
+        self.employees = [User.objects.create_user(username=f'e{i}', password='x', is_employee=True) for i in range(3)]
+        for user, casual, comp, sick in zip(self.employees, (8, 3, 6), (4, 0, 2), (6, 1, 0)):
+            LeaveBalance.objects.create(user=user, leave_type=self.casual, balance=casual, last_accrued=date(2025, 12, 1))
+            LeaveBalance.objects.create(user=user, leave_type=self.comp, balance=comp, last_accrued=date(2025, 12, 1))
+            LeaveBalance.objects.create(user=user, leave_type=self.sick, balance=sick, last_accrued=date(2025, 6, 1))
+            LeaveBalance.objects.create(user=user, leave_type=self.special, balance=3)
+        BalanceEntry.objects.update(created_at=timezone.make_aware(datetime(2025, 12, 31)))
+
+    def _balances(self, leave_type):
+        return list(LeaveBalance.objects.filter(leave_type=leave_type).order_by('user').values_list('balance', flat=True))
+
+    def test_carries_up_to_the_cap_and_lapses_the_rest(self):
+        result = year_end_rollover(2025, chunk_size=2)
+        self.assertEqual(result.employees, 3)
+        self.assertEqual(self._balances(self.casual), [5, 3, 5])
+        self.assertEqual(self._balances(self.comp), [0, 0, 0])
+        self.assertEqual(self._balances(self.sick), [12, 11, 10])
+        self.assertEqual(self._balances(self.special), [3, 3, 3])
+        self.assertEqual(set(LeaveBalance.objects.filter(leave_type=self.sick).values_list('last_accrued', flat=True)),
+                         {date(2026, 1, 1)})
+        self.assertEqual(BalanceEntry.objects.filter(kind='Rollover').count(), result.updated)
+        self.assertEqual(reconcile_balances(), [])
+
+    def test_yearly_reset_already_applied_keeps_later_postings(self):
+        credit_yearly(date(2026, 1, 1))
+        LeaveBalance.objects.filter(user=self.employees[0], leave_type=self.sick).update(balance=F('balance') - 1)
+        BalanceEntry.objects.create(user=self.employees[0], leave_type=self.sick, kind='Debit', amount=-1)
+        year_end_rollover(2025)
+        self.assertEqual(self._balances(self.sick), [11, 11, 10])
+        self.assertEqual(reconcile_balances(), [])
+
+    def test_accrual_owed_for_the_closed_year_lapses_with_it(self):
+        LeaveBalance.objects.filter(user=self.employees[0], leave_type=self.comp) \
+            .update(last_accrued=date(2025, 9, 1))
+        year_end_rollover(2025)
+        self.assertEqual(get_balance(self.employees[0], self.comp, today=date(2026, 1, 15)).balance, 1)
+        entries = BalanceEntry.objects.filter(user=self.employees[0], leave_type=self.comp).order_by('pk')
+        self.assertEqual(list(entries.values_list('kind', 'amount')),
+                         [('Opening', 4), ('Credit', 3), ('Rollover', -7), ('Credit', 1)])
+        self.assertEqual(reconcile_balances(), [])
+
+    def test_rerun_for_the_same_year_is_a_noop(self):
+        year_end_rollover(2025)
+        with self.assertNumQueries(1):
+            self.assertTrue(year_end_rollover(2025).skipped)
+        self.assertEqual(self._balances(self.casual), [5, 3, 5])
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        AccrualRun.objects.create(kind='Rollover', period=date(2025, 12, 31), last_user_id=self.employees[0].pk)
+        self.assertEqual(year_end_rollover(2025).employees, 2)
+        self.assertEqual(self._balances(self.casual), [8, 3, 5])
+        self.assertTrue(AccrualRun.objects.get(kind='Rollover').completed_at)
+
+    def test_command_refuses_a_year_that_has_not_ended(self):
+        with self.assertRaises(CommandError):
+            call_command('year_end_rollover', year=date.today().year, stdout=StringIO())
+        out = StringIO()
+        call_command('year_end_rollover', year=2025, stdout=out)
+        self.assertIn('3 employees', out.getvalue())
+
+
+class LazyAccrualTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='e', password='x', is_employee=True)
+        self.casual = LeaveType.objects.create(name='Casual', accrual_frequency='Monthly', accrual_amount=2)
+        self.sick = LeaveType.objects.create(name='Sick', annual_quota=10, accrual_frequency='Yearly')
+        self.annual = LeaveType.objects.create(name='Annual')
+        LeaveBalance.objects.create(user=self.user, leave_type=self.casual, balance=1, last_accrued=date(2025, 8, 20))
+        LeaveBalance.objects.create(user=self.user, leave_type=self.sick, balance=2, last_accrued=date(2025, 12, 1))
+        LeaveBalance.objects.create(user=self.user, leave_type=self.annual, balance=5, last_accrued=date(2025, 1, 1))
+
+    def _balances(self, today):
+        return {b.leave_type.name: b.balance for b in get_balances(self.user, today)}
+
+    def test_missed_runs_are_credited_on_read_and_written_back(self):
+        self.assertEqual(self._balances(date(2026, 1, 5)), {'Casual': 11, 'Sick': 10, 'Annual': 5})
+        stored = dict(LeaveBalance.objects.values_list('leave_type__name', 'balance'))
+        self.assertEqual(stored, {'Casual': 11, 'Sick': 10, 'Annual': 5})
+
+    def test_unchanged_balances_are_read_with_one_query(self):
+        self._balances(date(2026, 1, 5))
+        with self.assertNumQueries(1):
+            self.assertEqual(self._balances(date(2026, 1, 28)), {'Casual': 11, 'Sick': 10, 'Annual': 5})
+
+    def test_batch_and_lazy_accrual_do_not_double_count(self):
+        credit_monthly(date(2025, 11, 1))
+        self.assertEqual(self._balances(date(2025, 11, 15))['Casual'], 7)
+
+    @override_settings(LEAVE_ACCRUAL_ON_READ=False)
+    def test_accrual_on_read_can_be_disabled(self):
+        self.assertEqual(self._balances(date(2026, 1, 5))['Casual'], 1)
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN-based guard that the hot lookups stay on their indexes.
+
+    A few thousand rows are seeded and the planner statistics refreshed, then
+    each query's plan is checked for a sequential scan of its table.
+    """
+    EMPLOYEES = 400
+    LEAVES_PER_EMPLOYEE = 25
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.leave_types = [LeaveType.objects.create(name=name) for name in ('Annual', 'Sick', 'Casual')]
+        users = User.objects.bulk_create(
+            [User(username=f'plan{i}', is_employee=True, is_manager=i % 20 == 0) for i in range(cls.EMPLOYEES)]
+        )
+        cls.user = users[1]
+        cls.manager = users[0]
+        statuses = ['Approved'] * 14 + ['Rejected'] * 5 + ['Cancelled'] * 5 + ['Pending']
+        start = date(2020, 1, 1)
+        LeaveRequest.objects.bulk_create([
+            LeaveRequest(user=user, leave_type=cls.leave_types[n % 3], reason='r', status=statuses[n],
+                         start_date=start + timedelta(days=n * 60 + i % 30),
+                         end_date=start + timedelta(days=n * 60 + i % 30 + 2))
+            for i, user in enumerate(users) for n in range(cls.LEAVES_PER_EMPLOYEE)
+        ], batch_size=2000)
+        LeaveBalance.objects.bulk_create([
+            LeaveBalance(user=user, leave_type=leave_type, balance=10) for user in users for leave_type in cls.leave_types
+        ])
+        Delegation.objects.bulk_create([
+            Delegation(manager=manager, delegate=users[(i + 1) % len(users)],
+                       start_date=start + timedelta(days=n * 30), end_date=start + timedelta(days=n * 30 + 7))
+            for i, manager in enumerate(users) if manager.is_manager for n in range(60)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, table):
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertNotIn(f'Seq Scan on {table}', plan, plan)
+        else:
+            self.assertIsNone(re.search(rf'\bSCAN {table}\b(?! USING)', plan), plan)
+
+    def test_overlap_check(self):
+        self.assertUsesIndex(LeaveRequest.objects.filter(
+            user=self.user, status='Approved', start_date__lte=date(2021, 5, 1), end_date__gte=date(2021, 4, 1)
+        ), 'leave_leaverequest')
+
+    def test_pending_queue(self):
+        self.assertUsesIndex(
+            LeaveRequest.objects.filter(status='Pending').order_by('start_date', 'id')[:25], 'leave_leaverequest'
+        )
+
+    def test_approved_calendar_range(self):
+        self.assertUsesIndex(LeaveRequest.objects.filter(
+            status='Approved', start_date__lte=date(2022, 2, 1), start_date__gte=date(2022, 1, 1)
+        ), 'leave_leaverequest')
+
+    def test_history_keyset_page(self):
+        self.assertUsesIndex(LeaveRequest.objects.filter(
+            Q(start_date__lte=date(2022, 1, 1)) & (Q(start_date__lt=date(2022, 1, 1)) | Q(id__lt=1000)), user=self.user,
+        ).order_by('-start_date', '-id')[:26], 'leave_leaverequest')
+
+    def test_delegation_lookup(self):
+        self.assertUsesIndex(Delegation.objects.filter(
+            manager=self.manager, start_date__lte=date(2021, 1, 5), end_date__gte=date(2021, 1, 5)
+        ), 'leave_delegation')
+
+    def test_balance_lookup(self):
+        self.assertUsesIndex(
+            LeaveBalance.objects.filter(user=self.user, leave_type=self.leave_types[0]), 'leave_leavebalance'
+        )
+
+
+class ApplyLeavePipelineTests(TestCase):
+
+    def setUp(self):
+        invalidate_delegation_index()
+        invalidate_working_day_calendar()
+        self.employee = User.objects.create_user(username='emp', password='x', is_employee=True)
+        User.objects.create_user(username='boss', email='boss@example.com', password='x', is_manager=True)
+        self.leave_type = LeaveType.objects.create(name='Annual')
+        self.balance = LeaveBalance.objects.create(user=self.employee, leave_type=self.leave_type, balance=3)
+        self.client.force_login(self.employee)
+
+    def _apply(self, start, end):
+        return self.client.post(reverse('apply_leave'), {
+            'leave_type': self.leave_type.pk, 'start_date': start, 'end_date': end, 'reason': 'Trip',
+        })
+
+    def test_all_validation_errors_are_reported_together(self):
+        LeaveRequest.objects.create(user=self.employee, leave_type=self.leave_type, start_date=date(2030, 6, 3),
+                                    end_date=date(2030, 6, 3), reason='r', status='Approved')
+        LeaveRequest.objects.create(user=self.employee, leave_type=self.leave_type, start_date=date(2030, 6, 5),
+                                    end_date=date(2030, 6, 5), reason='r', status='Pending')
+        response = self._apply('2030-06-01', '2030-06-10')
+        self.assertEqual(response.status_code, 200)
+        errors = response.context['form'].non_field_errors()
+        self.assertEqual(len(errors), 4)
+        self.assertIn('Cannot apply leave on Sundays: 2030-06-02, 2030-06-09.', errors)
+        self.assertEqual(LeaveRequest.objects.count(), 2)
+
+    def test_successful_submission_query_budget(self):
+        Holiday.objects.create(date=date(2030, 6, 4), name='Founders Day')
+        get_active_managers()
+        count_working_days(date(2030, 6, 3), date(2030, 6, 5))
+        # session, user, leave type lookup and FK check from the form, then the
+        # savepoint, one validation query, the insert, the outbox insert and the release.
+        with self.assertNumQueries(9):
+            response = self._apply('2030-06-03', '2030-06-05')
+        self.assertRedirects(response, reverse('apply_leave'))
+        leave = LeaveRequest.objects.get()
+        self.assertEqual((leave.status, leave.user), ('Pending', self.employee))
+        self.assertEqual(list(Notification.objects.values_list('email', flat=True)), ['boss@example.com'])
+
+    def test_overlap_is_rejected_by_the_database(self):
+        LeaveRequest.objects.create(user=self.employee, leave_type=self.leave_type, start_date=date(2030, 6, 4),
+                                    end_date=date(2030, 6, 4), reason='r', status='Pending')
+        response = self._apply('2030-06-03', '2030-06-05')
+        self.assertEqual(list(response.context['form'].non_field_errors()),
+                         ['You have a pending leave during this period.'])
+        self.assertEqual(LeaveRequest.objects.count(), 1)
+        self.assertEqual(Notification.objects.count(), 0)
+
+    def test_overlap_constraint_covers_active_statuses_only(self):
+        def leave(start, end, status):
+            return LeaveRequest.objects.create(user=self.employee, leave_type=self.leave_type, reason='r',
+                                               start_date=start, end_date=end, status=status)
+
+        cancelled = leave(date(2030, 6, 3), date(2030, 6, 5), 'Cancelled')
+        leave(date(2030, 6, 5), date(2030, 6, 6), 'Approved')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            leave(date(2030, 6, 1), date(2030, 6, 5), 'Pending')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            LeaveRequest.objects.filter(pk=cancelled.pk).update(status='Pending')
+        leave(date(2030, 6, 7), date(2030, 6, 8), 'Pending')
+        other = User.objects.create_user(username='other', password='x', is_employee=True)
+        LeaveRequest.objects.create(user=other, leave_type=self.leave_type, reason='r', status='Approved',
+                                    start_date=date(2030, 6, 3), end_date=date(2030, 6, 8))
+
+    def test_only_pending_leaves_can_be_approved(self):
+        cancelled = LeaveRequest.objects.create(user=self.employee, leave_type=self.leave_type, reason='r',
+                                                start_date=date(2030, 6, 3), end_date=date(2030, 6, 5),
+                                                status='Cancelled')
+        LeaveRequest.objects.create(user=self.employee, leave_type=self.leave_type, reason='r',
+                                    start_date=date(2030, 6, 5), end_date=date(2030, 6, 6), status='Pending')
+        self.client.force_login(User.objects.get(username='boss'))
+        response = self.client.post(reverse('approve_leave', args=[cancelled.pk]), follow=True)
+        self.assertContains(response, 'Leave request is already cancelled.')
+        cancelled.refresh_from_db()
+        self.assertEqual(cancelled.status, 'Cancelled')
+        self.balance.refresh_from_db()
+        self.assertEqual(self.balance.balance, 3)
+
+    def test_approval_without_a_balance_is_refused(self):
+        unpaid = LeaveType.objects.create(name='Unpaid')
+        leave = LeaveRequest.objects.create(user=self.employee, leave_type=unpaid, reason='r',
+                                            start_date=date(2030, 6, 3), end_date=date(2030, 6, 4))
+        self.client.force_login(User.objects.get(username='boss'))
+        response = self.client.post(reverse('approve_leave', args=[leave.pk]), follow=True)
+        self.assertContains(response, 'emp has no Unpaid balance.')
+        leave.refresh_from_db()
+        self.assertEqual(leave.status, 'Pending')
+        self.assertFalse(BalanceEntry.objects.filter(leave=leave).exists())
+
+
+@override_settings(LEAVE_PERF_STATS=True, LEAVE_PERF_STATS_DIR=None)
+class PerfStatsMiddlewareTests(TestCase):
+
+    def setUp(self):
+        perf_stats.reset()
+        self.manager = User.objects.create_user(username='boss', password='x', is_manager=True)
+        self.client.force_login(self.manager)
+
+    def tearDown(self):
+        perf_stats.reset()
+
+    def test_server_timing_header_and_aggregate(self):
+        response = self.client.get(reverse('reports'))
+        timing = response['Server-Timing']
+        self.assertIn('desc="leave.views.reports_view"', timing)
+        self.assertRegex(timing, r'db;dur=[0-9.]+;desc="\d+ queries"')
+        samples = perf_stats.snapshot()['leave.views.reports_view']['samples']
+        self.assertEqual(len(samples), 1)
+
+    def test_duplicated_statements_are_reported(self):
+        employee = User.objects.create_user(username='emp', password='x', is_employee=True)
+        leave_type = LeaveType.objects.create(name='Annual')
+        for day in (1, 2):
+            LeaveRequest.objects.create(user=employee, leave_type=leave_type, status='Approved', reason='r',
+                                        start_date=date.today() + timedelta(days=day),
+                                        end_date=date.today() + timedelta(days=day))
+
+        def n_plus_one(request):
+            return HttpResponse(','.join(leave.user.username for leave in LeaveRequest.objects.all()))
+
+        response = PerfStatsMiddleware(n_plus_one)(RequestFactory().get('/'))
+        self.assertIn('dup;desc="2 duplicated queries"', response['Server-Timing'])
+        self.assertEqual(sum(perf_stats.snapshot()['unresolved']['duplicates'].values()), 2)
+
+    def test_perfstats_command_reports_percentiles(self):
+        for _ in range(3):
+            self.client.get(reverse('manager_dashboard'))
+        out = StringIO()
+        call_command('perfstats', '--json', stdout=out)
+        row = json.loads(out.getvalue())['leave.views.manager_dashboard_view']
+        self.assertEqual(row['requests'], 3)
+        self.assertLessEqual(row['p50_ms'], row['p99_ms'])
+
+    @override_settings(ROOT_URLCONF='leave.tests')
+    async def test_async_views_are_measured_with_their_queries(self):
+        await self.async_client.aforce_login(self.manager)
+        response = await self.async_client.get('/async-test/reports/')
+        timing = response['Server-Timing']
+        self.assertIn('desc="leave.views.reports_async_view"', timing)
+        queries = int(re.search(r'desc="(\d+) queries"', timing).group(1))
+        self.assertGreater(queries, 1)
+        self.assertEqual(perf_stats.snapshot()['leave.views.reports_async_view']['samples'][0][1], queries)
+
+    async def test_queries_in_worker_threads_are_attributed_to_the_request(self):
+        def query():
+            try:
+                return list(Holiday.objects.all())
+            finally:
+                connection.close()
+
+        async def view(request):
+            await sync_to_async(query, thread_sensitive=False)()
+            return HttpResponse()
+
+        middleware = PerfStatsMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().get('/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    def test_partial_window_is_flushed_at_exit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            stats = PerfStats(flush_every=100, directory=directory)
+            stats.record('view', 1.0, 2, 0.5)
+            stats.flush_pending()
+            self.assertEqual(summarize(load_snapshots(directory))['view']['requests'], 1)
+
+    def test_duplicates_are_counted_over_the_window_only(self):
+        stats = PerfStats(window=2)
+        stats.record('view', 1.0, 2, 0.5, duplicated=['SELECT 1', 'SELECT 1'])
+        stats.record('view', 1.0, 2, 0.5, duplicated=['SELECT 2'])
+        stats.record('view', 1.0, 2, 0.5, duplicated=['SELECT 2'])
+        self.assertEqual(stats.snapshot()['view']['duplicates'], {'SELECT 2': 2})
+
+    def test_old_snapshots_are_dropped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            stats = PerfStats(directory=directory)
+            stats.record('view', 1.0, 2, 0.5)
+            stats.flush()
+            old = os.path.join(directory, '1.json')
+            with open(old, 'w') as handle:
+                json.dump(stats.snapshot(), handle)
+            os.utime(old, (0, 0))
+            self.assertEqual(len(load_snapshots(directory, max_age=3600)), 1)
+            self.assertFalse(os.path.exists(old))
+
+    @override_settings(LEAVE_PERF_STATS=False)
+    def test_disabled_middleware_adds_nothing(self):
+        response = self.client.get(reverse('manager_dashboard'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(perf_stats.snapshot(), {})
+
+    def test_percentile_nearest_rank(self):
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+        self.assertEqual(percentile([7], 99), 7)
+
+
+class ScaleSeedTests(TestCase):
+
+    def _seed(self, prefix):
+        call_command('seed_db', employees=30, managers=4, years=1, chunk_size=7, prefix=prefix, stdout=StringIO())
+        return list(LeaveRequest.objects.filter(user__username__startswith=f'{prefix}_')
+                    .order_by('id').values_list('start_date', 'end_date', 'status', 'reason'))
+
+    def test_scale_mode_generates_consistent_data(self):
+        leaves = self._seed('a')
+        self.assertEqual(User.objects.filter(username__startswith='a_emp', is_employee=True).count(), 30)
+        self.assertEqual(User.objects.filter(username__startswith='a_mgr', is_manager=True).count(), 4)
+        self.assertEqual(LeaveBalance.objects.filter(user__username__startswith='a_').count(), 90)
+        self.assertTrue(Delegation.objects.exists())
+        self.assertGreater(len(leaves), 30 * 6)
+        self.assertTrue({'Approved', 'Rejected', 'Pending'} <= {leave[2] for leave in leaves})
+        self.assertTrue(DailyAbsence.objects.exists())
+        call_command('rebuild_daily_absence', verify=True, stdout=StringIO())
+        call_command('rebuild_leave_aggregates', verify=True, stdout=StringIO())
+        for user in User.objects.filter(username__startswith='a_emp')[:5]:
+            spans = list(LeaveRequest.objects.filter(user=user).order_by('start_date').values_list('start_date', 'end_date'))
+            for (_, previous_end), (next_start, _) in zip(spans, spans[1:]):
+                self.assertLess(previous_end, next_start)
+
+    def test_scale_mode_debits_approved_leaves_and_skips_sundays(self):
+        leaves = self._seed('a')
+        self.assertFalse([(start, end) for start, end, _, _ in leaves
+                          if get_working_day_calendar().weekend_days(start, end)])
+        approved = LeaveRequest.objects.filter(status='Approved')
+        self.assertEqual(BalanceEntry.objects.filter(kind='Debit').count(), approved.count())
+        self.assertEqual(set(BalanceEntry.objects.filter(kind='Debit').values_list('leave', flat=True)),
+                         set(approved.values_list('pk', flat=True)))
+        self.assertFalse(LeaveBalance.objects.filter(balance__lt=0).exists())
+        self.assertEqual(reconcile_balances(), [])
+
+    def test_same_seed_generates_same_rows(self):
+        self.assertEqual(self._seed('a'), self._seed('b'))
+
+
+class BenchCommandTests(TestCase):
+
+    def test_bench_covers_every_route_and_flags_regressions(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(LEAVE_EXPORT_ROOT=directory):
+            output = os.path.join(directory, 'bench.json')
+            out = StringIO()
+            call_command('bench', employees=15, managers=2, years=1, iterations=2, output=output, stdout=out)
+            with open(output) as handle:
+                results = json.load(handle)
+            routes = results['routes']
+            for name in ('login', 'dashboard', 'apply_leave', 'apply_leave [POST]', 'leave_history',
+                         'download_leave_history_pdf', 'manager_dashboard', 'approve_leave', 'reports',
+                         'export_status', 'export_download'):
+                self.assertIn(name, routes)
+                self.assertGreater(routes[name]['p50_ms'], 0)
+            self.assertEqual(routes['reports']['status'], [200])
+            self.assertEqual(routes['export_download']['status'], [200])
+            self.assertNotIn('no benchmark scenario', out.getvalue())
+
+            for row in routes.values():
+                row['p95_ms'] = row['p95_ms'] / 1000
+                row['queries'] = 0
+            baseline = os.path.join(directory, 'baseline.json')
+            with open(baseline, 'w') as handle:
+                json.dump(results, handle)
+            with self.assertRaises(CommandError):
+                call_command('bench', iterations=1, baseline=baseline, stdout=StringIO())
+        self.assertEqual(LeaveRequest.objects.filter(status='Cancelled', comments__contains='Benchmark').count(), 0)
+
+
+class ExportJobTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(LEAVE_EXPORT_ROOT=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.employee = User.objects.create_user(username='emp', password='x', is_employee=True)
+        self.leave_type = LeaveType.objects.create(name='Annual')
+        LeaveBalance.objects.create(user=self.employee, leave_type=self.leave_type, balance=5)
+        LeaveRequest.objects.create(user=self.employee, leave_type=self.leave_type, start_date=date(2025, 3, 3),
+                                    end_date=date(2025, 3, 4), reason='Trip')
+        self.client.force_login(self.employee)
+
+    def test_export_is_rendered_by_worker_and_then_served_from_cache(self):
+        response = self.client.get(reverse('download_leave_history_pdf'))
+        job = ExportJob.objects.get()
+        self.assertRedirects(response, f"{reverse('leave_history')}?export={job.pk}")
+        self.assertEqual(self.client.get(reverse('export_status', args=[job.pk])).json()['status'], 'Queued')
+
+        call_command('run_export_worker', '--once', stdout=StringIO())
+        status = self.client.get(reverse('export_status', args=[job.pk])).json()
+        self.assertEqual(status['status'], 'Done')
+        download = self.client.get(status['download_url'])
+        self.assertEqual(download['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(download.streaming_content).startswith(b'%PDF'))
+
+        cached = self.client.get(reverse('download_leave_history_pdf'))
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(ExportJob.objects.count(), 1)
+
+    def test_changed_history_queues_a_new_export(self):
+        self.client.get(reverse('download_leave_history_pdf'))
+        call_command('run_export_worker', '--once', stdout=StringIO())
+        leave = LeaveRequest.objects.get()
+        leave.status = 'Cancelled'
+        leave.save()
+        response = self.client.get(reverse('download_leave_history_pdf'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ExportJob.objects.filter(status='Queued').count(), 1)
+
+    def test_version_follows_the_database_not_the_cache(self):
+        version = history_version(self.employee)
+        cache.clear()
+        self.assertEqual(history_version(self.employee), version)
+        # A queryset update sends no signals, like a write whose stamp lives in another process's cache.
+        LeaveRequest.objects.update(status='Cancelled')
+        self.assertNotEqual(history_version(self.employee), version)
+
+    def test_job_left_running_by_a_crashed_worker_is_queued_again(self):
+        self.client.get(reverse('download_leave_history_pdf'))
+        ExportJob.objects.update(status='Running', started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.client.get(reverse('download_leave_history_pdf')).status_code, 302)
+        call_command('run_export_worker', '--once', stdout=StringIO())
+        self.assertEqual(ExportJob.objects.get().status, 'Done')
+
+    def test_old_finished_jobs_are_purged(self):
+        self.client.get(reverse('download_leave_history_pdf'))
+        call_command('run_export_worker', '--once', stdout=StringIO())
+        ExportJob.objects.update(finished_at=timezone.now() - timedelta(days=30))
+        self.assertEqual(purge_finished_exports(), 1)
+        self.assertEqual(self.client.get(reverse('download_leave_history_pdf')).status_code, 200)
+
+    def test_artifact_removed_before_it_is_opened_is_queued_again(self):
+        self.client.get(reverse('download_leave_history_pdf'))
+        call_command('run_export_worker', '--once', stdout=StringIO())
+        job = ExportJob.objects.get()
+        os.remove(job.file_path)
+        with mock.patch.object(leave_views, 'request_history_export', side_effect=[job, ExportJob.objects.create(
+                user=self.employee, version=job.version)]):
+            response = self.client.get(reverse('download_leave_history_pdf'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get(reverse('export_download', args=[job.pk])).status_code, 404)
+
+    def test_jobs_are_private(self):
+        self.client.get(reverse('download_leave_history_pdf'))
+        job = ExportJob.objects.get()
+        other = User.objects.create_user(username='other', password='x', is_employee=True)
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('export_status', args=[job.pk])).status_code, 404)
+
+
+class ReportExportTests(TestCase):
+
+    def setUp(self):
+        self.manager = User.objects.create_user(username='mgr', password='x', is_manager=True)
+        self.leave_type = LeaveType.objects.create(name='Annual')
+        for index, department in enumerate(['Sales', 'Sales', 'Ops']):
+            user = User.objects.create_user(username=f'emp{index}', password='x', is_employee=True, department=department)
+            LeaveRequest.objects.create(user=user, leave_type=self.leave_type, start_date=date(2025, 3, 3 + index),
+                                        end_date=date(2025, 3, 3 + index), reason='Trip, "family"',
+                                        status='Approved', approver=self.manager)
+        LeaveRequest.objects.create(user=user, leave_type=self.leave_type, start_date=date(2025, 4, 1),
+                                    end_date=date(2025, 4, 1), reason='Pending', status='Pending')
+        self.client.force_login(self.manager)
+
+    def test_approved_leaves_csv_streams_filtered_rows(self):
+        response = self.client.get(reverse('export_approved_leaves'), {'department': 'Sales', 'end_date': '2025-03-03'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[0], 'Employee')
+        self.assertEqual(lines[1:], ['emp0,Sales,Annual,2025-03-03,2025-03-03,"Trip, ""family""",,mgr'])
+
+    def test_department_summary_xlsx_is_a_valid_workbook(self):
+        response = self.client.get(reverse('export_department_summary'), {'format': 'xlsx'})
+        workbook = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(workbook.testzip())
+        sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('<t xml:space="preserve">Ops</t>', sheet)
+        self.assertIn('<c r="C3"><v>2</v></c>', sheet)
+
+    def test_formulas_typed_by_employees_are_quoted_in_csv_only(self):
+        LeaveRequest.objects.filter(user__username='emp2').update(reason='=HYPERLINK("http://x")', comments='@SUM(A1)')
+        response = self.client.get(reverse('export_approved_leaves'), {'department': 'Ops'})
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines()[1],
+                         'emp2,Ops,Annual,2025-03-05,2025-03-05,"\'=HYPERLINK(""http://x"")",\'@SUM(A1),mgr')
+        response = self.client.get(reverse('export_approved_leaves'), {'department': 'Ops', 'format': 'xlsx'})
+        sheet = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))).read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('<t xml:space="preserve">=HYPERLINK("http://x")</t>', sheet)
+        self.assertIn('<t xml:space="preserve">@SUM(A1)</t>', sheet)
+
+    @override_settings(LEAVE_ASYNC_VIEWS=True)
+    async def test_exports_stream_from_async_iterators_under_asgi(self):
+        await self.async_client.aforce_login(self.manager)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            response = await self.async_client.get(reverse('export_approved_leaves'), {'department': 'Sales'})
+            self.assertTrue(response.is_async)
+            lines = b''.join([part async for part in response]).decode().splitlines()
+            response = await self.async_client.get(reverse('export_department_summary'), {'format': 'xlsx'})
+            workbook = zipfile.ZipFile(BytesIO(b''.join([part async for part in response])))
+        self.assertEqual(len(lines), 3)
+        self.assertIsNone(workbook.testzip())
+        self.assertFalse([w for w in caught if 'synchronous iterators' in str(w.message)])
+
+    def test_invalid_filters_and_employees_are_rejected(self):
+        response = self.client.get(reverse('export_approved_leaves'), {'start_date': '2025-05-01', 'end_date': '2025-04-01'})
+        self.assertEqual(response.status_code, 400)
+        self.client.force_login(User.objects.get(username='emp0'))
+        self.assertNotEqual(self.client.get(reverse('export_approved_leaves')).status_code, 200)
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.employee = User.objects.create_user(username='emp', password='x', is_employee=True)
+        self.leave_type = LeaveType.objects.create(name='Annual')
+        # Pairs of leaves share a start date, so the id tiebreaker matters; one of
+        # each pair is rejected, since active leaves of an employee cannot overlap.
+        LeaveRequest.objects.bulk_create([
+            LeaveRequest(user=self.employee, leave_type=self.leave_type, reason='r',
+                         status='Rejected' if n % 2 else 'Approved',
+                         start_date=date(2025, 1, 6) + timedelta(days=n // 2), end_date=date(2025, 1, 6) + timedelta(days=n // 2))
+            for n in range(23)
+        ])
+        self.expected = list(LeaveRequest.objects.order_by('-start_date', '-id').values_list('pk', flat=True))
+
+    def _walk(self, descending=True):
+        params, seen, pages = {}, [], []
+        while True:
+            page = keyset_page(LeaveRequest.objects.all(), params, 5, descending=descending)
+            pages.append(page)
+            seen.extend(leave.pk for leave in page)
+            if not page.has_next():
+                return seen, pages
+            params = {'after': page.next_cursor}
+
+    def test_forward_walk_visits_every_row_once_in_order(self):
+        seen, pages = self._walk()
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(pages), 5)
+        self.assertFalse(pages[0].has_previous())
+        ascending, _ = self._walk(descending=False)
+        self.assertEqual(ascending, self.expected[::-1])
+
+    def test_backward_walk_returns_the_same_pages(self):
+        _, pages = self._walk()
+        for newer, older in zip(pages, pages[1:]):
+            back = keyset_page(LeaveRequest.objects.all(), {'before': older.previous_cursor}, 5, descending=True)
+            self.assertEqual(list(back), list(newer))
+            self.assertEqual(back.has_previous(), newer.has_previous())
+
+    def test_malformed_cursor_falls_back_to_first_page(self):
+        page = keyset_page(LeaveRequest.objects.all(), {'after': 'nonsense'}, 5, descending=True)
+        self.assertEqual([leave.pk for leave in page], self.expected[:5])
+
+    def test_views_cost_the_same_on_deep_pages(self):
+        manager = User.objects.create_user(username='mgr', password='x', is_manager=True)
+        _, pages = self._walk()
+        for user, name in ((self.employee, 'leave_history'), (manager, 'reports')):
+            self.client.force_login(user)
+            self.client.get(reverse(name))
+            # Measure uncached renders; the leave history fragments would otherwise be reused.
+            cache.clear()
+            with CaptureQueriesContext(connection) as first:
+                self.client.get(reverse(name))
+            cache.clear()
+            with CaptureQueriesContext(connection) as deep:
+                response = self.client.get(reverse(name), {'after': pages[-2].next_cursor})
+            self.assertEqual(len(first), len(deep), name)
+            self.assertContains(response, '&laquo; Previous')
+
+
+class DailyAbsenceTests(TestCase):
+
+    def setUp(self):
+        invalidate_delegation_index()
+        invalidate_working_day_calendar()
+        self.manager = User.objects.create_user(username='mgr', password='x', is_manager=True)
+        self.employee = User.objects.create_user(username='emp', password='x', is_employee=True, department='Sales')
+        self.leave_type = LeaveType.objects.create(name='Annual')
+        LeaveBalance.objects.create(user=self.employee, leave_type=self.leave_type, balance=20)
+        self.start = date.today() + timedelta(days=3)
+
+    def _leave(self, offset=0, length=3, status='Pending'):
+        return LeaveRequest.objects.create(user=self.employee, leave_type=self.leave_type, reason='r', status=status,
+                                           start_date=self.start + timedelta(days=offset),
+                                           end_date=self.start + timedelta(days=offset + length - 1))
+
+    def test_approve_reject_and_cancel_keep_the_table_in_step(self):
+        leave = self._leave()
+        self.client.force_login(self.manager)
+        self.client.post(reverse('approve_leave', args=[leave.pk]), {'comments': 'ok'})
+        self.assertEqual(sorted(DailyAbsence.objects.values_list('date', flat=True)),
+                         [self.start + timedelta(days=n) for n in range(3)])
+        self.assertEqual(set(DailyAbsence.objects.values_list('department', flat=True)), {'Sales'})
+
+        self.client.post(reverse('reject_leave', args=[leave.pk]), {'comments': 'changed my mind'})
+        self.assertFalse(DailyAbsence.objects.exists())
+
+        other = self._leave(offset=10)
+        self.client.post(reverse('approve_leave', args=[other.pk]))
+        self.client.force_login(self.employee)
+        self.client.post(reverse('cancel_leave', args=[other.pk]), {'cancel_reason': 'x'})
+        self.assertFalse(DailyAbsence.objects.exists())
+
+    def test_reports_calendar_costs_the_same_for_any_number_of_leaves(self):
+        self.client.force_login(self.manager)
+        self.client.post(reverse('approve_leave', args=[self._leave().pk]))
+        self.client.get(reverse('reports'))
+        # Measure uncached renders; the calendar grid would otherwise be reused.
+        cache.clear()
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('reports'))
+        for index in range(5):
+            colleague = User.objects.create_user(username=f'col{index}', password='x', is_employee=True)
+            leave = LeaveRequest.objects.create(user=colleague, leave_type=self.leave_type, reason='r',
+                                                start_date=self.start, end_date=self.start + timedelta(days=2))
+            LeaveBalance.objects.create(user=colleague, leave_type=self.leave_type, balance=20)
+            self.client.post(reverse('approve_leave', args=[leave.pk]))
+        cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('reports'))
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(len(response.context['calendar_map'][self.start]), 6)
+
+    def test_rebuild_verifies_and_repairs(self):
+        leave = self._leave(status='Approved')
+        self._leave(offset=10, status='Cancelled')
+        with self.assertRaises(CommandError):
+            call_command('rebuild_daily_absence', verify=True, stdout=StringIO())
+        call_command('rebuild_daily_absence', stdout=StringIO())
+        self.assertEqual(DailyAbsence.objects.filter(leave=leave).count(), 3)
+        call_command('rebuild_daily_absence', verify=True, stdout=StringIO())
+
+        LeaveRequest.objects.filter(pk=leave.pk).update(status='Cancelled')
+        DailyAbsence.objects.create(date=self.start, user=self.employee, leave=self._leave(offset=20, status='Pending'))
+        call_command('rebuild_daily_absence', chunk_size=1, stdout=StringIO())
+        self.assertFalse(DailyAbsence.objects.exists())
+
+    def test_department_change_is_copied(self):
+        leave = self._leave(status='Approved')
+        call_command('rebuild_daily_absence', stdout=StringIO())
+        self.employee.department = 'Ops'
+        self.employee.save()
+        self.assertEqual(set(DailyAbsence.objects.filter(leave=leave).values_list('department', flat=True)), {'Ops'})
+
+
+class LeaveAggregateTests(TestCase):
+
+    def setUp(self):
+        invalidate_delegation_index()
+        invalidate_working_day_calendar()
+        self.manager = User.objects.create_user(username='mgr', password='x', is_manager=True)
+        self.employee = User.objects.create_user(username='emp', password='x', is_employee=True, department='Sales')
+        self.leave_type = LeaveType.objects.create(name='Annual')
+        LeaveBalance.objects.create(user=self.employee, leave_type=self.leave_type, balance=50)
+        # A Monday well in the future, so leaves can still be cancelled.
+        self.monday = date.today() + timedelta(days=14 - date.today().weekday())
+        self.client.force_login(self.manager)
+
+    def _approved(self, offset=0, length=3):
+        leave = LeaveRequest.objects.create(user=self.employee, leave_type=self.leave_type, reason='r',
+                                            start_date=self.monday + timedelta(days=offset),
+                                            end_date=self.monday + timedelta(days=offset + length - 1))
+        self.client.post(reverse('approve_leave', args=[leave.pk]))
+        return leave
+
+    def _totals(self):
+        return [(row['department'], row['total'], row['working_days']) for row in department_totals()]
+
+    def test_approve_cancel_and_reject_adjust_the_totals(self):
+        first, second = self._approved(), self._approved(offset=7, length=2)
+        self.assertEqual(self._totals(), [('Sales', 2, 5)])
+
+        self.client.post(reverse('reject_leave', args=[first.pk]), {'comments': 'no'})
+        self.assertEqual(self._totals(), [('Sales', 1, 2)])
+
+        self.client.force_login(self.employee)
+        self.client.post(reverse('cancel_leave', args=[second.pk]), {'cancel_reason': 'x'})
+        self.assertEqual(self._totals(), [])
+        call_command('rebuild_leave_aggregates', verify=True, stdout=StringIO())
+
+    def test_department_change_moves_totals(self):
+        self._approved()
+        self.employee.department = 'Ops'
+        self.employee.save()
+        self.assertEqual(self._totals(), [('Ops', 1, 3)])
+        self.employee.save(update_fields=['last_login'])
+        call_command('rebuild_leave_aggregates', verify=True, stdout=StringIO())
+
+    def test_rebuild_repairs_drift(self):
+        self._approved()
+        LeaveAggregate.objects.update(leaves=7)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_leave_aggregates', verify=True, stdout=StringIO())
+        call_command('rebuild_leave_aggregates', stdout=StringIO())
+        self.assertEqual(self._totals(), [('Sales', 1, 3)])
+
+    def test_report_reads_the_summary_table(self):
+        self._approved()
+        response = self.client.get(reverse('reports'))
+        self.assertEqual([(row['department'], row['total']) for row in response.context['dept_leave_data']],
+                         [('Sales', 1)])
+
+
+class BalanceLedgerTests(TestCase):
+
+    def setUp(self):
+        self.manager = User.objects.create_user(username='mgr', password='x', is_manager=True)
+        self.employee = User.objects.create_user(username='emp', password='x', is_employee=True)
+        self.leave_type = LeaveType.objects.create(name='Annual')
+        self.balance = LeaveBalance.objects.create(user=self.employee, leave_type=self.leave_type, balance=20)
+        self.monday = date.today() + timedelta(days=14 - date.today().weekday())
+        self.client.force_login(self.manager)
+
+    def _leave(self, offset=0, length=3):
+        return LeaveRequest.objects.create(user=self.employee, leave_type=self.leave_type, reason='r',
+                                           start_date=self.monday + timedelta(days=offset),
+                                           end_date=self.monday + timedelta(days=offset + length - 1))
+
+    def _entries(self):
+        return list(BalanceEntry.objects.order_by('pk').values_list('kind', 'amount'))
+
+    def _balance(self):
+        self.balance.refresh_from_db()
+        return self.balance.balance
+
+    def test_approve_reject_and_cancel_post_entries(self):
+        first, second = self._leave(), self._leave(offset=7, length=2)
+        self.client.post(reverse('approve_leave', args=[first.pk]))
+        self.client.post(reverse('approve_leave', args=[first.pk]))
+        self.client.post(reverse('approve_leave', args=[second.pk]))
+        self.assertEqual(self._balance(), 15)
+
+        self.client.post(reverse('reject_leave', args=[first.pk]), {'comments': 'no'})
+        self.client.force_login(self.employee)
+        self.client.post(reverse('cancel_leave', args=[second.pk]), {'cancel_reason': 'x'})
+        self.assertEqual(self._balance(), 20)
+        self.assertEqual(self._entries(), [('Opening', 20), ('Debit', -3), ('Debit', -2),
+                                           ('Reversal', 3), ('Reversal', 2)])
+        self.assertEqual(reconcile_balances(), [])
+
+    def test_approval_does_not_read_the_balance(self):
+        leave = self._leave()
+        # Another writer changes the balance after this approval would have read it.
+        LeaveBalance.objects.filter(pk=self.balance.pk).update(balance=F('balance') - 1)
+        BalanceEntry.objects.create(user=self.employee, leave_type=self.leave_type, kind='Debit', amount=-1)
+        approve_leave(leave, self.manager)
+        self.assertEqual(self._balance(), 16)
+        self.assertEqual(reconcile_balances(), [])
+
+    def test_accrual_and_admin_edits_are_recorded(self):
+        sick = LeaveType.objects.create(name='Sick', annual_quota=10, accrual_frequency='Yearly')
+        LeaveBalance.objects.create(user=self.employee, leave_type=sick, balance=3, last_accrued=date(2024, 6, 1))
+        credit_yearly(date(2025, 1, 1))
+        self.balance.balance = 25
+        self.balance.save()
+        self.assertEqual(self._entries(), [('Opening', 20), ('Opening', 3), ('Credit', 7), ('Adjustment', 5)])
+        self.assertEqual(reconcile_balances(), [])
+
+    def _unreset_yearly_balance(self):
+        sick = LeaveType.objects.create(name='Sick', annual_quota=10, accrual_frequency='Yearly')
+        LeaveBalance.objects.create(user=self.employee, leave_type=sick, balance=2,
+                                    last_accrued=date(date.today().year - 1, 6, 1))
+        leave = self._leave()
+        LeaveRequest.objects.filter(pk=leave.pk).update(leave_type=sick)
+        leave.refresh_from_db()
+        return sick, leave
+
+    def test_approval_in_a_new_year_survives_the_yearly_reset(self):
+        sick, leave = self._unreset_yearly_balance()
+        approve_leave(leave, self.manager)
+        self.assertEqual(get_balance(self.employee, sick).balance, 7)
+        self.assertEqual(reconcile_balances(), [])
+
+    def test_bulk_approval_in_a_new_year_survives_the_yearly_reset(self):
+        sick, leave = self._unreset_yearly_balance()
+        self.assertTrue(review_leaves([leave.pk], self.manager, approve=True)[0].ok)
+        self.assertEqual(LeaveBalance.objects.get(leave_type=sick).balance, 7)
+        self.assertEqual(get_balance(self.employee, sick).balance, 7)
+        self.assertEqual(reconcile_balances(), [])
+
+    def test_reconcile_command_reports_and_fixes_drift(self):
+        LeaveBalance.objects.filter(pk=self.balance.pk).update(balance=18)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_balances', stdout=StringIO())
+        call_command('reconcile_balances', fix=True, stdout=StringIO())
+        self.assertEqual(self._entries()[-1], ('Adjustment', -2))
+        call_command('reconcile_balances', stdout=StringIO())
+
+
+@unittest.skipIf(connection.vendor == 'sqlite', 'SQLite serializes writers, so there is no contention to test')
+class BalanceLedgerConcurrencyTests(TransactionTestCase):
+
+    def _run_in_threads(self, targets):
+        errors = []
+
+        def run(target):
+            try:
+                target()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_parallel_approvals_keep_every_debit(self):
+        managers = [User.objects.create_user(username=f'm{i}', password='x', is_manager=True) for i in range(4)]
+        employee = User.objects.create_user(username='emp', password='x', is_employee=True)
+        leave_type = LeaveType.objects.create(name='Annual')
+        balance = LeaveBalance.objects.create(user=employee, leave_type=leave_type, balance=100)
+        monday = date.today() + timedelta(days=14 - date.today().weekday())
+        # Single-day leaves Monday to Saturday over 4 weeks: 24 working days.
+        leaves = [LeaveRequest.objects.create(user=employee, leave_type=leave_type, reason='r',
+                                              start_date=monday + timedelta(days=week * 7 + day),
+                                              end_date=monday + timedelta(days=week * 7 + day))
+                  for week in range(4) for day in range(6)]
+        # Every leave is approved by two managers at once; only one approval may debit it.
+        self._run_in_threads([
+            lambda leave=leave, manager=manager: approve_leave(leave, manager)
+            for leave in leaves for manager in managers[:2]
+        ] + [
+            lambda manager=manager: approve_leave(leaves[0], manager) for manager in managers[2:]
+        ])
+        balance.refresh_from_db()
+        self.assertEqual(balance.balance, 100 - len(leaves))
+        self.assertEqual(BalanceEntry.objects.filter(kind='Debit').count(), len(leaves))
+        self.assertEqual(reconcile_balances(), [])
+
+    def test_parallel_rollovers_process_each_employee_once(self):
+        casual = LeaveType.objects.create(name='Casual', accrual_frequency='Monthly',
+                                          carry_forward_allowed=True, max_carry_forward=5)
+        employees = [User.objects.create_user(username=f'e{i}', password='x', is_employee=True) for i in range(6)]
+        for user in employees:
+            LeaveBalance.objects.create(user=user, leave_type=casual, balance=8, last_accrued=date(2025, 12, 1))
+        BalanceEntry.objects.update(created_at=timezone.make_aware(datetime(2025, 12, 31)))
+        self._run_in_threads([lambda: year_end_rollover(2025, chunk_size=1) for _ in range(2)])
+        self.assertEqual(set(LeaveBalance.objects.values_list('balance', flat=True)), {5})
+        self.assertEqual(BalanceEntry.objects.filter(kind='Rollover').count(), len(employees))
+        self.assertEqual(AccrualRun.objects.get().rows_credited, len(employees))
+        self.assertEqual(reconcile_balances(), [])
+
+
+class BulkReviewTests(TestCase):
+
+    def setUp(self):
+        invalidate_delegation_index()
+        invalidate_working_day_calendar()
+        self.manager = User.objects.create_user(username='mgr', password='x', is_manager=True)
+        self.deputy = User.objects.create_user(username='deputy', password='x', is_manager=True)
+        self.employee = User.objects.create_user(username='emp', password='x', is_employee=True,
+                                                 email='emp@example.com', department='Sales')
+        self.annual = LeaveType.objects.create(name='Annual')
+        self.unpaid = LeaveType.objects.create(name='Unpaid')
+        LeaveBalance.objects.create(user=self.employee, leave_type=self.annual, balance=100)
+        self.monday = date.today() + timedelta(days=14 - date.today().weekday())
+        # The manager hands the third week over to the deputy.
+        Delegation.objects.create(manager=self.manager, delegate=self.deputy,
+                                  start_date=self.monday + timedelta(days=14), end_date=self.monday + timedelta(days=20))
+        self.client.force_login(self.manager)
+
+    def _leave(self, offset, length=2, leave_type=None, start=None):
+        start = (start or self.monday) + timedelta(days=offset)
+        return LeaveRequest.objects.create(user=self.employee, leave_type=leave_type or self.annual, reason='r',
+                                           start_date=start, end_date=start + timedelta(days=length - 1))
+
+    def _review(self, ids, action='approve', **extra):
+        return self.client.post(reverse('bulk_review'), {'leave_ids': ids, 'action': action, 'comments': 'Bulk'},
+                                **extra)
+
+    def test_results_report_each_leave(self):
+        first, second = self._leave(0), self._leave(2, length=3)
+        approved = self._leave(7)
+        approve_leave(approved, self.manager)
+        unpaid = self._leave(9, leave_type=self.unpaid)
+        delegated = self._leave(14)
+        response = self._review([first.pk, second.pk, approved.pk, unpaid.pk, delegated.pk, 9999],
+                                HTTP_ACCEPT='application/json')
+        results = {row['leave_id']: row for row in response.json()['results']}
+        self.assertEqual([row['ok'] for row in results.values()], [True, True, False, False, False, False])
+        self.assertEqual((results[first.pk]['working_days'], results[second.pk]['working_days']), (2, 3))
+        self.assertEqual(results[approved.pk]['error'], 'Leave request is already approved.')
+        self.assertEqual(results[unpaid.pk]['error'], 'emp has no Unpaid balance.')
+        self.assertEqual(results[delegated.pk]['error'], 'You are not authorized to review this leave.')
+        self.assertEqual(results[9999]['error'], 'Leave request not found.')
+
+        # 2 days for the leave approved beforehand, 5 for the batch.
+        self.assertEqual(LeaveBalance.objects.get(user=self.employee, leave_type=self.annual).balance, 93)
+        self.assertEqual(LeaveRequest.objects.filter(status='Pending').count(), 2)
+        self.assertEqual(DailyAbsence.objects.count(), 7)
+        self.assertEqual(Notification.objects.filter(subject='Your Leave Request Approved').count(), 3)
+        self.assertEqual(reconcile_balances(), [])
+        call_command('rebuild_leave_aggregates', verify=True, stdout=StringIO())
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        # Single-day leaves in one month, so every batch touches the same aggregate row.
+        march = date(date.today().year + 1, 3, 1)
+        march += timedelta(days=-march.weekday() % 7)
+        few = [self._leave(offset, length=1, start=march).pk for offset in (0, 1)]
+        many = [self._leave(offset, length=1, start=march).pk for offset in range(7, 27) if offset % 7 != 6]
+        self._review([self._leave(2, length=1, start=march).pk])  # warm the session, delegation index and calendar
+        with CaptureQueriesContext(connection) as small:
+            self._review(few)
+        with CaptureQueriesContext(connection) as large:
+            self._review(many)
+        self.assertEqual(len(small), len(large))
+        self.assertFalse(LeaveRequest.objects.filter(status='Pending').exists())
+
+    def test_bulk_reject_from_the_queue_form(self):
+        leaves = [self._leave(offset).pk for offset in (0, 2)]
+        response = self._review(leaves + [self._leave(14).pk], action='reject', follow=True)
+        self.assertRedirects(response, reverse('manager_dashboard'))
+        self.assertEqual(LeaveRequest.objects.filter(status='Rejected', comments='Bulk').count(), 2)
+        texts = [str(message) for message in response.context['messages']]
+        self.assertIn('2 leave request(s) rejected.', texts)
+        self.assertEqual(len(texts), 2)
+        self.assertEqual(self._review(['x']).status_code, 400)
+
+
+@override_settings(ROOT_URLCONF='leave.tests')
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        self.manager = User.objects.create_user(username='mgr', password='x', is_manager=True)
+        self.employee = User.objects.create_user(username='emp', password='x', is_employee=True, department='Sales')
+        leave_type = LeaveType.objects.create(name='Annual')
+        LeaveBalance.objects.create(user=self.employee, leave_type=leave_type, balance=20)
+        Holiday.objects.create(date=date.today() + timedelta(days=3), name='Founders Day')
+        monday = date.today() + timedelta(days=7 - date.today().weekday())
+        for week in range(3):
+            leave = LeaveRequest.objects.create(user=self.employee, leave_type=leave_type, reason='r',
+                                                start_date=monday + timedelta(days=week * 7),
+                                                end_date=monday + timedelta(days=week * 7 + 1))
+            approve_leave(leave, self.manager)
+        LeaveRequest.objects.create(user=self.employee, leave_type=leave_type, reason='r',
+                                    start_date=monday + timedelta(days=30), end_date=monday + timedelta(days=30))
+
+    def _sync(self, user, view, **params):
+        self.client.force_login(user)
+        return self.client.get(reverse(view), params).context
+
+    def _same_context(self, sync, context, keys):
+        for key in keys:
+            expected, actual = sync[key], context[key]
+            if hasattr(expected, 'object_list'):
+                expected, actual = [leave.pk for leave in expected], [leave.pk for leave in actual]
+            self.assertEqual(list(expected) if key == 'dept_leave_data' else expected,
+                             list(actual) if key == 'dept_leave_data' else actual, key)
+
+    async def test_async_reports_match_the_sync_view(self):
+        sync = await sync_to_async(self._sync)(self.manager, 'reports')
+        await self.async_client.aforce_login(self.manager)
+        await cache.aclear()
+        response = await self.async_client.get('/async-test/reports/')
+        self.assertEqual(response.status_code, 200)
+        self._same_context(sync, response.context,
+                           ('page_obj', 'calendar_map', 'holiday_dates', 'dept_leave_data', 'month_days'))
+
+    async def test_async_history_matches_the_sync_view(self):
+        sync = await sync_to_async(self._sync)(self.employee, 'leave_history')
+        await self.async_client.aforce_login(self.employee)
+        await cache.aclear()
+        response = await self.async_client.get('/async-test/leave-history/')
+        self.assertEqual(response.status_code, 200)
+        self._same_context(sync, response.context, ('page_obj',))
+        self.assertEqual([balance.balance for balance in response.context['balances']], [14])
+
+    async def test_role_check_still_applies(self):
+        await self.async_client.aforce_login(self.employee)
+        response = await self.async_client.get('/async-test/reports/')
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+
+
+class AsyncBenchCommandTests(TransactionTestCase):
+
+    def test_bench_async_reports_both_modes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench_async.json')
+            call_command('bench_async', employees=15, concurrency=4, requests=8, output=output, stdout=StringIO())
+            with open(output) as handle:
+                pages = json.load(handle)['pages']
+        self.assertEqual(set(pages), {'leave_history', 'reports'})
+        for rows in pages.values():
+            self.assertEqual(set(rows), {'sync', 'async'})
+            self.assertTrue(all(row['requests_per_second'] > 0 for row in rows.values()))
+
+
+class CountingEmailBackend(LocmemEmailBackend):
+    """Locmem backend that counts connections and can fail selected recipients."""
+
+    def __init__(self, *args, fail_for=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_for = set(fail_for)
+        self.opened = 0
+
+    def open(self):
+        self.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        if any(address in self.fail_for for message in messages for address in message.to):
+            raise ConnectionError('mailbox unavailable')
+        return super().send_messages(messages)
+
+
+class NotificationOutboxTests(TestCase):
+
+    def setUp(self):
+        invalidate_delegation_index()
+        invalidate_working_day_calendar()
+        self.manager = User.objects.create_user(username='mgr', email='mgr@example.com', password='x', is_manager=True)
+        self.employee = User.objects.create_user(username='emp', email='emp@example.com', password='x', is_employee=True)
+        self.leave_type = LeaveType.objects.create(name='Annual')
+        LeaveBalance.objects.create(user=self.employee, leave_type=self.leave_type, balance=20)
+
+    def test_workflow_queues_mail_and_worker_sends_it_over_one_connection(self):
+        start = date.today() + timedelta(days=14 - date.today().weekday())
+        self.client.force_login(self.employee)
+        self.client.post(reverse('apply_leave'), {'leave_type': self.leave_type.pk, 'start_date': start,
+                                                  'end_date': start + timedelta(days=1), 'reason': 'Trip'})
+        leave = LeaveRequest.objects.get()
+        self.client.force_login(self.manager)
+        self.client.post(reverse('approve_leave', args=[leave.pk]), {'comments': 'Enjoy'})
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Notification.objects.filter(status='Pending').count(), 2)
+
+        backend = CountingEmailBackend()
+        self.assertEqual(deliver_notifications(connection=backend), (2, 0))
+        self.assertEqual(backend.opened, 1)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['emp@example.com', 'mgr@example.com'])
+        self.assertIn('Enjoy', next(message.body for message in mail.outbox if message.to == ['emp@example.com']))
+        self.assertEqual(deliver_notifications(connection=backend), (0, 0))
+
+    def test_same_event_is_queued_once(self):
+        for _ in range(2):
+            queue_notifications([self.manager, self.manager], 'Subject', 'Body', 'leave-1-submitted')
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_failures_back_off_and_eventually_fail(self):
+        queue_notifications([self.manager, self.employee], 'Subject', 'Body', 'event')
+        backend = CountingEmailBackend(fail_for={'mgr@example.com'})
+        now = timezone.now()
+        self.assertEqual(deliver_notifications(connection=backend, now=now), (1, 1))
+        failed = Notification.objects.get(email='mgr@example.com')
+        self.assertEqual((failed.status, failed.attempts), ('Pending', 1))
+        self.assertEqual(failed.next_attempt_at, now + timedelta(minutes=1))
+        self.assertEqual(deliver_notifications(connection=backend, now=now), (0, 0))
+
+        for attempt in range(2, MAX_ATTEMPTS + 1):
+            now += timedelta(days=1)
+            deliver_notifications(connection=backend, now=now)
+        failed.refresh_from_db()
+        self.assertEqual((failed.status, failed.attempts), ('Failed', MAX_ATTEMPTS))
+        self.assertIn('mailbox unavailable', failed.last_error)
+
+    def test_command_drains_the_outbox_with_the_configured_backend(self):
+        queue_notifications([self.manager], 'Subject', 'Body', 'event')
+        call_command('deliver_notifications', '--once', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Notification.objects.get().status, 'Sent')
+
+
+class NotificationDigestTests(TestCase):
+
+    def setUp(self):
+        invalidate_delegation_index()
+        self.hourly = User.objects.create_user(username='hourly', email='hourly@example.com', password='x',
+                                               is_manager=True, notification_frequency='Hourly')
+        self.daily = User.objects.create_user(username='daily', email='daily@example.com', password='x',
+                                              is_manager=True, notification_frequency='Daily')
+        self.employee = User.objects.create_user(username='emp', email='emp@example.com', password='x', is_employee=True)
+        self.leave_type = LeaveType.objects.create(name='Annual')
+
+    def _submit(self, day):
+        leave = LeaveRequest.objects.create(user=self.employee, leave_type=self.leave_type, reason='r',
+                                            start_date=date(2030, 6, day), end_date=date(2030, 6, day))
+        queue_notifications([self.hourly, self.daily], f'New request {day}', 'body', f'leave-{leave.pk}-submitted', leave)
+        return leave
+
+    def test_items_are_held_and_folded_into_one_digest_per_recipient(self):
+        for day in (3, 4, 5):
+            self._submit(day)
+        self.assertEqual(deliver_notifications(connection=LocmemEmailBackend()), (0, 0))
+
+        later = timezone.now() + timedelta(hours=2)
+        # recipients, held rows, then savepoint, digest insert, status update, watermark insert, release
+        with self.assertNumQueries(7):
+            self.assertEqual(build_digests(now=later), 1)
+        digest = Notification.objects.get(status='Pending')
+        self.assertEqual((digest.email, digest.subject), ('hourly@example.com', 'Leave digest: 3 update(s)'))
+        self.assertIn('emp, Annual, 2030-06-05 to 2030-06-05 (Pending)', digest.body)
+        self.assertEqual(build_digests(now=later), 0)
+
+        self.assertEqual(build_digests(now=later + timedelta(days=1)), 1)
+        self.assertEqual(Notification.objects.filter(status='Digest').count(), 0)
+        deliver_notifications(connection=LocmemEmailBackend(), now=later + timedelta(days=1))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['daily@example.com', 'hourly@example.com'])
+
+    def test_watermark_prevents_resending(self):
+        self._submit(3)
+        later = timezone.now() + timedelta(days=2)
+        build_digests(now=later)
+        watermark = DigestWatermark.objects.get(recipient=self.hourly)
+        self.assertEqual(build_digests(now=later + timedelta(days=1)), 0)
+        self.assertEqual(Notification.objects.filter(subject__startswith='Leave digest', recipient=self.hourly).count(), 1)
+        self._submit(4)
+        build_digests(now=later + timedelta(days=2))
+        watermark.refresh_from_db()
+        self.assertEqual(watermark.last_notification_id, Notification.objects.filter(recipient=self.hourly,
+                                                                                   leave__isnull=False).latest('pk').pk)
+
+    def test_row_committed_below_the_watermark_is_still_digested(self):
+        self._submit(3)
+        late = Notification.objects.get(recipient=self.hourly)
+        # A later row was digested first, moving the watermark past the one committed late.
+        DigestWatermark.objects.create(recipient=self.hourly, last_notification_id=late.pk + 10)
+        build_digests(now=timezone.now() + timedelta(days=2))
+        late.refresh_from_db()
+        self.assertEqual(late.status, 'Digested')
+        digest = Notification.objects.get(recipient=self.hourly, subject__startswith='Leave digest')
+        self.assertIn('New request 3', digest.body)
+
+    def test_preference_form_and_switching_back_to_immediate(self):
+        self._submit(3)
+        self.client.force_login(self.daily)
+        self.client.post(reverse('notification_preferences'), {'notification_frequency': 'Immediate'})
+        self.daily.refresh_from_db()
+        self.assertEqual(self.daily.notification_frequency, 'Immediate')
+        self.assertEqual(build_digests(), 1)
+
+
+class CapacityTests(TestCase):
+
+    def setUp(self):
+        invalidate_delegation_index()
+        invalidate_working_day_calendar()
+        self.manager = User.objects.create_user(username='mgr', password='x', is_manager=True)
+        self.leave_type = LeaveType.objects.create(name='Annual')
+        self.first, self.second = [
+            User.objects.create_user(username=name, password='x', is_employee=True, department='Sales')
+            for name in ('first', 'second')
+        ]
+        for user in (self.first, self.second):
+            LeaveBalance.objects.create(user=user, leave_type=self.leave_type, balance=20)
+        self.rule = CapacityRule.objects.create(department='Sales', max_absent=1)
+        self.monday = date.today() + timedelta(days=7 - date.today().weekday())
+
+    def _leave(self, user, days=2, offset=0):
+        start = self.monday + timedelta(days=offset)
+        return LeaveRequest.objects.create(user=user, leave_type=self.leave_type, reason='r',
+                                           start_date=start, end_date=start + timedelta(days=days - 1))
+
+    def _occupancy(self):
+        return dict(DepartmentOccupancy.objects.filter(absent__gt=0).values_list('date', 'absent'))
+
+    def _apply(self, user, days=2):
+        self.client.force_login(user)
+        return self.client.post(reverse('apply_leave'), {
+            'leave_type': self.leave_type.pk, 'start_date': self.monday,
+            'end_date': self.monday + timedelta(days=days - 1), 'reason': 'Trip',
+        })
+
+    def test_counter_follows_approve_cancel_and_reject(self):
+        leave = self._leave(self.first)
+        approve_leave(leave, self.manager)
+        self.assertEqual(self._occupancy(), {self.monday: 1, self.monday + timedelta(days=1): 1})
+        cancel_leave(leave)
+        self.assertEqual(self._occupancy(), {})
+        other = self._leave(self.second, days=1)
+        review_leaves([other.pk], self.manager, approve=True)
+        self.assertEqual(self._occupancy(), {self.monday: 1})
+        reject_leave(other, self.manager)
+        self.assertEqual(self._occupancy(), {})
+        call_command('rebuild_department_occupancy', verify=True, stdout=StringIO())
+
+    def test_blocking_rule_refuses_the_application_with_one_range_query(self):
+        approve_leave(self._leave(self.first, days=1), self.manager)
+        with CaptureQueriesContext(connection) as queries:
+            response = self._apply(self.second)
+        self.assertEqual(sum('leave_departmentoccupancy' in query['sql'] for query in queries), 1)
+        errors = response.context['form'].non_field_errors()
+        self.assertIn(f'Sales already has the maximum of 1 on leave on {self.monday}.', errors)
+        self.assertFalse(LeaveRequest.objects.filter(user=self.second).exists())
+
+    def test_non_blocking_rule_only_warns(self):
+        self.rule.blocking = False
+        self.rule.save()
+        approve_leave(self._leave(self.first, days=1), self.manager)
+        response = self._apply(self.second)
+        self.assertRedirects(response, reverse('apply_leave'))
+        self.assertTrue(LeaveRequest.objects.filter(user=self.second).exists())
+        warnings = [str(message) for message in response.wsgi_request._messages]
+        self.assertTrue(any('maximum of 1 on leave' in message for message in warnings))
+
+    def test_queue_shows_days_over_capacity(self):
+        self._leave(self.second, days=3)
+        approve_leave(self._leave(self.first, days=2), self.manager)
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse('manager_dashboard'))
+        self.assertContains(response, '2 days over capacity')
+        self.rule.max_absent = 2
+        self.rule.save()
+        self.assertNotContains(self.client.get(reverse('manager_dashboard')), 'over capacity')
+
+    def test_department_change_moves_the_counts(self):
+        approve_leave(self._leave(self.first, days=1), self.manager)
+        self.first.department = 'Support'
+        self.first.save()
+        self.assertEqual(
+            list(DepartmentOccupancy.objects.filter(absent__gt=0).values_list('department', 'absent')),
+            [('Support', 1)],
+        )
+        DepartmentOccupancy.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_department_occupancy', verify=True, stdout=StringIO())
+        call_command('rebuild_department_occupancy', stdout=StringIO())
+        self.assertEqual(self._occupancy(), {self.monday: 1})
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        invalidate_delegation_index()
+        invalidate_working_day_calendar()
+        self.manager = User.objects.create_user(username='mgr', password='x', is_manager=True)
+        self.employee = User.objects.create_user(username='emp', password='x', is_employee=True, department='Sales')
+        self.leave_type = LeaveType.objects.create(name='Annual')
+        LeaveBalance.objects.create(user=self.employee, leave_type=self.leave_type, balance=20)
+        self.start = date.today() + timedelta(days=7 - date.today().weekday())
+        self.client.force_login(self.manager)
+
+    def test_unchanged_holiday_calendar_is_not_modified(self):
+        first = self.client.get(reverse('upcoming_holidays'))
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('private', first['Cache-Control'])
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('upcoming_holidays'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(reverse('upcoming_holidays'), HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        Holiday.objects.create(date=self.start, name='Founders Day')
+        response = self.client.get(reverse('upcoming_holidays'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertContains(response, 'holiday-badge')
+
+    def test_reports_follow_approved_leaves(self):
+        first = self.client.get(reverse('reports'))
+        leave = LeaveRequest.objects.create(user=self.employee, leave_type=self.leave_type, reason='r',
+                                            start_date=self.start, end_date=self.start)
+        # A new pending request does not show on the reports page.
+        self.assertEqual(self.client.get(reverse('reports'), HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        approve_leave(leave, self.manager)
+        response = self.client.get(reverse('reports'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<strong>emp</strong>')
+
+    def test_rendered_grid_is_reused(self):
+        self.client.get(reverse('reports'))
+        with CaptureQueriesContext(connection) as cached:
+            self.client.get(reverse('reports'))
+        cache.clear()
+        with CaptureQueriesContext(connection) as rendered:
+            self.client.get(reverse('reports'))
+        # The calendar's DailyAbsence and Holiday queries only run when the grid is rendered.
+        self.assertEqual(len(rendered) - len(cached), 2)
+
+    def test_delegation_index_follows_the_shared_stamp(self):
+        get_delegation_index()
+        with self.assertNumQueries(0):
+            get_delegation_index()
+        # Another worker process changed a delegation.
+        cache.set(DELEGATIONS_VERSION, 'elsewhere')
+        with self.assertNumQueries(2):
+            get_delegation_index()
+
+
+class HistoryFragmentCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        invalidate_working_day_calendar()
+        self.manager = User.objects.create_user(username='mgr', password='x', is_manager=True)
+        self.employee = User.objects.create_user(username='emp', password='x', is_employee=True)
+        leave_type = LeaveType.objects.create(name='Annual')
+        LeaveBalance.objects.create(user=self.employee, leave_type=leave_type, balance=20)
+        monday = date.today() + timedelta(days=7 - date.today().weekday())
+        self.leave = LeaveRequest.objects.create(user=self.employee, leave_type=leave_type, reason='r',
+                                                 start_date=monday, end_date=monday + timedelta(days=1))
+        self.client.force_login(self.employee)
+
+    def _balance(self, response):
+        return re.search(r'class="balance-days">(\d+)<', response.content.decode()).group(1)
+
+    def test_repeat_view_costs_only_session_and_auth(self):
+        self.client.get(reverse('leave_history'))
+        with self.assertNumQueries(2):
+            repeat = self.client.get(reverse('leave_history'))
+        self.assertEqual(self._balance(repeat), '20')
+        self.assertContains(repeat, 'status-pending')
+
+    @override_settings(ROOT_URLCONF='leave.tests')
+    def test_async_repeat_view_costs_only_session_and_auth(self):
+        self.client.get('/async-test/leave-history/')
+        with self.assertNumQueries(2):
+            response = self.client.get('/async-test/leave-history/')
+        self.assertEqual(self._balance(response), '20')
+
+    def test_writes_bump_the_version(self):
+        self.assertEqual(self._balance(self.client.get(reverse('leave_history'))), '20')
+        approve_leave(self.leave, self.manager)
+        response = self.client.get(reverse('leave_history'))
+        self.assertEqual(self._balance(response), '18')
+        self.assertContains(response, 'status-approved')
+        self.client.post(reverse('cancel_leave', args=[self.leave.pk]), {'cancel_reason': 'x'})
+        response = self.client.get(reverse('leave_history'))
+        self.assertEqual(self._balance(response), '20')
+        self.assertContains(response, 'status-cancelled')
+        # Set-based accrual writes bump the version as well.
+        LeaveBalance.objects.update(last_accrued=date.today() - timedelta(days=40))
+        LeaveType.objects.update(accrual_frequency='Monthly', accrual_amount=2)
+        credit_monthly(date.today())
+        self.assertNotEqual(self._balance(self.client.get(reverse('leave_history'))), '20')
+
+    def test_holiday_changes_refresh_working_days(self):
+        self.assertContains(self.client.get(reverse('leave_history')), '<td>2</td>')
+        Holiday.objects.create(date=self.leave.start_date, name='Founders Day')
+        self.assertContains(self.client.get(reverse('leave_history')), '<td>1</td>')
+
+
+# Routes the async views next to the regular ones for AsyncViewTests.
+urlpatterns = [
+    path('async-test/leave-history/', leave_views.leave_history_async_view),
+    path('async-test/reports/', leave_views.reports_async_view),
+    path('', include('leave_management.urls')),
+]
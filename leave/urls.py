@@ -1,24 +1,37 @@
 from django.urls import path
 from . import views
+from django.conf import settings
 from django.shortcuts import redirect
 
+# Under an ASGI worker the read-heavy pages are served by their async versions.
+if settings.LEAVE_ASYNC_VIEWS:
+    leave_history_view, reports_view = views.leave_history_async_view, views.reports_async_view
+else:
+    leave_history_view, reports_view = views.leave_history_view, views.reports_view
+
 urlpatterns = [
    path('', lambda request: redirect('login')),  
    path('login/', views.login_view, name='login'),
    path('logout/', views.logout_view, name='logout'),
    path('dashboard/', views.dashboard_view, name='dashboard'),
+   path('notification-preferences/', views.notification_preferences_view, name='notification_preferences'),
 
    # Employee-specific views
 
    path('apply-leave/', views.apply_leave_view, name='apply_leave'),
-   path('leave-history/', views.leave_history_view, name='leave_history'),
+   path('leave-history/', leave_history_view, name='leave_history'),
    path('upcoming-holidays/', views.holiday_calendar_view, name='upcoming_holidays'),
    path('leave-history/download/', views.download_leave_history_pdf, name='download_leave_history_pdf'),
+   path('leave-history/export/<int:job_id>/', views.export_status_view, name='export_status'),
+   path('leave-history/export/<int:job_id>/download/', views.export_download_view, name='export_download'),
    path('cancel-leave/<int:leave_id>/', views.cancel_leave_view, name='cancel_leave'),
 
    # Manager-specific views can be added here
    path('manager-dashboard/', views.manager_dashboard_view, name='manager_dashboard'),
    path('approve-leave/<int:leave_id>/', views.approve_leave_view, name='approve_leave'),
    path('reject-leave/<int:leave_id>/', views.reject_leave_view, name='reject_leave'),
-   path('reports/', views.reports_view, name='reports'),
+   path('review-leaves/', views.bulk_review_view, name='bulk_review'),
+   path('reports/', reports_view, name='reports'),
+   path('reports/export/approved-leaves/', views.export_approved_leaves_view, name='export_approved_leaves'),
+   path('reports/export/department-summary/', views.export_department_summary_view, name='export_department_summary'),
 ]
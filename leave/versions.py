@@ -0,0 +1,88 @@
+import time
+import uuid
+from datetime import datetime, timezone
+from django.core.cache import cache
+from django.db import transaction
+
+# Global stamps, one per table whose changes many cached pages depend on.
+# Holidays change the working days shown for every leave.
+HOLIDAYS_VERSION = 'leave:version:holidays'
+# Approved leave requests, with the users, DailyAbsence rows and LeaveAggregate totals shown next to them.
+APPROVED_LEAVES_VERSION = 'leave:version:approved-leaves'
+# Delegations and manager flags, i.e. who may approve whose leave.
+DELEGATIONS_VERSION = 'leave:version:delegations'
+
+
+def user_version_key(user_id):
+    """Cache key of the version stamp for one user's leave requests and balances."""
+    return f'leave:version:user:{user_id}'
+
+
+def _stamp():
+    return f'{int(time.time())}-{uuid.uuid4().hex}'
+
+
+def stamp_time(stamp):
+    """When ``stamp`` was issued, as an aware UTC datetime."""
+    seconds = (stamp or '').partition('-')[0]
+    if not seconds.isdigit():
+        return datetime.now(timezone.utc)
+    return datetime.fromtimestamp(int(seconds), timezone.utc)
+
+
+def get_versions(*keys):
+    """
+    Return the current version stamp for each key, creating missing ones.
+
+    Stamps are random rather than counters, so a stamp that was evicted from
+    the cache is replaced by one no cached fragment was ever keyed on. Each
+    stamp starts with the second it was issued (see ``stamp_time``).
+
+    Args:
+        *keys (str): Version keys.
+
+    Returns:
+        list[str]: One stamp per key, in the order given.
+    """
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _stamp(), timeout=None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+async def aget_versions(*keys):
+    """Async version of ``get_versions``."""
+    found = await cache.aget_many(keys)
+    for key in keys:
+        if key not in found:
+            await cache.aadd(key, _stamp(), timeout=None)
+            found[key] = await cache.aget(key)
+    return [found[key] for key in keys]
+
+
+def bump_versions(keys):
+    """
+    Give each key a new version stamp, so fragments cached under the old one are no longer used.
+
+    The keys are bumped now and again once the surrounding transaction commits,
+    so a fragment rendered from data read before the commit is not kept.
+
+    Args:
+        keys (Iterable[str]): Version keys.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+
+    def bump():
+        cache.set_many({key: _stamp() for key in keys}, timeout=None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def bump_user_versions(user_ids):
+    """Bump the version of every given user's leave requests and balances."""
+    bump_versions(user_version_key(user_id) for user_id in set(user_ids))
@@ -1,19 +1,40 @@
-from django.shortcuts import render, redirect
+import asyncio
+from dataclasses import asdict
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login ,logout
 from django.contrib.auth.decorators import login_required
-from .models import LeaveRequest, LeaveBalance , Holiday
+from .models import LeaveRequest, Holiday, ExportJob
 from datetime import timedelta
-from .helpers import get_working_days, get_active_managers
-from .decorators import employee_required , manager_required
-from .forms import LeaveRequestForm
-from django.core.mail import send_mail
+from .helpers import get_active_managers, get_approval_queue
+from .accrual import aget_balances, get_balances
+from .services import approve_leave, cancel_leave, reject_leave, review_leaves, submit_leave_application
+from .absence import aabsentees, absentees
+from .aggregates import department_totals
+from .capacity import days_over_capacity
+from .exports import request_history_export, run_export_job
+from .decorators import employee_required , manager_required, versioned
+from .forms import LeaveRequestForm, NotificationPreferenceForm, ReportFilterForm
+from .reports import (APPROVED_LEAVE_HEADER, DEPARTMENT_SUMMARY_HEADER, aexport_rows, approved_leave_row,
+                      approved_leaves, department_summary, department_summary_row, export_rows)
+from .streaming import XLSX_CONTENT_TYPE, astream_csv, astream_xlsx, stream_csv, stream_xlsx
 from django.conf import settings
 from django.contrib import messages
 from datetime import date
-from fpdf import FPDF
-from django.http import HttpResponse
-from django.db.models import Count
-from io import BytesIO
+from django.http import FileResponse, JsonResponse, Http404, HttpResponseBadRequest, StreamingHttpResponse
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from .pagination import akeyset_page, keyset_page
+from .versions import (APPROVED_LEAVES_VERSION, HOLIDAYS_VERSION, aget_versions, get_versions,
+                       user_version_key)
+
+APPROVAL_QUEUE_PAGE_SIZE = 25
+LEAVE_HISTORY_PAGE_SIZE = 25
+REPORTS_PAGE_SIZE = 50
+BULK_REVIEW_LIMIT = 500
 
 def login_view(request):
     """
@@ -68,77 +89,29 @@ def apply_leave_view(request):
 
     - Validates leave request form on POST.
     - Checks leave balance for the selected leave type.
-    - Prevents overlapping approved or pending leaves.
+    - Prevents overlapping approved or pending leaves (rejected by a database constraint on insert).
     - Warns about holidays in period (not counted as leave days).
+    - Checks the department's capacity limit: blocks or warns, depending on its rule.
     - Blocks leave if includes Sundays.
-    - Saves leave request with 'Pending' status.
-    - Sends email notifications to active managers considering delegation.
+    - Reports every failed check at once on the re-rendered form.
+    - Saves leave request with 'Pending' status in the same transaction as the checks.
+    - Queues email notifications to active managers considering delegation (sent by deliver_notifications).
     - Displays leave application form on GET request.
     """
     if request.method == 'POST':
         form = LeaveRequestForm(request.POST)
         if form.is_valid():
-            leave_type = form.cleaned_data['leave_type']
-            start_date = form.cleaned_data['start_date']
-            end_date = form.cleaned_data['end_date']
-
-            working_days = get_working_days(start_date, end_date)
-            total_working_days = len(working_days)
-
-            # Check for Sundays in period
-            from datetime import timedelta
-            all_days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
-            sundays_in_period = [day for day in all_days if day.weekday() == 6]
-            if sundays_in_period:
-                messages.error(request, f"Cannot apply leave on Sundays: {', '.join(str(s) for s in sundays_in_period)}.")
-                return redirect('apply_leave')
-
-            balance_obj = LeaveBalance.objects.filter(user=request.user, leave_type=leave_type).first()
-            if not balance_obj or balance_obj.balance < total_working_days:
-                messages.error(request, f'Insufficient leave balance (working days: {total_working_days}).')
-                return redirect('apply_leave')
-
-            # Check overlapping approved leaves
-            overlapping = LeaveRequest.objects.filter(
-                user=request.user,
-                status='Approved',
-                start_date__lte=end_date,
-                end_date__gte=start_date
-            )
-            if overlapping.exists():
-                messages.error(request, "You already have approved leave during this period.")
-                return redirect('apply_leave')
-
-            # Check overlapping pending leaves
-            pending_overlapping = LeaveRequest.objects.filter(
-                user=request.user,
-                status='Pending',
-                start_date__lte=end_date,
-                end_date__gte=start_date
-            )
-            if pending_overlapping.exists():
-                messages.error(request, "You have a pending leave during this period.")
-                return redirect('apply_leave')
+            application, leave = submit_leave_application(form, request.user)
+            if leave is None:
+                # Report every failed check together instead of stopping at the first one
+                for error in application.errors:
+                    form.add_error(None, error)
+                return render(request, 'accounts/apply_leave.html', {'form': form})
 
             # Holiday warning
-            holidays_in_period = Holiday.objects.filter(date__range=[start_date, end_date]).count()
-            if holidays_in_period > 0:
-                messages.warning(request, f"Note: {holidays_in_period} holidays in your leave period (not counted as leave days).")
-
-            leave = form.save(commit=False)
-            leave.user = request.user
-            leave.status = 'Pending'
-            leave.save()
-
-            active_managers = get_active_managers(start_date)
-            for manager in active_managers:
-                print("Send mail to................. ",manager.email)
-                # send_mail(
-                #     subject=f"New Leave Request from {request.user.username}",
-                #     message=f"{request.user.username} applied for {leave_type.name} from {start_date} to {end_date} ({total_working_days} working days).",
-                #     from_email=settings.DEFAULT_FROM_EMAIL,
-                #     recipient_list=[manager.email],
-                # )
+            for warning in application.warnings:
+                messages.warning(request, warning)
+            total_working_days = application.working_days
 
             messages.success(request, f'Leave request submitted ({total_working_days} working days).')
             return redirect('apply_leave')
@@ -151,21 +124,77 @@ def leave_history_view(request):
     """
     Display the logged-in employee's leave history and current leave balances.
 
-    - Fetches all leave requests of the user ordered by start date (latest first).
-    - Retrieves the user's leave balances.
+    - Fetches one page of the user's leave requests (latest first) with leave type and approver joined.
+    - Retrieves the user's leave balances, accrued up to today.
+    - Both are loaded lazily: the balance cards and the history table are cached
+      fragments keyed by the user's data version, so a repeat visit queries neither.
     - Passes today's date for reference in the template.
+    - Passes a pending PDF export job id, if any, so the page can poll for it.
     """
-    leaves = LeaveRequest.objects.filter(user=request.user).order_by('-start_date')
-    balances = LeaveBalance.objects.filter(user=request.user)
-    return render(request, 'accounts/leave_history.html', {'leaves': leaves, 'balances': balances, 'today': date.today()})
+    context = _leave_history_context(request, *get_versions(user_version_key(request.user.pk), HOLIDAYS_VERSION))
+    context['leaves'] = context['page_obj'] = SimpleLazyObject(
+        lambda: keyset_page(_leave_history(request.user), request.GET, LEAVE_HISTORY_PAGE_SIZE, descending=True)
+    )
+    context['balances'] = SimpleLazyObject(lambda: get_balances(request.user))
+    return render(request, 'accounts/leave_history.html', context)
+
+
+@login_required
+@employee_required
+async def leave_history_async_view(request):
+    """
+    Async version of ``leave_history_view``, served when ``LEAVE_ASYNC_VIEWS`` is on.
+
+    When both fragments are cached nothing is queried. Otherwise the history
+    page and the balances are independent, so both queries are issued together
+    with ``asyncio.gather``.
+    """
+    context = _leave_history_context(
+        request, *await aget_versions(user_version_key(request.user.pk), HOLIDAYS_VERSION),
+    )
+    fragments = [
+        make_template_fragment_key('leave_balances', [context['fragment_key']]),
+        make_template_fragment_key('leave_history_table', [context['fragment_key'], context['page_key']]),
+    ]
+    if len(await cache.aget_many(fragments)) < len(fragments):
+        page_obj, balances = await asyncio.gather(
+            akeyset_page(_leave_history(request.user), request.GET, LEAVE_HISTORY_PAGE_SIZE, descending=True),
+            aget_balances(request.user),
+        )
+        context.update(leaves=page_obj, page_obj=page_obj, balances=balances)
+    return await sync_to_async(render)(request, 'accounts/leave_history.html', context)
+
+
+def _leave_history(user):
+    return LeaveRequest.objects.filter(user=user).select_related('leave_type', 'approver').only(
+        'start_date', 'end_date', 'reason', 'status', 'comments', 'leave_type__name', 'approver__username',
+    )
+
+
+def _leave_history_context(request, user_version, holidays_version):
+    export_job_id = request.GET.get('export', '')
+    export_job_id = int(export_job_id) if export_job_id.isdigit() else None
+    today = date.today()
+    return {
+        'leaves': None, 'page_obj': None, 'balances': None, 'today': today,
+        'export_job_id': export_job_id,
+        # Balances accrue and cancel buttons expire by date, so the fragments are per day too.
+        'fragment_key': f'{request.user.pk}:{user_version}:{holidays_version}:{today.isoformat()}',
+        'page_key': f"{request.GET.get('after', '')}:{request.GET.get('before', '')}",
+        'fragment_timeout': settings.LEAVE_FRAGMENT_CACHE_TIMEOUT,
+    }
 
 @login_required
+@versioned(HOLIDAYS_VERSION)
 def holiday_calendar_view(request):
     """
     Renders a calendar view of upcoming holidays for the next 30 days.
 
     Fetches all holidays within the next 30 days from today and maps each date 
-    to its holiday name for display in the template.
+    to its holiday name for display in the template. The page only changes
+    with the date and the Holiday version stamp: an unchanged page is answered
+    with 304, and the rendered grid is cached under (today, version), so the
+    holidays are only queried when the grid is rendered again.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -177,12 +206,13 @@ def holiday_calendar_view(request):
     """
     today = date.today()
     month_days = [today + timedelta(days=i) for i in range(30)]
-    holidays = Holiday.objects.filter(date__range=[today, today + timedelta(days=30)])
-    holiday_dates = {h.date: h.name for h in holidays}
+    holiday_dates = SimpleLazyObject(lambda: _holiday_names(today))
 
     context = {
         'month_days': month_days,
-        'holiday_dates': holiday_dates
+        'holiday_dates': holiday_dates,
+        'grid_key': f"{today.isoformat()}:{get_versions(HOLIDAYS_VERSION)[0]}",
+        'fragment_timeout': settings.LEAVE_FRAGMENT_CACHE_TIMEOUT,
     }
     return render(request, 'accounts/holiday_calendar.html', context)
 
@@ -190,39 +220,60 @@ def holiday_calendar_view(request):
 @login_required
 @employee_required
 def download_leave_history_pdf(request):
-    leaves = LeaveRequest.objects.filter(user=request.user).order_by('-start_date')
-    balances = LeaveBalance.objects.filter(user=request.user)
-
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", 'B', 16)
-    pdf.cell(0, 10, f"{request.user.username} - Leave History", ln=True, align="C")
-    pdf.ln(10)
-
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(0, 10, "Leave Balances:", ln=True)
-    pdf.set_font("Arial", '', 12)
-    for bal in balances:
-        pdf.cell(0, 8, f"{bal.leave_type.name}: {bal.balance} days", ln=True)
-    pdf.ln(5)
-
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(0, 10, "Leave History:", ln=True)
-    pdf.set_font("Arial", '', 12)
-    for leave in leaves:
-        approver_name = leave.approver.username if leave.approver else '-'
-        pdf.cell(0, 8, f"{leave.start_date} to {leave.end_date} | {leave.leave_type.name} | {leave.status} | Approver: {approver_name}", ln=True)
-        pdf.multi_cell(0, 8, f"Reason: {leave.reason}")
-        pdf.ln(2)
-
-    # Write PDF to memory
-    buffer = BytesIO()
-    pdf.output(buffer)
-    buffer.seek(0)
-
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{request.user.username}_leave_history.pdf"'
-    return response
+    """
+    Serve the employee's leave history PDF, rendering it off the request path.
+
+    - If an artifact for the current version of the user's leaves and balances
+      is cached on disk, it is returned straight away.
+    - Otherwise an export job is queued for the worker (or run inline when
+      LEAVE_EXPORT_RUN_INLINE is set) and the user is sent back to the history
+      page, which polls the job and downloads the file when it is ready.
+    """
+    job = request_history_export(request.user)
+    if job.status == 'Queued' and getattr(settings, 'LEAVE_EXPORT_RUN_INLINE', False):
+        job.status, job.started_at = 'Running', timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+        run_export_job(job)
+    if job.status == 'Done':
+        try:
+            return _export_file_response(request, job)
+        except FileNotFoundError:
+            # A newer version replaced the artifact after the lookup; queue the current one.
+            job = request_history_export(request.user)
+
+    messages.info(request, 'Your leave history PDF is being prepared and will download automatically.')
+    return redirect(f"{reverse('leave_history')}?export={job.pk}")
+
+
+def _export_file_response(request, job):
+    return FileResponse(open(job.file_path, 'rb'), as_attachment=True,
+                        filename=f"{request.user.username}_leave_history.pdf", content_type='application/pdf')
+
+
+@login_required
+@employee_required
+def export_status_view(request, job_id):
+    """
+    Report the status of one of the employee's export jobs as JSON, for polling.
+    """
+    job = get_object_or_404(ExportJob, pk=job_id, user=request.user)
+    data = {'id': job.pk, 'status': job.status}
+    if job.status == 'Done':
+        data['download_url'] = reverse('export_download', args=[job.pk])
+    return JsonResponse(data)
+
+
+@login_required
+@employee_required
+def export_download_view(request, job_id):
+    """
+    Download the artifact of a finished export job.
+    """
+    job = get_object_or_404(ExportJob, pk=job_id, user=request.user, status='Done')
+    try:
+        return _export_file_response(request, job)
+    except FileNotFoundError:
+        raise Http404('Export file no longer available.')
 
 @login_required
 @employee_required
@@ -232,7 +283,7 @@ def cancel_leave_view(request, leave_id):
 
     Only pending or approved leaves that have not started can be cancelled. 
     If the leave was approved, the leave balance is restored. 
-    All active managers are notified via email about the cancellation.
+    All active managers are notified via email about the cancellation (queued in the outbox).
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -257,29 +308,8 @@ def cancel_leave_view(request, leave_id):
     if request.method == 'POST':
         reason = request.POST.get('cancel_reason', '')
         
-        # If approved leave, restore balance
-        if leave.status == 'Approved':
-            working_days = get_working_days(leave.start_date, leave.end_date)
-            total_days = len(working_days)
-            balance = LeaveBalance.objects.get(user=request.user, leave_type=leave.leave_type)
-            balance.balance += total_days
-            balance.save()
-        
-        # Update leave status
-        leave.status = 'Cancelled'
-        leave.comments = f"Cancelled by employee. Reason: {reason}"
-        leave.save()
-        
-        # UPDATED: Notify active managers (considering delegation)
-        active_managers = get_active_managers()
-        for manager in active_managers:
-            print("Cancel mail to................. ",manager.email)
-            # send_mail(
-            #     subject=f"Leave Cancelled by {request.user.username}",
-            #     message=f"{request.user.username} cancelled their {leave.leave_type.name} leave from {leave.start_date} to {leave.end_date}.\nReason: {reason}",
-            #     from_email=settings.DEFAULT_FROM_EMAIL,
-            #     recipient_list=[manager.email],
-            # )
+        # Restore the balance if it was approved, mark the leave cancelled and queue the managers' emails
+        cancel_leave(leave, reason)
         
         messages.success(request, 'Leave request cancelled successfully.')
         return redirect('leave_history')
@@ -298,26 +328,44 @@ def manager_dashboard_view(request):
 
     Displays pending leave requests that the logged-in manager can approve. 
     Includes leaves where the manager is either the direct approver or has delegated approval authority.
+    The queue is resolved in one filtered query and paginated by keyset on (start_date, id),
+    so the page cost does not grow with the company-wide backlog or the page depth.
+    Each leave is annotated in the same query with the number of its working days on which
+    the employee's department is already at its capacity limit.
 
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
-        HttpResponse: Renders 'manager_leave_requests.html' with a list of approvable pending leaves.
+        HttpResponse: Renders 'manager_leave_requests.html' with a page of approvable pending leaves.
     """
-    today = date.today()
-    
-    # Get leaves where user is direct manager OR has delegation
-    pending_leaves = LeaveRequest.objects.filter(status='Pending')
-    
-    # Filter leaves current manager can approve
-    approvable_leaves = []
-    for leave in pending_leaves:
-        active_managers = get_active_managers(leave.start_date)
-        if request.user in active_managers:
-            approvable_leaves.append(leave)
-    
-    return render(request, 'accounts/manager_leave_requests.html', {'pending_leaves': approvable_leaves})
+    approvable_leaves = get_approval_queue(request.user).select_related('user', 'leave_type').only(
+        'start_date', 'end_date', 'reason', 'user__username', 'user__department', 'leave_type__name',
+    ).annotate(days_over_capacity=days_over_capacity())
+    page_obj = keyset_page(approvable_leaves, request.GET, APPROVAL_QUEUE_PAGE_SIZE)
+
+    return render(request, 'accounts/manager_leave_requests.html', {
+        'pending_leaves': page_obj, 'page_obj': page_obj,
+        'preference_form': NotificationPreferenceForm(instance=request.user),
+    })
+
+
+@login_required
+def notification_preferences_view(request):
+    """
+    Save how the logged-in user receives notification emails.
+
+    POST: Update the user's notification frequency (immediate, hourly or daily digest).
+    Redirects back to the dashboard either way.
+    """
+    if request.method == 'POST':
+        form = NotificationPreferenceForm(request.POST, instance=request.user)
+        if form.is_valid():
+            form.save()
+            messages.success(request, f'Notification emails: {request.user.get_notification_frequency_display()}.')
+        else:
+            messages.error(request, 'Invalid notification preference.')
+    return redirect('dashboard')
 
 @login_required
 @manager_required
@@ -328,7 +376,7 @@ def approve_leave_view(request, leave_id):
     - Checks if the current user is authorized (direct or delegated manager).
     - Updates leave status to 'Approved' and saves manager comments.
     - Deducts the leave days from the user's leave balance.
-    - Sends an email notification to the employee.
+    - Queues an email notification to the employee in the outbox.
     - Displays success or error messages and redirects appropriately.
 
     Args:
@@ -348,28 +396,13 @@ def approve_leave_view(request, leave_id):
     
     if request.method == 'POST':
         comments = request.POST.get('comments', '')
-        leave.status = 'Approved'
-        leave.approver = request.user
-        leave.comments = comments
-        leave.save()
-
-        # Deduct working days from balance
-        working_days = get_working_days(leave.start_date, leave.end_date)
-        total_days = len(working_days)
-        balance = LeaveBalance.objects.get(user=leave.user, leave_type=leave.leave_type)
-        balance.balance -= total_days
-        balance.save()
-
-        # Send email
-        print("Approved mail to................. ",leave.user.email)
-        # send_mail(
-        #     subject=f"Your Leave Request Approved",
-        #     message=f"Your leave from {leave.start_date} to {leave.end_date} ({total_days} working days) has been approved by {request.user.username}.\nComments: {comments}",
-        #     from_email=settings.DEFAULT_FROM_EMAIL,
-        #     recipient_list=[leave.user.email],
-        # )
-
-        messages.success(request, f'Leave approved ({total_days} working days).')
+        # Approve, deduct working days from balance and queue the employee's email
+        result = approve_leave(leave, request.user, comments)
+
+        if result.ok:
+            messages.success(request, f'Leave approved ({result.working_days} working days).')
+        else:
+            messages.error(request, result.error)
         return redirect('manager_dashboard')
     
     return render(request, 'accounts/approve_leave_modal.html', {'leave': leave})
@@ -389,7 +422,7 @@ def reject_leave_view(request, leave_id):
     2. On POST:
        - Updates leave status to 'Rejected'.
        - Adds manager comments.
-       - Sends email notification to the employee.
+       - Queues an email notification to the employee in the outbox.
        - Shows a success message and redirects to manager dashboard.
     3. On GET:
        - Renders the rejection modal/template.
@@ -404,19 +437,8 @@ def reject_leave_view(request, leave_id):
     
     if request.method == 'POST':
         comments = request.POST.get('comments', '')
-        leave.status = 'Rejected'
-        leave.approver = request.user
-        leave.comments = comments
-        leave.save()
-
-        # Send email
-        print("Rejected mail to................. ",leave.user.email)
-        # send_mail(
-        #     subject=f"Your Leave Request Rejected",
-        #     message=f"Your leave from {leave.start_date} to {leave.end_date} has been rejected by {request.user.username}.\nReason: {comments}",
-        #     from_email=settings.DEFAULT_FROM_EMAIL,
-        #     recipient_list=[leave.user.email],
-        # )
+        # Reject and queue the employee's email
+        reject_leave(leave, request.user, comments)
 
         messages.error(request, f'Leave request by {leave.user.username} rejected.')
         return redirect('manager_dashboard')
@@ -426,62 +448,191 @@ def reject_leave_view(request, leave_id):
 
 @login_required
 @manager_required
+def bulk_review_view(request):
+    """
+    Approve or reject several leave requests in one go.
+
+    POST fields: ``leave_ids`` (repeated), ``action`` ('approve' or 'reject') and
+    ``comments``. Authorization, working days, status changes and balance debits
+    are handled for the whole set at once by ``review_leaves``; leaves that
+    cannot be reviewed are reported without stopping the others.
+
+    Returns:
+        JsonResponse: ``{"results": [...]}`` with one entry per leave, when the client accepts JSON.
+        HttpResponse: Otherwise a summary message and a redirect to the manager dashboard.
+    """
+    if request.method != 'POST':
+        return redirect('manager_dashboard')
+
+    action = request.POST.get('action')
+    raw_ids = request.POST.getlist('leave_ids')
+    if action not in ('approve', 'reject') or not raw_ids or not all(pk.isdigit() for pk in raw_ids):
+        return HttpResponseBadRequest('Choose approve or reject and at least one leave request.')
+    if len(raw_ids) > BULK_REVIEW_LIMIT:
+        return HttpResponseBadRequest(f'At most {BULK_REVIEW_LIMIT} leave requests can be reviewed at once.')
+
+    results = review_leaves([int(pk) for pk in raw_ids], request.user, action == 'approve',
+                            request.POST.get('comments', ''))
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({'results': [asdict(result) for result in results]})
+
+    done = sum(result.ok for result in results)
+    if done:
+        messages.success(request, f"{done} leave request(s) {'approved' if action == 'approve' else 'rejected'}.")
+    for result in results:
+        if not result.ok:
+            messages.error(request, f'Leave request #{result.leave_id}: {result.error}')
+    return redirect('manager_dashboard')
+
+
+def _holiday_names(today):
+    return {h.date: h.name for h in Holiday.objects.filter(date__range=[today, today + timedelta(days=30)])}
+
+
+@login_required
+@manager_required
+@versioned(HOLIDAYS_VERSION, APPROVED_LEAVES_VERSION)
 def reports_view(request):
     """
     Display leave reports for managers.
 
-    - Lists all approved leaves with details.
+    - Lists approved leaves with details, one keyset page at a time (latest first).
     - Prepares a 30-day calendar mapping upcoming approved leaves to dates.
     - Fetches upcoming holidays with their names.
     - Aggregates department-wise total leaves taken.
+    - Answers 304 while the holidays and approved leaves are unchanged, and
+      caches the rendered calendar under (today, versions), so its two
+      queries only run when it is rendered again.
     
     Context passed to template:
-        all_approved_leaves: QuerySet of all approved LeaveRequest objects.
+        all_approved_leaves: Page of approved LeaveRequest objects (also passed as page_obj).
         calendar_map: Dict mapping dates to usernames on leave.
         month_days: List of the next 30 days.
         holiday_dates: Dict mapping holiday dates to their names.
-        dept_leave_data: Department-wise leave counts.
+        dept_leave_data: Department-wise leave counts and working days.
     """
     today = date.today()
     
-    # Get all approved leaves with full details
-    all_approved_leaves = LeaveRequest.objects.filter(
-        status='Approved'
-    ).select_related('user', 'leave_type', 'approver').order_by('-start_date')
+    # One page of approved leaves with full details
+    all_approved_leaves = keyset_page(approved_leaves(), request.GET, REPORTS_PAGE_SIZE, descending=True)
     
-    # Upcoming leaves for calendar
-    upcoming_leaves = LeaveRequest.objects.filter(
-        status='Approved',
-        start_date__lte=today + timedelta(days=30),
-        end_date__gte=today
-    ).order_by('start_date')
-
-    calendar_map = {}
-    for leave in upcoming_leaves:
-        current = leave.start_date
-        while current <= leave.end_date:
-            if current not in calendar_map:
-                calendar_map[current] = []
-            calendar_map[current].append(leave.user.username)
-            current += timedelta(days=1)
+    # Who is out on each of the next 30 days, from the DailyAbsence table
+    calendar_map = SimpleLazyObject(lambda: absentees(today, today + timedelta(days=29)))
 
     # Get holidays with names
-    holidays = Holiday.objects.filter(
-        date__range=[today, today + timedelta(days=30)]
+    holiday_dates = SimpleLazyObject(lambda: _holiday_names(today))
+
+    # Department-wise total leaves taken, from the LeaveAggregate summary table
+    dept_leave_data = department_totals()
+
+    context = _reports_context(today, all_approved_leaves, calendar_map, holiday_dates, dept_leave_data)
+    return render(request, 'accounts/reports.html', context)
+
+
+@login_required
+@manager_required
+@versioned(HOLIDAYS_VERSION, APPROVED_LEAVES_VERSION)
+async def reports_async_view(request):
+    """
+    Async version of ``reports_view``, served when ``LEAVE_ASYNC_VIEWS`` is on.
+
+    The approved-leave page, the absence calendar, the holidays and the
+    department totals do not depend on each other, so the four queries are
+    issued together with ``asyncio.gather``; the calendar's two are skipped
+    when its rendered grid is cached.
+    """
+    today = date.today()
+
+    async def holiday_names():
+        holidays = Holiday.objects.filter(date__range=[today, today + timedelta(days=30)])
+        return {h.date: h.name async for h in holidays}
+
+    async def department_rows():
+        return [row async for row in department_totals()]
+
+    async def nothing():
+        return None
+
+    grid_key = _reports_grid_key(today, await aget_versions(HOLIDAYS_VERSION, APPROVED_LEAVES_VERSION))
+    grid_cached = await cache.ahas_key(make_template_fragment_key('reports_calendar', [grid_key]))
+    all_approved_leaves, calendar_map, holiday_dates, dept_leave_data = await asyncio.gather(
+        akeyset_page(approved_leaves(), request.GET, REPORTS_PAGE_SIZE, descending=True),
+        nothing() if grid_cached else aabsentees(today, today + timedelta(days=29)),
+        nothing() if grid_cached else holiday_names(),
+        department_rows(),
     )
-    holiday_dates = {h.date: h.name for h in holidays}
+    context = _reports_context(today, all_approved_leaves, calendar_map, holiday_dates, dept_leave_data, grid_key)
+    return await sync_to_async(render)(request, 'accounts/reports.html', context)
 
-    # Department-wise total leaves taken
-    dept_leave_data = LeaveRequest.objects.filter(status='Approved') \
-        .values('user__department', 'leave_type__name') \
-        .annotate(total=Count('id')) \
-        .order_by('user__department')
 
-    context = {
+def _reports_grid_key(today, versions):
+    return ':'.join([today.isoformat(), *versions])
+
+
+def _reports_context(today, all_approved_leaves, calendar_map, holiday_dates, dept_leave_data, grid_key=None):
+    if grid_key is None:
+        grid_key = _reports_grid_key(today, get_versions(HOLIDAYS_VERSION, APPROVED_LEAVES_VERSION))
+    return {
         'all_approved_leaves': all_approved_leaves,
+        'page_obj': all_approved_leaves,
         'calendar_map': calendar_map,
         'month_days': [today + timedelta(days=i) for i in range(30)],
         'holiday_dates': holiday_dates,
-        'dept_leave_data': dept_leave_data
+        'dept_leave_data': dept_leave_data,
+        'export_form': ReportFilterForm(),
+        'grid_key': grid_key,
+        'fragment_timeout': settings.LEAVE_FRAGMENT_CACHE_TIMEOUT,
     }
-    return render(request, 'accounts/reports.html', context)
+
+
+def _stream_report(request, name, header, queryset, to_row):
+    """
+    Stream a report as CSV or XLSX, filtered by the ReportFilterForm query parameters.
+
+    Under an ASGI worker (``LEAVE_ASYNC_VIEWS``) the rows are read with an
+    async iterator; Django would otherwise read a sync iterator into memory in
+    full before sending the first byte.
+
+    Args:
+        name (str): Base file and sheet name.
+        header (list[str]): Column titles.
+        queryset (callable): Takes the cleaned filters and returns the queryset to export.
+        to_row (callable): Turns one item of the queryset into a row.
+    """
+    form = ReportFilterForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest('; '.join(error for errors in form.errors.values() for error in errors))
+
+    filters = {key: form.cleaned_data[key] for key in ('start_date', 'end_date', 'department')}
+    if settings.LEAVE_ASYNC_VIEWS:
+        rows, write_csv, write_xlsx = aexport_rows(queryset(filters), to_row), astream_csv, astream_xlsx
+    else:
+        rows, write_csv, write_xlsx = export_rows(queryset(filters), to_row), stream_csv, stream_xlsx
+    if form.cleaned_data['format'] == 'xlsx':
+        response = StreamingHttpResponse(write_xlsx(name, header, rows), content_type=XLSX_CONTENT_TYPE)
+        extension = 'xlsx'
+    else:
+        response = StreamingHttpResponse(write_csv(header, rows), content_type='text/csv')
+        extension = 'csv'
+    response['Content-Disposition'] = f'attachment; filename="{name}_{date.today().isoformat()}.{extension}"'
+    return response
+
+
+@login_required
+@manager_required
+def export_approved_leaves_view(request):
+    """
+    Download every approved leave matching the filters as CSV or XLSX.
+
+    Rows are read in chunks and streamed, so memory use does not grow with the export size.
+    """
+    return _stream_report(request, 'approved_leaves', APPROVED_LEAVE_HEADER,
+                          lambda filters: approved_leaves(**filters), approved_leave_row)
+
+
+@login_required
+@manager_required
+def export_department_summary_view(request):
+    """Download the department-wise approved leave counts as CSV or XLSX."""
+    return _stream_report(request, 'department_summary', DEPARTMENT_SUMMARY_HEADER,
+                          lambda filters: department_summary(**filters), department_summary_row)
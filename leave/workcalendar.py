@@ -0,0 +1,151 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from .models import Holiday
+from .versions import HOLIDAYS_VERSION, get_versions
+
+# Days of the week that are never working days (Monday is 0, Sunday is 6).
+WEEKEND_DAYS = (6,)
+
+WEEKEND = 1
+HOLIDAY = 2
+
+
+class YearCalendar:
+    """
+    Compiled working-day calendar for a single year.
+
+    Attributes:
+        year (int): Calendar year.
+        flags (bytearray): One byte per day; WEEKEND and HOLIDAY bits mark non-working days.
+        cumulative (array): ``cumulative[i]`` is the number of working days before day ``i``.
+        holiday_dates (list): Sorted holiday dates in the year.
+        holiday_names (list): Holiday names, parallel to ``holiday_dates``.
+    """
+
+    def __init__(self, year, holidays):
+        self.year = year
+        self.first_day = date(year, 1, 1)
+        length = (date(year + 1, 1, 1) - self.first_day).days
+
+        self.flags = bytearray(length)
+        for i in range(length):
+            if (self.first_day + timedelta(days=i)).weekday() in WEEKEND_DAYS:
+                self.flags[i] |= WEEKEND
+
+        self.holiday_dates = sorted(holidays)
+        self.holiday_names = [holidays[day] for day in self.holiday_dates]
+        for day in self.holiday_dates:
+            self.flags[(day - self.first_day).days] |= HOLIDAY
+
+        self.cumulative = array('H', [0]) * (length + 1)
+        for i, flag in enumerate(self.flags):
+            self.cumulative[i + 1] = self.cumulative[i] + (0 if flag else 1)
+
+    def count(self, start, end):
+        """Number of working days in ``[start, end]``; both dates must be in this year."""
+        return self.cumulative[(end - self.first_day).days + 1] - self.cumulative[(start - self.first_day).days]
+
+    def holidays(self, start, end):
+        """List of ``(date, name)`` holidays in ``[start, end]``."""
+        lo = bisect_left(self.holiday_dates, start)
+        hi = bisect_right(self.holiday_dates, end)
+        return list(zip(self.holiday_dates[lo:hi], self.holiday_names[lo:hi]))
+
+
+class WorkingDayCalendar:
+    """
+    Working-day lookups over any date range, backed by per-year YearCalendars.
+
+    Years are compiled on first use with a single Holiday query covering every
+    missing year in the requested range; after that, counts are O(1) per year
+    spanned and listings are O(k) in the number of matching days.
+    """
+
+    def __init__(self):
+        self.years = {}
+
+    def _years(self, start, end):
+        missing = [year for year in range(start.year, end.year + 1) if year not in self.years]
+        if missing:
+            holidays = {year: {} for year in missing}
+            rows = Holiday.objects.filter(
+                date__range=[date(missing[0], 1, 1), date(missing[-1], 12, 31)]
+            ).values_list('date', 'name')
+            for day, name in rows:
+                if day.year in holidays:
+                    holidays[day.year][day] = name
+            for year in missing:
+                self.years[year] = YearCalendar(year, holidays[year])
+        return [self.years[year] for year in range(start.year, end.year + 1)]
+
+    def _spans(self, start, end):
+        """Yield ``(YearCalendar, start, end)`` slices of the range, one per year."""
+        if start > end:
+            return
+        for calendar in self._years(start, end):
+            yield calendar, max(start, calendar.first_day), min(end, date(calendar.year, 12, 31))
+
+    def count_working_days(self, start, end):
+        """Number of working days between start and end, inclusive."""
+        return sum(calendar.count(lo, hi) for calendar, lo, hi in self._spans(start, end))
+
+    def working_days(self, start, end):
+        """List of working dates between start and end, inclusive."""
+        days = []
+        for calendar, lo, hi in self._spans(start, end):
+            offset = (lo - calendar.first_day).days
+            for i in range((hi - lo).days + 1):
+                if not calendar.flags[offset + i]:
+                    days.append(lo + timedelta(days=i))
+        return days
+
+    def holidays(self, start, end):
+        """List of ``(date, name)`` holidays between start and end, inclusive."""
+        found = []
+        for calendar, lo, hi in self._spans(start, end):
+            found.extend(calendar.holidays(lo, hi))
+        return found
+
+    @staticmethod
+    def weekend_days(start, end):
+        """List of weekend dates between start and end, inclusive; needs no lookup."""
+        days = []
+        for weekday in WEEKEND_DAYS:
+            day = start + timedelta(days=(weekday - start.weekday()) % 7)
+            while day <= end:
+                days.append(day)
+                day += timedelta(days=7)
+        return sorted(days)
+
+
+_calendar = None
+_calendar_stamp = None
+_calendar_lock = threading.Lock()
+
+
+def get_working_day_calendar():
+    """
+    Return the process-wide WorkingDayCalendar, creating an empty one if needed.
+
+    The calendar is also replaced when the shared Holiday version stamp moved,
+    i.e. after a change made by another process; checking it costs one cache
+    read and no query.
+    """
+    global _calendar, _calendar_stamp
+    stamp, = get_versions(HOLIDAYS_VERSION)
+    calendar = _calendar
+    if calendar is None or _calendar_stamp != stamp:
+        with _calendar_lock:
+            if _calendar is None or _calendar_stamp != stamp:
+                _calendar, _calendar_stamp = WorkingDayCalendar(), stamp
+            calendar = _calendar
+    return calendar
+
+
+def invalidate_working_day_calendar():
+    """Drop every compiled year so the next lookup rebuilds from Holiday."""
+    global _calendar
+    with _calendar_lock:
+        _calendar = None
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'leave.middleware.PerfStatsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -144,3 +145,65 @@ AUTH_USER_MODEL = 'leave.User'
 
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Leave accrual: apply each LeaveType's accrual rule when balances are read,
+# so the auto_credit_leave batch job is optional and a missed run loses nothing.
+LEAVE_ACCRUAL_ON_READ = os.getenv('LEAVE_ACCRUAL_ON_READ', 'True') == 'True'
+
+# Per-request SQL and latency instrumentation (Server-Timing headers and
+# `manage.py perfstats`). Off by default; the middleware unloads itself.
+LEAVE_PERF_STATS = os.getenv('LEAVE_PERF_STATS', 'False') == 'True'
+LEAVE_PERF_STATS_WINDOW = 1000
+LEAVE_PERF_STATS_FLUSH_EVERY = 100
+LEAVE_PERF_STATS_DIR = BASE_DIR / '.perfstats'
+# Worker snapshots not rewritten for this many seconds are dropped.
+LEAVE_PERF_STATS_MAX_AGE = 24 * 3600
+
+# Leave history PDF exports are rendered by `manage.py run_export_worker` and
+# cached here. Set LEAVE_EXPORT_RUN_INLINE to render in the request instead
+# (e.g. for local development without a worker).
+LEAVE_EXPORT_ROOT = BASE_DIR / 'exports'
+LEAVE_EXPORT_RUN_INLINE = os.getenv('LEAVE_EXPORT_RUN_INLINE', 'False') == 'True'
+# A job still 'Running' this many seconds after a worker claimed it is taken to
+# belong to a crashed worker and is queued again. Finished jobs are deleted
+# after LEAVE_EXPORT_RETENTION_DAYS.
+LEAVE_EXPORT_CLAIM_TIMEOUT = int(os.getenv('LEAVE_EXPORT_CLAIM_TIMEOUT', '600'))
+LEAVE_EXPORT_RETENTION_DAYS = int(os.getenv('LEAVE_EXPORT_RETENTION_DAYS', '7'))
+
+# Serve the leave history and reports pages with their async views, whose
+# independent queries run concurrently. Turn on when running under an ASGI
+# worker (see docker-compose.yml); under WSGI the sync views are cheaper. The
+# report exports then stream from async iterators, which ASGI sends without buffering.
+LEAVE_ASYNC_VIEWS = os.getenv('LEAVE_ASYNC_VIEWS', 'False') == 'True'
+
+# Cache for the version-keyed page fragments (see leave/versions.py).
+# LEAVE_CACHE_BACKEND is 'locmem' (per process), 'file' (shared by the
+# processes on one host) or 'redis' (any Redis-compatible server, e.g. the
+# Valkey service in docker-compose.yml). Use 'file' or 'redis' when running
+# several worker processes, so a write in one is seen by all of them;
+# docker-compose.yml sets 'redis' on every service.
+LEAVE_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'leave-management'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / '.cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://localhost:6379/0'),
+}
+_cache_backend, _cache_location = LEAVE_CACHE_BACKENDS[os.getenv('LEAVE_CACHE_BACKEND', 'locmem')]
+CACHES = {
+    'default': {
+        'BACKEND': _cache_backend,
+        'LOCATION': os.getenv('LEAVE_CACHE_LOCATION', _cache_location),
+    }
+}
+LEAVE_FRAGMENT_CACHE_TIMEOUT = int(os.getenv('LEAVE_FRAGMENT_CACHE_TIMEOUT', '3600'))
+
+# Email. Notifications are queued in the outbox and sent by
+# `manage.py deliver_notifications`; the console backend prints them instead.
+# For a local debugging SMTP server use EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend
+# with EMAIL_HOST=localhost and EMAIL_PORT=1025.
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'False') == 'True'
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'leave@example.com')